@@ -23,6 +23,7 @@ class RetrieveFileResponseHandler(BaseHandler):
                 "conn_id": context.connection_record.connection_id,
                 "status": context.message.status,
                 "filename": context.message.filename,
+                "size": len(context.message.data or "") * 3 // 4,
                 # "data": context.message.data
             },
         )
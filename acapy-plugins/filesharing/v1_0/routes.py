@@ -43,6 +43,7 @@ async def retrieve_file(request: web.BaseRequest):
 
     msg = RetrieveFile(filename=filename)
     req_time = time.perf_counter()
+    req_cpu_time = time.process_time()
     await outbound_handler(msg, connection_id=connection_id)
 
     event_bus = context.inject(EventBus)
@@ -56,6 +57,13 @@ async def retrieve_file(request: web.BaseRequest):
             rsp_time = time.perf_counter()
             msg = "BM(file): {};{};{};{}".format(filename, req_time, rsp_time, rsp_time-req_time)
             await event_bus.notify(context.profile, Event("acapy::webhook::retrievefile_metrics", msg))
+
+            size = event.payload.get("size")
+            if size:
+                rsp_cpu_time = time.process_time()
+                cpu_per_mb = (rsp_cpu_time - req_cpu_time) / (size / 1000000)
+                msg = "BM(filecpu): {};{};{};{}".format(filename, req_cpu_time, rsp_cpu_time, cpu_per_mb)
+                await event_bus.notify(context.profile, Event("acapy::webhook::retrievefile_metrics", msg))
             
             # try:
             #     file_content = base64.b64decode(event.payload["data"])
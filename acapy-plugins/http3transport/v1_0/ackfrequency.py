@@ -0,0 +1,226 @@
+"""QUIC acknowledgement frequency extension (draft-ietf-quic-ack-frequency).
+
+A receiver acknowledges at least once per millisecond of received data, and
+every acknowledgement is a packet built and encrypted in Python. When both
+peers advertise the min_ack_delay transport parameter, the data sender asks the
+receiver in an ACK_FREQUENCY frame to acknowledge only every few packets, or
+once the requested delay has passed. The sender picks a threshold of a quarter
+of its congestion window, so acknowledgements still arrive several times per
+round trip, and a delay of a quarter of the round trip time, and widens the
+probe timeout by the requested delay.
+
+Immediate acknowledgement of reordered packets is not implemented, aioquic does
+not do it either.
+"""
+
+import logging
+from typing import Optional, Tuple
+
+from aioquic import tls
+from aioquic.buffer import Buffer, BufferReadError, UINT_VAR_MAX_SIZE
+from aioquic.quic.congestion.base import K_GRANULARITY
+from aioquic.quic.connection import EPOCHS, QuicConnection, QuicReceiveContext
+from aioquic.quic.packet_builder import QuicDeliveryState, QuicPacketBuilder
+from aioquic.quic.recovery import QuicPacketSpace
+
+LOGGER = logging.getLogger(__name__)
+
+MIN_ACK_DELAY_PARAMETER = 0xFF04DE1B
+ACK_FREQUENCY_FRAME = 0xAF
+IMMEDIATE_ACK_FRAME = 0x1F
+ACK_FREQUENCY_FRAME_CAPACITY = 2 + 4 * UINT_VAR_MAX_SIZE
+
+# the smallest delay our ACK timer can honour, in microseconds
+MIN_ACK_DELAY = int(K_GRANULARITY * 1000000)
+
+
+def pull_min_ack_delay(data: bytes) -> Optional[int]:
+    """Return the min_ack_delay transport parameter in `data`, if present."""
+    buf = Buffer(data=data)
+    try:
+        while not buf.eof():
+            param_id = buf.pull_uint_var()
+            param_len = buf.pull_uint_var()
+            if param_id == MIN_ACK_DELAY_PARAMETER:
+                return buf.pull_uint_var()
+            buf.seek(buf.tell() + param_len)
+    except (BufferReadError, ValueError):
+        pass
+    return None
+
+
+class AckFrequency:
+    """Negotiates and applies acknowledgement frequency for `quic`.
+
+    `max_threshold` bounds the ack-eliciting packets the peer may receive
+    without acknowledging them, and `max_ack_delay` the delay it is asked for,
+    in seconds.
+    """
+
+    def __init__(
+        self, quic: QuicConnection, max_threshold: int, max_ack_delay: float
+    ) -> None:
+        """Initialize an `AckFrequency` instance."""
+        self._quic = quic
+        self.max_threshold = max_threshold
+        self.max_ack_delay = max(max_ack_delay, K_GRANULARITY)
+        self.peer_min_ack_delay: Optional[int] = None
+
+        # sending side: last requested (threshold, delay) and its sequence number
+        self._requested: Optional[Tuple[int, int]] = None
+        self._request_sequence = -1
+        self._request_pending = False
+        # receiving side, aioquic's ACK timer alone applies until asked otherwise
+        self._received_sequence = -1
+        self._threshold: Optional[int] = None
+        self._unacknowledged = 0
+        self.requests_received = 0
+
+        self._serialize_transport_parameters = quic._serialize_transport_parameters
+        self._parse_transport_parameters = quic._parse_transport_parameters
+        self._payload_received = quic._payload_received
+        self._write_ack_frame = quic._write_ack_frame
+        self._write_connection_limits = quic._write_connection_limits
+        quic._serialize_transport_parameters = self.serialize_transport_parameters
+        quic._parse_transport_parameters = self.parse_transport_parameters
+        quic._payload_received = self.payload_received
+        quic._write_ack_frame = self.write_ack_frame
+        quic._write_connection_limits = self.write_connection_limits
+
+        frame_handlers = quic._QuicConnection__frame_handlers
+        frame_handlers[ACK_FREQUENCY_FRAME] = (
+            self._handle_ack_frequency_frame,
+            EPOCHS("01"),
+        )
+        frame_handlers[IMMEDIATE_ACK_FRAME] = (
+            self._handle_immediate_ack_frame,
+            EPOCHS("01"),
+        )
+
+    @property
+    def negotiated(self) -> bool:
+        """Whether the peer supports the ACK frequency extension."""
+        return self.peer_min_ack_delay is not None
+
+    def serialize_transport_parameters(self) -> bytes:
+        """Add the min_ack_delay transport parameter to our parameters."""
+        value = Buffer(capacity=UINT_VAR_MAX_SIZE)
+        value.push_uint_var(MIN_ACK_DELAY)
+        buf = Buffer(capacity=3 * UINT_VAR_MAX_SIZE)
+        buf.push_uint_var(MIN_ACK_DELAY_PARAMETER)
+        buf.push_uint_var(value.tell())
+        buf.push_bytes(value.data)
+        return self._serialize_transport_parameters() + buf.data
+
+    def parse_transport_parameters(
+        self, data: bytes, from_session_ticket: bool = False
+    ) -> None:
+        """Parse the peer's transport parameters, including min_ack_delay."""
+        self._parse_transport_parameters(data, from_session_ticket)
+        if not from_session_ticket:
+            self.peer_min_ack_delay = pull_min_ack_delay(data)
+
+    def payload_received(
+        self, context: QuicReceiveContext, plain: bytes, crypto_frame_required: bool
+    ) -> Tuple[bool, bool]:
+        """Acknowledge at once when more packets than the threshold are unacked."""
+        is_ack_eliciting, is_probing = self._payload_received(
+            context, plain, crypto_frame_required
+        )
+        if (
+            is_ack_eliciting
+            and context.epoch == tls.Epoch.ONE_RTT
+            and self._threshold is not None
+        ):
+            self._unacknowledged += 1
+            if self._unacknowledged > self._threshold:
+                self._acknowledge_now(context.time)
+        return is_ack_eliciting, is_probing
+
+    def write_ack_frame(
+        self, builder: QuicPacketBuilder, space: QuicPacketSpace, now: float
+    ) -> None:
+        """Reset the count of unacknowledged packets after an ACK frame."""
+        self._write_ack_frame(builder, space, now)
+        if space is self._quic._spaces.get(tls.Epoch.ONE_RTT):
+            self._unacknowledged = 0
+
+    def write_connection_limits(
+        self, builder: QuicPacketBuilder, space: QuicPacketSpace
+    ) -> None:
+        """Also send a pending ACK_FREQUENCY frame."""
+        self._write_connection_limits(builder, space)
+        if not self.negotiated:
+            return
+        self._update_request()
+        if self._request_pending:
+            threshold, ack_delay = self._requested
+            buf = builder.start_frame(
+                ACK_FREQUENCY_FRAME,
+                capacity=ACK_FREQUENCY_FRAME_CAPACITY,
+                handler=self._on_ack_frequency_delivery,
+                handler_args=(self._request_sequence,),
+            )
+            buf.push_uint_var(self._request_sequence)
+            buf.push_uint_var(threshold)
+            buf.push_uint_var(ack_delay)
+            # acknowledge reordered packets right away, as loss detection expects
+            buf.push_uint_var(1)
+            self._request_pending = False
+
+    def _update_request(self) -> None:
+        quic = self._quic
+        loss = quic._loss
+        cwnd_packets = loss.congestion_window // quic._max_datagram_size
+        threshold = max(1, min(self.max_threshold, cwnd_packets // 4 - 1))
+        rtt = loss._rtt_smoothed if loss._rtt_initialized else 0.0
+        ack_delay = int(max(min(rtt, self.max_ack_delay), K_GRANULARITY) * 1000000)
+        ack_delay = max(ack_delay, self.peer_min_ack_delay)
+
+        if self._requested is not None:
+            # only ask again when either value is off by a factor of two
+            last_threshold, last_delay = self._requested
+            if (
+                last_threshold // 2 <= threshold <= last_threshold * 2
+                and last_delay // 2 <= ack_delay <= last_delay * 2
+            ):
+                return
+        self._requested = (threshold, ack_delay)
+        self._request_sequence += 1
+        self._request_pending = True
+        # the peer may now hold back acknowledgements for that long
+        loss.max_ack_delay = max(loss.max_ack_delay, ack_delay / 1000000)
+        LOGGER.debug(
+            "Requesting acknowledgement every %d packets or %d us",
+            threshold + 1,
+            ack_delay,
+        )
+
+    def _on_ack_frequency_delivery(
+        self, delivery: QuicDeliveryState, sequence: int
+    ) -> None:
+        if delivery != QuicDeliveryState.ACKED and sequence == self._request_sequence:
+            self._request_pending = True
+
+    def _handle_ack_frequency_frame(
+        self, context: QuicReceiveContext, frame_type: int, buf: Buffer
+    ) -> None:
+        sequence = buf.pull_uint_var()
+        threshold = buf.pull_uint_var()
+        ack_delay = buf.pull_uint_var()
+        buf.pull_uint_var()  # reordering threshold
+        if sequence <= self._received_sequence:
+            return
+        self._received_sequence = sequence
+        self._threshold = threshold
+        self._quic._ack_delay = max(ack_delay, MIN_ACK_DELAY) / 1000000
+        self.requests_received += 1
+
+    def _handle_immediate_ack_frame(
+        self, context: QuicReceiveContext, frame_type: int, buf: Buffer
+    ) -> None:
+        self._acknowledge_now(context.time)
+
+    def _acknowledge_now(self, now: float) -> None:
+        space = self._quic._spaces[tls.Epoch.ONE_RTT]
+        space.ack_at = now
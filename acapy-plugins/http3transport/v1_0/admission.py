@@ -0,0 +1,195 @@
+"""Admission control for inbound requests.
+
+Every request stream used to start its handler right away, and aioquic doubles
+the stream credit (MAX_STREAMS) it grants a client whenever half of it is used.
+A burst of requests therefore started as many unpack and protocol handler tasks
+at once, all competing for the event loop.
+
+Here a connection grants its client credit for `max_streams` requests in
+progress, and is only granted more as requests complete. The requests of all
+connections then wait in a shared queue, which runs at most `max_active` of
+them at a time. While `max_queued` requests are waiting, connections do not
+grant further credit at all, so the queue holds at most that many requests plus
+the credit already granted, and clients hold back new requests rather than the
+server falling behind.
+"""
+
+import asyncio
+import logging
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict
+
+from aioquic.quic.connection import (
+    CONNECTION_LIMIT_FRAME_CAPACITY,
+    Limit,
+    QuicConnection,
+)
+from aioquic.quic.packet_builder import QuicPacketBuilder
+from aioquic.quic.recovery import QuicPacketSpace
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AdmissionStats:
+    """Counters describing how requests were admitted."""
+
+    def __init__(self) -> None:
+        """Initialize an `AdmissionStats` instance."""
+        self.admitted = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.stalls = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return the counters as a dict."""
+        return dict(vars(self))
+
+
+class AdmissionQueue:
+    """Runs at most `max_active` requests at a time, in order of arrival."""
+
+    def __init__(self, max_active: int, max_queued: int) -> None:
+        """Initialize an `AdmissionQueue` instance."""
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # connections holding back stream credit until the queue drains
+        self._stalled: "weakref.WeakSet[StreamCredit]" = weakref.WeakSet()
+        self.stats = AdmissionStats()
+
+    @property
+    def queued(self) -> int:
+        """The number of requests waiting for a slot."""
+        return len(self._waiters)
+
+    @property
+    def is_full(self) -> bool:
+        """Whether no further requests can be queued."""
+        return len(self._waiters) >= self.max_queued
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free slot and hold it for the duration of one request."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be handled."""
+        self.stats.admitted += 1
+        if self.active < self.max_active:
+            self.active += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats.queued += 1
+        self.stats.peak_queued = max(self.stats.peak_queued, len(self._waiters))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over already, pass it on
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                self._resume()
+            raise
+
+    def release(self) -> None:
+        """Free the slot of a finished request."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # hand the slot over to the next request
+                waiter.set_result(None)
+                break
+        else:
+            self.active -= 1
+        self._resume()
+
+    def stall(self, credit: "StreamCredit") -> None:
+        """Have `credit` resume granting stream credit once the queue drains."""
+        if credit not in self._stalled:
+            self.stats.stalls += 1
+            self._stalled.add(credit)
+
+    def _resume(self) -> None:
+        if self._stalled and not self.is_full:
+            stalled = list(self._stalled)
+            self._stalled.clear()
+            for credit in stalled:
+                credit.resume()
+
+
+class StreamCredit:
+    """Takes over raising the bidirectional MAX_STREAMS limit of `quic`.
+
+    `in_progress` returns the number of requests the connection holds, and
+    `wake` has the connection send, once credit can be granted again after the
+    admission queue drains.
+    """
+
+    def __init__(
+        self,
+        quic: QuicConnection,
+        max_streams: int,
+        in_progress: Callable[[], int],
+        queue: AdmissionQueue,
+        wake: Callable[[], None],
+    ) -> None:
+        """Initialize a `StreamCredit` instance."""
+        self._quic = quic
+        self.max_streams = max_streams
+        self._in_progress = in_progress
+        self._queue = queue
+        self._wake = wake
+
+        # also the initial_max_streams_bidi transport parameter
+        self._limit = quic._local_max_streams_bidi
+        self._limit.value = self._limit.sent = max_streams
+        # stands in for the limit while the other limits are raised, so it is not
+        # doubled there
+        self._placeholder = Limit(
+            frame_type=self._limit.frame_type, name=self._limit.name, value=0
+        )
+
+        self._write_connection_limits = quic._write_connection_limits
+        quic._write_connection_limits = self.write_connection_limits
+
+    def write_connection_limits(
+        self, builder: QuicPacketBuilder, space: QuicPacketSpace
+    ) -> None:
+        """Write the connection limits, holding back MAX_STREAMS while queue is full."""
+        quic = self._quic
+        quic._local_max_streams_bidi = self._placeholder
+        try:
+            self._write_connection_limits(builder, space)
+        finally:
+            quic._local_max_streams_bidi = self._limit
+
+        limit = self._limit
+        value = limit.used - self._in_progress() + self.max_streams
+        if value > limit.value:
+            if self._queue.is_full:
+                self._queue.stall(self)
+            else:
+                limit.value = value
+        if limit.value != limit.sent:
+            buf = builder.start_frame(
+                limit.frame_type,
+                capacity=CONNECTION_LIMIT_FRAME_CAPACITY,
+                handler=quic._on_connection_limit_delivery,
+                handler_args=(limit,),
+            )
+            buf.push_uint_var(limit.value)
+            limit.sent = limit.value
+
+    def resume(self) -> None:
+        """Have the connection send new stream credit."""
+        self._wake()
@@ -2,11 +2,22 @@
 
 import logging
 
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
 from aries_cloudagent.config.base import BaseSettings
 from aries_cloudagent.config.plugin_settings import PluginSettings
 from aries_cloudagent.config.settings import Settings
+from typing import Callable, List, Optional
+
 from pydantic import BaseModel
 
+from .ackfrequency import AckFrequency
+from .admission import AdmissionQueue, StreamCredit
+from .flowcontrol import ReceiveWindowAutotuner
+from .migration import PathValidation
+from .pmtud import PathMtuDiscovery
+from .priority import StreamScheduler
+
 LOGGER = logging.getLogger(__name__)
 
 PLUGIN_KEYS = {"httpxtransport"}
@@ -15,13 +26,128 @@ class HttpxConfig(BaseModel):
 
     force_close: bool = False
     keepalive_timeout: float = 15.0
+    ping_interval: Optional[float] = 10.0
+    limit: int = 200
+    limit_per_host: int = 50
+    max_streams_per_connection: int = 100
+    session_ticket_ttl: float = 3600.0
+    session_ticket_cache_size: int = 256
+    early_data: bool = False
+    session_ticket_store_size: int = 1024
+    session_ticket_file: Optional[str] = None
+    early_data_replay_window: float = 600.0
+    early_data_replay_cache_size: int = 4096
+    dns_ttl: float = 300.0
+    dns_negative_ttl: float = 10.0
+    happy_eyeballs_delay: float = 0.25
+    shared_sockets: int = 0
+    udp_offload: bool = False
+    congestion_control: str = "reno"
+    max_data: int = 1048576
+    max_stream_data: int = 1048576
+    idle_timeout: float = 60.0
+    initial_rtt: float = 0.1
+    max_datagram_size: int = 1200
+    max_datagram_frame_size: Optional[int] = 65536
+    qpack_max_table_capacity: int = 4096
+    qpack_blocked_streams: int = 16
+    receive_window_autotuning: bool = False
+    max_receive_window: int = 25165824
+    max_stream_receive_window: int = 16777216
+    path_mtu_discovery: bool = False
+    max_path_mtu: int = 1452
+    connection_migration: bool = False
+    migration_check_interval: float = 1.0
+    multipath: bool = False
+    multipath_addresses: List[str] = []
+    multipath_probe_interval: float = 1.0
+    multipath_probe_timeout: float = 3.0
+    multipath_reconnect_interval: float = 5.0
+    datagram_delivery: bool = False
+    datagram_max_message_size: int = 1200
+    duplex: bool = False
+    duplex_verify_address: bool = True
+    stream_priorities: bool = False
+    bulk_message_size: int = 65536
+    bulk_message_urgency: int = 5
+    transmit_coalescing: bool = False
+    coalescing_window: float = 0.0
+    coalescing_max_bytes: int = 16384
+    ack_frequency: bool = False
+    ack_frequency_max_threshold: int = 32
+    ack_frequency_max_delay: float = 0.025
+    direct_message_path: bool = False
+    max_preallocated_size: int = 16777216
+    admission_control: bool = False
+    max_active_requests: int = 32
+    max_queued_requests: int = 128
+    max_requests_per_connection: int = 32
+    # experimental, see sharding
+    inbound_workers: int = 0
 
     @classmethod
     def default(cls):
         """Return default configuration."""
         return cls(
             force_close=False,
-            keepalive_timeout=15.0
+            keepalive_timeout=15.0,
+            ping_interval=10.0,
+            limit=200,
+            limit_per_host=50,
+            max_streams_per_connection=100,
+            session_ticket_ttl=3600.0,
+            session_ticket_cache_size=256,
+            early_data=False,
+            session_ticket_store_size=1024,
+            session_ticket_file=None,
+            early_data_replay_window=600.0,
+            early_data_replay_cache_size=4096,
+            dns_ttl=300.0,
+            dns_negative_ttl=10.0,
+            happy_eyeballs_delay=0.25,
+            shared_sockets=0,
+            udp_offload=False,
+            congestion_control="reno",
+            max_data=1048576,
+            max_stream_data=1048576,
+            idle_timeout=60.0,
+            initial_rtt=0.1,
+            max_datagram_size=1200,
+            max_datagram_frame_size=65536,
+            qpack_max_table_capacity=4096,
+            qpack_blocked_streams=16,
+            receive_window_autotuning=False,
+            max_receive_window=25165824,
+            max_stream_receive_window=16777216,
+            path_mtu_discovery=False,
+            max_path_mtu=1452,
+            connection_migration=False,
+            migration_check_interval=1.0,
+            multipath=False,
+            multipath_addresses=[],
+            multipath_probe_interval=1.0,
+            multipath_probe_timeout=3.0,
+            multipath_reconnect_interval=5.0,
+            datagram_delivery=False,
+            datagram_max_message_size=1200,
+            duplex=False,
+            duplex_verify_address=True,
+            stream_priorities=False,
+            bulk_message_size=65536,
+            bulk_message_urgency=5,
+            transmit_coalescing=False,
+            coalescing_window=0.0,
+            coalescing_max_bytes=16384,
+            ack_frequency=False,
+            ack_frequency_max_threshold=32,
+            ack_frequency_max_delay=0.025,
+            direct_message_path=False,
+            max_preallocated_size=16777216,
+            admission_control=False,
+            max_active_requests=32,
+            max_queued_requests=128,
+            max_requests_per_connection=32,
+            inbound_workers=0
         )
 
 
@@ -41,4 +167,103 @@ def get_config(root_settings: BaseSettings) -> HttpxConfig:
         LOGGER.warning("Using default configuration")
         config = HttpxConfig.default()
 
-    return config
\ No newline at end of file
+    check_config(config)
+    return config
+
+
+def check_config(config: HttpxConfig) -> None:
+    """Raise ValueError if settings of `config` contradict each other."""
+    if config.ping_interval and (
+        config.ping_interval >= config.keepalive_timeout
+        or config.ping_interval >= config.idle_timeout
+    ):
+        # idle connections would be closed before they are ever pinged
+        raise ValueError(
+            "ping_interval must be shorter than keepalive_timeout and idle_timeout"
+        )
+
+
+def create_quic_configuration(config: HttpxConfig, **kwargs) -> QuicConfiguration:
+    """Return a QUIC configuration with the transport parameters from `config`."""
+    return QuicConfiguration(
+        congestion_control_algorithm=config.congestion_control,
+        max_data=config.max_data,
+        max_stream_data=config.max_stream_data,
+        idle_timeout=config.idle_timeout,
+        initial_rtt=config.initial_rtt,
+        max_datagram_size=config.max_datagram_size,
+        max_datagram_frame_size=config.max_datagram_frame_size,
+        **kwargs,
+    )
+
+
+def autotune_receive_windows(config: HttpxConfig, quic: QuicConnection) -> None:
+    """Install receive window autotuning on `quic`, if enabled in `config`."""
+    if config.receive_window_autotuning:
+        ReceiveWindowAutotuner(
+            quic,
+            max_data=config.max_receive_window,
+            max_stream_data=config.max_stream_receive_window,
+        )
+
+
+def discover_path_mtu(config: HttpxConfig, quic: QuicConnection) -> None:
+    """Install path MTU discovery on `quic`, if enabled in `config`."""
+    if config.path_mtu_discovery:
+        PathMtuDiscovery(quic, max_datagram_size=config.max_path_mtu)
+
+
+def reduce_ack_frequency(config: HttpxConfig, quic: QuicConnection) -> None:
+    """Install the ACK frequency extension on `quic`, if enabled in `config`.
+
+    Must be installed after receive window autotuning.
+    """
+    if config.ack_frequency:
+        AckFrequency(
+            quic,
+            max_threshold=config.ack_frequency_max_threshold,
+            max_ack_delay=config.ack_frequency_max_delay,
+        )
+
+
+def validate_migrated_paths(config: HttpxConfig, quic: QuicConnection) -> None:
+    """Install path validation retransmission on `quic`, if enabled in `config`."""
+    if config.connection_migration:
+        PathValidation(quic)
+
+
+def prioritize_streams(
+    config: HttpxConfig, quic: QuicConnection
+) -> Optional[StreamScheduler]:
+    """Install priority scheduling on `quic`, if enabled in `config`."""
+    if config.stream_priorities:
+        return StreamScheduler(quic)
+    return None
+
+
+def create_admission_queue(config: HttpxConfig) -> Optional[AdmissionQueue]:
+    """Create the queue shared by all inbound connections, if enabled in `config`."""
+    if config.admission_control:
+        return AdmissionQueue(
+            max_active=config.max_active_requests,
+            max_queued=config.max_queued_requests,
+        )
+    return None
+
+
+def limit_stream_credit(
+    config: HttpxConfig,
+    quic: QuicConnection,
+    queue: Optional[AdmissionQueue],
+    in_progress: Callable[[], int],
+    wake: Callable[[], None],
+) -> None:
+    """Grant stream credit on `quic` as requests complete, if `queue` is set."""
+    if queue is not None:
+        StreamCredit(
+            quic,
+            max_streams=config.max_requests_per_connection,
+            in_progress=in_progress,
+            queue=queue,
+            wake=wake,
+        )
@@ -0,0 +1,256 @@
+"""Model-based congestion control for QUIC connections.
+
+aioquic ships the loss-based Reno and CUBIC controllers, which halve their window
+on every loss event and therefore collapse on links with random packet loss.
+This module registers a BBR-style controller as "bbr", which sizes the window
+from an estimate of the bottleneck bandwidth and the minimum round-trip time and
+does not treat loss as a congestion signal.
+
+aioquic paces at congestion_window / smoothed_rtt, so the pacing gains of the
+BBR state machine are applied to the window rather than to a separate pacing
+rate.
+"""
+
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+from aioquic.quic.congestion.base import (
+    K_INITIAL_WINDOW,
+    QuicCongestionControl,
+    register_congestion_control,
+)
+from aioquic.quic.packet_builder import QuicSentPacket
+
+# gain to double the sending rate every round trip (2 / ln 2)
+K_HIGH_GAIN = 2.885
+K_CWND_GAIN = 2.0
+K_PROBE_BW_GAINS = (1.25, 0.75, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+# bandwidth filter length in round trips
+K_BW_WINDOW = 10
+# startup ends once bandwidth grows less than 25% over three round trips
+K_STARTUP_GROWTH = 1.25
+K_STARTUP_ROUNDS = 3
+
+K_MIN_RTT_WINDOW = 10.0
+K_PROBE_RTT_DURATION = 0.2
+K_MINIMUM_WINDOW = 4
+
+
+class BbrState(Enum):
+    """Phases of the BBR state machine."""
+    STARTUP = 0
+    DRAIN = 1
+    PROBE_BW = 2
+    PROBE_RTT = 3
+
+
+class BbrCongestionControl(QuicCongestionControl):
+    """BBR congestion control.
+
+    Bandwidth is sampled from the delivery rate of acknowledged packets and the
+    maximum over the last ten round trips is used as the bottleneck bandwidth.
+    Samples taken while the application did not fill the window only ever raise
+    the estimate.
+    """
+
+    def __init__(self, *, max_datagram_size: int) -> None:
+        """Initialize a `BbrCongestionControl` instance."""
+        super().__init__(max_datagram_size=max_datagram_size)
+        self._max_datagram_size = max_datagram_size
+        self._min_window = K_MINIMUM_WINDOW * max_datagram_size
+
+        self.state = BbrState.STARTUP
+        self._gain = K_HIGH_GAIN
+
+        # delivery rate sampling, per packet in flight:
+        # (delivered, delivered time, app limited)
+        self._delivered = 0
+        self._delivered_time: Optional[float] = None
+        self._packets: Dict[int, Tuple[int, Optional[float], bool]] = {}
+
+        # round trip counting
+        self._round_count = 0
+        self._next_round_delivered = 0
+
+        # windowed max filter of (round, bandwidth in bytes per second)
+        self._bw_samples: Deque[Tuple[int, float]] = deque()
+        self.btl_bw = 0.0
+
+        self.min_rtt: Optional[float] = None
+        self._min_rtt_stamp = 0.0
+        self._probe_rtt_done: Optional[float] = None
+
+        self._full_bw = 0.0
+        self._full_bw_rounds = 0
+        self._filled_pipe = False
+
+        self._cycle_index = 0
+        self._cycle_stamp = 0.0
+
+    @property
+    def bdp(self) -> Optional[int]:
+        """The estimated bandwidth-delay product in bytes, once measured."""
+        if not self.btl_bw or self.min_rtt is None:
+            return None
+        return int(self.btl_bw * self.min_rtt)
+
+    def on_packet_acked(self, *, now: float, packet: QuicSentPacket) -> None:
+        """Update the delivery rate estimate from an acknowledged packet."""
+        self.bytes_in_flight -= packet.sent_bytes
+        self._delivered += packet.sent_bytes
+        self._delivered_time = now
+
+        entry = self._packets.pop(id(packet), None)
+        if entry is None:
+            return
+        delivered, delivered_time, app_limited = entry
+
+        if delivered >= self._next_round_delivered:
+            self._next_round_delivered = self._delivered
+            self._round_count += 1
+            self._check_full_pipe(app_limited)
+
+        if delivered_time is not None and now > delivered_time:
+            rate = (self._delivered - delivered) / (now - delivered_time)
+            if not app_limited or rate > self.btl_bw:
+                self._update_bw(rate)
+
+        self._update_state(now)
+        self._update_window(packet.sent_bytes)
+
+    def on_packet_sent(self, *, packet: QuicSentPacket) -> None:
+        """Record the delivery state at the time `packet` is sent."""
+        if self._delivered_time is None:
+            self._delivered_time = packet.sent_time
+        app_limited = self.bytes_in_flight < self.congestion_window // 2
+        self._packets[id(packet)] = (
+            self._delivered,
+            self._delivered_time,
+            app_limited,
+        )
+        self.bytes_in_flight += packet.sent_bytes
+
+    def on_packets_expired(self, *, packets: Iterable[QuicSentPacket]) -> None:
+        """Stop tracking packets that will never be acknowledged."""
+        for packet in packets:
+            self.bytes_in_flight -= packet.sent_bytes
+            self._packets.pop(id(packet), None)
+
+    def on_packets_lost(self, *, now: float, packets: Iterable[QuicSentPacket]) -> None:
+        """Stop tracking lost packets, without shrinking the window."""
+        # loss is not a congestion signal, the model only shrinks the window
+        # once the delivery rate drops
+        for packet in packets:
+            self.bytes_in_flight -= packet.sent_bytes
+            self._packets.pop(id(packet), None)
+
+    def on_rtt_measurement(self, *, now: float, rtt: float) -> None:
+        """Update the minimum round-trip time."""
+        if (
+            self.min_rtt is None
+            or rtt <= self.min_rtt
+            or now - self._min_rtt_stamp > K_MIN_RTT_WINDOW
+        ):
+            self.min_rtt = rtt
+            self._min_rtt_stamp = now
+
+    def get_log_data(self) -> Dict[str, Any]:
+        """Return the state of the model for the QUIC logger."""
+        data = super().get_log_data()
+        data["bbr_state"] = self.state.name
+        data["btl_bw"] = int(self.btl_bw)
+        if self.min_rtt is not None:
+            data["min_rtt"] = int(self.min_rtt * 1000)
+        return data
+
+    def _update_bw(self, rate: float) -> None:
+        while self._bw_samples and self._bw_samples[-1][1] <= rate:
+            self._bw_samples.pop()
+        self._bw_samples.append((self._round_count, rate))
+        while self._bw_samples[0][0] <= self._round_count - K_BW_WINDOW:
+            self._bw_samples.popleft()
+        self.btl_bw = self._bw_samples[0][1]
+
+    def _check_full_pipe(self, app_limited: bool) -> None:
+        if self._filled_pipe or app_limited:
+            return
+        if self.btl_bw >= self._full_bw * K_STARTUP_GROWTH:
+            self._full_bw = self.btl_bw
+            self._full_bw_rounds = 0
+            return
+        self._full_bw_rounds += 1
+        if self._full_bw_rounds >= K_STARTUP_ROUNDS:
+            self._filled_pipe = True
+
+    def _update_state(self, now: float) -> None:
+        bdp = self.bdp
+
+        if self.state == BbrState.STARTUP and self._filled_pipe:
+            self.state = BbrState.DRAIN
+            self._gain = 1 / K_HIGH_GAIN
+        if self.state == BbrState.DRAIN and (
+            bdp is None or self.bytes_in_flight <= bdp
+        ):
+            self._enter_probe_bw(now)
+        elif (
+            self.state == BbrState.PROBE_BW
+            and self.min_rtt is not None
+            and now - self._cycle_stamp > self.min_rtt
+        ):
+            self._cycle_index = (self._cycle_index + 1) % len(K_PROBE_BW_GAINS)
+            self._cycle_stamp = now
+            self._gain = K_PROBE_BW_GAINS[self._cycle_index]
+
+        # periodically drain the queue to measure the minimum round-trip time
+        if (
+            self.state != BbrState.PROBE_RTT
+            and self.min_rtt is not None
+            and now - self._min_rtt_stamp > K_MIN_RTT_WINDOW
+        ):
+            self.state = BbrState.PROBE_RTT
+            self._gain = 1.0
+            self._probe_rtt_done = None
+        if self.state == BbrState.PROBE_RTT:
+            if self._probe_rtt_done is None:
+                if self.bytes_in_flight <= self._min_window:
+                    self._probe_rtt_done = now + K_PROBE_RTT_DURATION
+            elif now >= self._probe_rtt_done:
+                self._min_rtt_stamp = now
+                if self._filled_pipe:
+                    self._enter_probe_bw(now)
+                else:
+                    self.state = BbrState.STARTUP
+                    self._gain = K_HIGH_GAIN
+
+    def _enter_probe_bw(self, now: float) -> None:
+        self.state = BbrState.PROBE_BW
+        # start in a cruising phase rather than probing straight away
+        self._cycle_index = 2
+        self._cycle_stamp = now
+        self._gain = K_PROBE_BW_GAINS[self._cycle_index]
+
+    def _update_window(self, acked_bytes: int) -> None:
+        if self.state == BbrState.PROBE_RTT:
+            self.congestion_window = self._min_window
+            return
+
+        bdp = self.bdp
+        if bdp is None:
+            # no model yet, grow as in slow start
+            self.congestion_window += acked_bytes
+            return
+
+        target = max(int(self._gain * K_CWND_GAIN * bdp), self._min_window)
+        if self._filled_pipe:
+            self.congestion_window = min(self.congestion_window + acked_bytes, target)
+        elif (
+            self.congestion_window < target
+            or self._delivered < K_INITIAL_WINDOW * self._max_datagram_size
+        ):
+            self.congestion_window += acked_bytes
+        self.congestion_window = max(self.congestion_window, self._min_window)
+
+
+register_congestion_control("bbr", BbrCongestionControl)
@@ -0,0 +1,76 @@
+"""Reuse of inbound QUIC connections for messages back to the same peer.
+
+A client announces its own DIDComm endpoint in the `x-didcomm-endpoint` header
+of its requests. The inbound transport registers the connection under that
+endpoint, and the outbound transport sends messages addressed to the endpoint
+back over it on message streams (see `h3connection`), instead of dialing the
+peer. The client hands these messages to its own HTTP/3 inbound transport, and
+only announces its endpoint while there is one to hand them to.
+
+The inbound transport only checks that the announced endpoint resolves to the
+address the connection comes from (`duplex_verify_address`), not that the
+client holds the keys of the agent behind the endpoint.
+"""
+
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from aries_cloudagent.config.injection_context import InjectionContext
+
+LOGGER = logging.getLogger(__name__)
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    """Return `endpoint` in the form endpoints are registered under."""
+    return endpoint.rstrip("/")
+
+
+class DuplexConnections:
+    """Live inbound connections by the DIDComm endpoint of their peer."""
+
+    def __init__(self) -> None:
+        """Initialize a `DuplexConnections` instance."""
+        self._connections: Dict[str, object] = {}
+        self.message_handler: Optional[Callable[[bytes, Tuple], None]] = None
+
+    def register(self, endpoint: str, protocol) -> None:
+        """Register `protocol` as the connection to reach `endpoint`.
+
+        A newer connection from the same peer replaces the previous one.
+        """
+        LOGGER.debug("Registering connection for %s", endpoint)
+        self._connections[normalize_endpoint(endpoint)] = protocol
+
+    def get(self, endpoint: str):
+        """Return the live connection to `endpoint`, if there is one."""
+        key = normalize_endpoint(endpoint)
+        protocol = self._connections.get(key)
+        if protocol is not None and protocol.is_closing:
+            del self._connections[key]
+            protocol = None
+        return protocol
+
+    @property
+    def accepts_messages(self) -> bool:
+        """Whether an inbound transport takes messages sent back to us."""
+        return self.message_handler is not None
+
+    def set_message_handler(self, handler: Callable[[bytes, Tuple], None]):
+        """Set the handler of messages received over outbound connections."""
+        self.message_handler = handler
+
+    def message_received(self, data: bytes, peer: Tuple) -> None:
+        """Deliver a message received over an outbound connection."""
+        if self.message_handler is None:
+            LOGGER.warning("Dropping message from %s, no inbound transport", peer[0])
+            return
+        self.message_handler(data, peer)
+
+
+def get_duplex_connections(context: InjectionContext) -> DuplexConnections:
+    """Return the registry shared by the transports of `context`."""
+    connections = context.inject_or(DuplexConnections)
+    if connections is None:
+        connections = DuplexConnections()
+        context.injector.bind_instance(DuplexConnections, connections)
+    return connections
@@ -0,0 +1,189 @@
+"""Shared UDP sockets for outbound QUIC connections."""
+
+import asyncio
+import itertools
+import logging
+import socket
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.buffer import Buffer
+from aioquic.quic.packet import pull_quic_header
+
+from . import udp
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SharedTransport(asyncio.DatagramTransport):
+    """Per-connection view of a shared datagram endpoint.
+
+    Closing it only detaches the connection, the socket stays open for the other
+    connections sharing it.
+    """
+
+    def __init__(self, endpoint: "SharedEndpoint", protocol: QuicConnectionProtocol):
+        """Initialize a `SharedTransport` instance."""
+        super().__init__()
+        self._endpoint = endpoint
+        self._protocol = protocol
+        self._closing = False
+
+    def sendto(self, data, addr=None) -> None:
+        """Send `data` from the shared socket."""
+        self._endpoint.transport.sendto(data, addr)
+
+    def send_batch(self, datagrams, addr) -> None:
+        """Send several datagrams from the shared socket."""
+        transport = self._endpoint.transport
+        if hasattr(transport, "send_batch"):
+            transport.send_batch(datagrams, addr)
+        else:
+            for data in datagrams:
+                transport.sendto(data, addr)
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        """Return information about the shared socket."""
+        return self._endpoint.transport.get_extra_info(name, default)
+
+    def is_closing(self) -> bool:
+        """Whether the connection has been detached."""
+        return self._closing
+
+    def close(self) -> None:
+        """Detach the connection, leaving the shared socket open."""
+        if not self._closing:
+            self._closing = True
+            self._endpoint.detach(self._protocol)
+
+    def abort(self) -> None:
+        """Detach the connection."""
+        self.close()
+
+
+class SharedEndpoint(asyncio.DatagramProtocol):
+    """A UDP socket carrying many client connections.
+
+    Incoming datagrams are routed to the connection owning their destination
+    connection ID, which is tracked as connection IDs are issued and retired.
+    """
+
+    def __init__(self, connection_id_length: int = 8) -> None:
+        """Initialize a `SharedEndpoint` instance."""
+        self.connection_id_length = connection_id_length
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._protocols: Dict[bytes, QuicConnectionProtocol] = {}
+
+    def __len__(self) -> int:
+        """Return the number of attached connections."""
+        return len(set(self._protocols.values()))
+
+    def attach(self, protocol: QuicConnectionProtocol) -> SharedTransport:
+        """Attach `protocol` and return its transport."""
+        protocol._connection_id_issued_handler = partial(
+            self._connection_id_issued, protocol=protocol
+        )
+        protocol._connection_id_retired_handler = self._connection_id_retired
+        protocol._connection_terminated_handler = partial(self.detach, protocol)
+        self._protocols[protocol._quic.host_cid] = protocol
+
+        transport = SharedTransport(self, protocol)
+        protocol.connection_made(transport)
+        return transport
+
+    def detach(self, protocol: QuicConnectionProtocol) -> None:
+        """Stop routing datagrams to `protocol`."""
+        for cid, proto in list(self._protocols.items()):
+            if proto is protocol:
+                del self._protocols[cid]
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Keep the transport of the shared socket."""
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        """Route a datagram to its connection by destination connection ID."""
+        try:
+            header = pull_quic_header(
+                Buffer(data=data), host_cid_length=self.connection_id_length
+            )
+        except ValueError:
+            return
+        protocol = self._protocols.get(header.destination_cid)
+        if protocol is not None:
+            protocol.datagram_received(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        """Log errors of the shared socket."""
+        LOGGER.debug("Error on shared UDP socket: %s", exc)
+
+    def _connection_id_issued(self, cid: bytes, protocol: QuicConnectionProtocol):
+        self._protocols[cid] = protocol
+
+    def _connection_id_retired(self, cid: bytes) -> None:
+        self._protocols.pop(cid, None)
+
+
+class SharedEndpoints:
+    """A fixed set of shared UDP sockets per address family.
+
+    Connections are assigned to the sockets of their family in turn. Sockets are
+    bound lazily, on first use.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        connection_id_length: int = 8,
+        udp_offload: bool = False,
+        dont_fragment: bool = False,
+    ) -> None:
+        """Initialize a `SharedEndpoints` instance."""
+        self.size = size
+        self.connection_id_length = connection_id_length
+        self.udp_offload = udp_offload
+        # set for path MTU discovery, whose probes must not be fragmented
+        self.dont_fragment = dont_fragment
+        self._endpoints: Dict[int, List[SharedEndpoint]] = {}
+        self._counter = itertools.count()
+        self._lock = asyncio.Lock()
+
+    async def create_endpoint(
+        self, protocol_factory: Callable[[], QuicConnectionProtocol], family: int
+    ) -> Tuple[SharedTransport, QuicConnectionProtocol]:
+        """Attach a new connection, like loop.create_datagram_endpoint."""
+        endpoints = await self._get_endpoints(family)
+        endpoint = endpoints[next(self._counter) % len(endpoints)]
+        protocol = protocol_factory()
+        return endpoint.attach(protocol), protocol
+
+    def close(self) -> None:
+        """Close all shared sockets."""
+        for endpoints in self._endpoints.values():
+            for endpoint in endpoints:
+                endpoint.transport.close()
+        self._endpoints.clear()
+
+    async def _get_endpoints(self, family: int) -> List[SharedEndpoint]:
+        async with self._lock:
+            if family not in self._endpoints:
+                loop = asyncio.get_event_loop()
+                create_datagram_endpoint = (
+                    udp.create_datagram_endpoint
+                    if self.udp_offload
+                    else loop.create_datagram_endpoint
+                )
+                local_host = "::" if family == socket.AF_INET6 else "0.0.0.0"
+                endpoints = []
+                for _ in range(self.size):
+                    transport, endpoint = await create_datagram_endpoint(
+                        lambda: SharedEndpoint(self.connection_id_length),
+                        local_addr=(local_host, 0),
+                        family=family,
+                    )
+                    if self.dont_fragment:
+                        udp.set_dont_fragment(transport.get_extra_info("socket"))
+                    endpoints.append(endpoint)
+                self._endpoints[family] = endpoints
+            return self._endpoints[family]
@@ -0,0 +1,170 @@
+"""Receive window autotuning for QUIC connections.
+
+aioquic doubles a receive limit whenever half of it has been used, so windows
+grow without bound on long transfers regardless of how fast the application
+reads. Here every connection and stream instead has a window that is
+re-advertised from the consumed offset once half of it is left, and doubled up
+to a ceiling only when it is used up in less than two round trips, i.e. when
+the window rather than the sender limits throughput. Short control messages
+keep the initial window, bulk transfers grow theirs to the bandwidth-delay
+product.
+"""
+
+import logging
+import time
+import weakref
+from typing import Optional
+
+from aioquic.quic.connection import (
+    CONNECTION_LIMIT_FRAME_CAPACITY,
+    MAX_STREAM_DATA_FRAME_CAPACITY,
+    Limit,
+    QuicConnection,
+)
+from aioquic.quic.packet import QuicFrameType
+from aioquic.quic.packet_builder import QuicPacketBuilder
+from aioquic.quic.recovery import QuicPacketSpace
+from aioquic.quic.stream import QuicStream
+
+LOGGER = logging.getLogger(__name__)
+
+# the connection window is kept this much larger than any stream window, so a
+# single stream cannot block the others
+CONNECTION_WINDOW_RATIO = 1.5
+
+
+class ReceiveWindow:
+    """Window state of a single connection or stream."""
+
+    def __init__(self, size: int) -> None:
+        """Initialize a `ReceiveWindow` instance."""
+        self.size = size
+        self.updated_at: Optional[float] = None
+
+    def next_limit(
+        self, limit: int, consumed: int, now: float, rtt: float, max_size: int
+    ) -> int:
+        """Return the limit to advertise, given the current one."""
+        if limit - consumed > self.size // 2:
+            return limit
+        if (
+            self.updated_at is not None
+            and now - self.updated_at < 2 * rtt
+            and self.size < max_size
+        ):
+            self.size = min(self.size * 2, max_size)
+        self.updated_at = now
+        return max(limit, consumed + self.size)
+
+
+class ReceiveWindowAutotuner:
+    """Takes over raising the MAX_DATA and MAX_STREAM_DATA limits of `quic`."""
+
+    def __init__(
+        self, quic: QuicConnection, max_data: int, max_stream_data: int
+    ) -> None:
+        """Initialize a `ReceiveWindowAutotuner` instance."""
+        self._quic = quic
+        self.max_data = max(max_data, quic._local_max_data.value)
+        self.max_stream_data = max(
+            max_stream_data, quic.configuration.max_stream_data
+        )
+        self._connection_window = ReceiveWindow(quic._local_max_data.value)
+        self._stream_windows: weakref.WeakKeyDictionary[
+            QuicStream, ReceiveWindow
+        ] = weakref.WeakKeyDictionary()
+
+        quic._write_connection_limits = self._write_connection_limits
+        quic._write_stream_limits = self._write_stream_limits
+
+    @property
+    def connection_window(self) -> int:
+        """The current size of the connection receive window."""
+        return self._connection_window.size
+
+    def _rtt(self) -> float:
+        loss = self._quic._loss
+        if loss._rtt_initialized:
+            return loss._rtt_smoothed
+        return self._quic.configuration.initial_rtt
+
+    def _write_connection_limits(
+        self, builder: QuicPacketBuilder, space: QuicPacketSpace
+    ) -> None:
+        quic = self._quic
+        limit = quic._local_max_data
+        value = self._connection_window.next_limit(
+            limit.value, limit.used, time.monotonic(), self._rtt(), self.max_data
+        )
+        if value != limit.value:
+            limit.value = value
+            LOGGER.debug(
+                "Local max_data raised to %d (window %d)",
+                value,
+                self._connection_window.size,
+            )
+        self._write_limit(builder, limit)
+
+        for limit in (quic._local_max_streams_bidi, quic._local_max_streams_uni):
+            if limit.used * 2 > limit.value:
+                limit.value *= 2
+            self._write_limit(builder, limit)
+
+    def _write_limit(self, builder: QuicPacketBuilder, limit: Limit) -> None:
+        if limit.value != limit.sent:
+            buf = builder.start_frame(
+                limit.frame_type,
+                capacity=CONNECTION_LIMIT_FRAME_CAPACITY,
+                handler=self._quic._on_connection_limit_delivery,
+                handler_args=(limit,),
+            )
+            buf.push_uint_var(limit.value)
+            limit.sent = limit.value
+
+    def _write_stream_limits(
+        self, builder: QuicPacketBuilder, space: QuicPacketSpace, stream: QuicStream
+    ) -> None:
+        # locally created unidirectional streams have nothing to receive
+        if not stream.max_stream_data_local:
+            return
+        if stream.receiver.is_finished:
+            self._write_max_stream_data(builder, stream)
+            return
+
+        window = self._stream_windows.get(stream)
+        if window is None:
+            window = self._stream_windows[stream] = ReceiveWindow(
+                stream.max_stream_data_local
+            )
+        size = window.size
+        value = window.next_limit(
+            stream.max_stream_data_local,
+            stream.receiver._buffer_start,
+            time.monotonic(),
+            self._rtt(),
+            self.max_stream_data,
+        )
+        if window.size > size:
+            self._grow_connection_window(window.size)
+        if value != stream.max_stream_data_local:
+            stream.max_stream_data_local = value
+        self._write_max_stream_data(builder, stream)
+
+    def _write_max_stream_data(
+        self, builder: QuicPacketBuilder, stream: QuicStream
+    ) -> None:
+        if stream.max_stream_data_local_sent != stream.max_stream_data_local:
+            buf = builder.start_frame(
+                QuicFrameType.MAX_STREAM_DATA,
+                capacity=MAX_STREAM_DATA_FRAME_CAPACITY,
+                handler=self._quic._on_max_stream_data_delivery,
+                handler_args=(stream,),
+            )
+            buf.push_uint_var(stream.stream_id)
+            buf.push_uint_var(stream.max_stream_data_local)
+            stream.max_stream_data_local_sent = stream.max_stream_data_local
+
+    def _grow_connection_window(self, stream_window: int) -> None:
+        size = min(int(stream_window * CONNECTION_WINDOW_RATIO), self.max_data)
+        if size > self._connection_window.size:
+            self._connection_window.size = size
@@ -0,0 +1,131 @@
+"""HTTP/3 connection with configurable QPACK settings and message streams."""
+
+from dataclasses import dataclass
+from typing import List
+
+from aioquic.buffer import Buffer, BufferReadError, encode_uint_var
+from aioquic.h3 import connection
+from aioquic.h3.events import H3Event
+from aioquic.quic.connection import QuicConnection, stream_is_unidirectional
+from aioquic.quic.events import QuicEvent, StreamDataReceived
+
+DEFAULT_QPACK_MAX_TABLE_CAPACITY = 4096
+DEFAULT_QPACK_BLOCKED_STREAMS = 16
+
+# extension stream type of unidirectional streams carrying one DIDComm message,
+# which peers that do not know it ignore (RFC 9114, section 6.2.3)
+MESSAGE_STREAM_TYPE = 0x4443
+
+# request header in which a client announces its own DIDComm endpoint
+ENDPOINT_HEADER = b"x-didcomm-endpoint"
+
+
+@dataclass
+class MessageReceived(H3Event):
+    """A DIDComm message was received on a message stream."""
+
+    data: bytes
+    stream_id: int
+
+
+class H3Connection(connection.H3Connection):
+    """aioquic's H3Connection, with the QPACK decoder settings as arguments.
+
+    aioquic fixes the settings in its constructor, which also creates the decoder
+    and sends the SETTINGS frame, so they are exposed as read-only attributes
+    here.
+
+    Either side can also send DIDComm messages on unidirectional message
+    streams, outside of any request, which are reported as `MessageReceived`.
+    """
+
+    def __init__(
+        self,
+        quic: QuicConnection,
+        enable_webtransport: bool = False,
+        *,
+        max_table_capacity: int = DEFAULT_QPACK_MAX_TABLE_CAPACITY,
+        blocked_streams: int = DEFAULT_QPACK_BLOCKED_STREAMS,
+    ) -> None:
+        """Initialize an `H3Connection` instance."""
+        self._qpack_settings = (max_table_capacity, blocked_streams)
+        super().__init__(quic, enable_webtransport)
+
+    @property
+    def _max_table_capacity(self) -> int:
+        return self._qpack_settings[0]
+
+    @_max_table_capacity.setter
+    def _max_table_capacity(self, value: int) -> None:
+        pass
+
+    @property
+    def _blocked_streams(self) -> int:
+        return self._qpack_settings[1]
+
+    @_blocked_streams.setter
+    def _blocked_streams(self, value: int) -> None:
+        pass
+
+    def handle_event(self, event: QuicEvent) -> List[H3Event]:
+        """Handle a QUIC event, including the data of message streams."""
+        if (
+            isinstance(event, StreamDataReceived)
+            and stream_is_unidirectional(event.stream_id)
+            and not self._is_done
+        ):
+            stream = self._get_or_create_stream(event.stream_id)
+            if stream.stream_type in (None, MESSAGE_STREAM_TYPE):
+                return self._receive_message_stream(
+                    stream, event.data, event.end_stream
+                )
+        return super().handle_event(event)
+
+    def send_message(self, data: bytes) -> int:
+        """Send `data` on a new message stream and return its stream ID."""
+        stream_id = self._quic.get_next_available_stream_id(is_unidirectional=True)
+        self._quic.send_stream_data(
+            stream_id, encode_uint_var(MESSAGE_STREAM_TYPE) + data, end_stream=True
+        )
+        return stream_id
+
+    def discard_finished_streams(self) -> None:
+        """Drop the state of streams the QUIC connection is done with.
+
+        aioquic keeps it for every stream ever opened. It is pruned once the
+        finished streams outnumber the live ones, which keeps the cost constant
+        per stream. Streams with headers waiting for QPACK encoder instructions
+        are kept, even if all of their data has arrived.
+        """
+        if len(self._stream) > 2 * len(self._quic._streams):
+            self._stream = {
+                stream_id: stream
+                for stream_id, stream in self._stream.items()
+                if stream_id in self._quic._streams or stream.blocked
+            }
+
+    def _receive_message_stream(
+        self, stream: connection.H3Stream, data: bytes, stream_ended: bool
+    ) -> List[H3Event]:
+        if stream.stream_type is None:
+            data = stream.buffer + data
+            stream.buffer = b""
+            buf = Buffer(data=data)
+            try:
+                stream_type = buf.pull_uint_var()
+            except BufferReadError:
+                stream.buffer = data
+                return []
+            if stream_type != MESSAGE_STREAM_TYPE:
+                # one of the HTTP/3 stream types
+                return self._receive_stream_data_uni(stream, data, stream_ended)
+            stream.stream_type = stream_type
+            # appending to bytes would copy the whole message every time
+            stream.buffer = bytearray()
+            data = data[buf.tell():]
+
+        stream.buffer += data
+        if not stream_ended:
+            return []
+        message, stream.buffer = bytes(stream.buffer), b""
+        return [MessageReceived(data=message, stream_id=stream.stream_id)]
@@ -1,61 +1,148 @@
 import asyncio
 import logging
-from collections import deque, OrderedDict
-from typing import Deque, Dict, Optional
+from collections import OrderedDict
+from typing import Callable, Deque, Dict, Optional, Tuple
 from urllib.parse import urlparse
 
 import aioquic
-from aioquic.asyncio.protocol import QuicConnectionProtocol
-from aioquic.h3.connection import H3Connection
 from aioquic.h3.events import (
     DataReceived,
     H3Event,
     HeadersReceived,
 )
-from aioquic.quic.events import QuicEvent
+from aioquic.quic.events import (
+    ConnectionTerminated,
+    HandshakeCompleted,
+    QuicEvent,
+    StreamReset,
+)
+
+from .h3connection import (
+    DEFAULT_QPACK_BLOCKED_STREAMS,
+    DEFAULT_QPACK_MAX_TABLE_CAPACITY,
+    H3Connection,
+    MessageReceived,
+)
+from .priority import PRIORITY_HEADER, Priority
+from .quic_client import QuicClient, RequestReset
 
 logger = logging.getLogger("client")
 
 USER_AGENT = "aioquic/" + aioquic.__version__
 
 
-class Http3Client(QuicConnectionProtocol):
-    def __init__(self, *args, **kwargs) -> None:
+class Http3Response:
+    """Response state collected for a single request stream."""
+
+    def __init__(self, stream_id: int) -> None:
+        self.stream_id = stream_id
+        self.headers: Dict[str, str] = OrderedDict()
+        self.data = bytearray()
+
+    @property
+    def status(self) -> int:
+        return int(self.headers.get(":status", 0))
+
+    def http_event_received(self, event: H3Event) -> None:
+        if isinstance(event, HeadersReceived):
+            for k, v in event.headers:
+                self.headers[k.decode()] = v.decode()
+        elif isinstance(event, DataReceived):
+            self.data.extend(event.data)
+
+
+class Http3Client(QuicClient):
+    def __init__(
+        self,
+        *args,
+        qpack_max_table_capacity: int = DEFAULT_QPACK_MAX_TABLE_CAPACITY,
+        qpack_blocked_streams: int = DEFAULT_QPACK_BLOCKED_STREAMS,
+        **kwargs,
+    ) -> None:
+        """Initialize an `Http3Client` instance."""
         super().__init__(*args, **kwargs)
 
         self.pushes: Dict[int, Deque[H3Event]] = {}
-        self._http: Optional[H3Connection] = None
-        self._request_events: Dict[int, Deque[H3Event]] = {}
-        self._request_waiter: Dict[int, asyncio.Future[Deque[H3Event]]] = {}
-        self._http = H3Connection(self._quic)
-        self.http_response_headers = OrderedDict()
-        self.http_response_data = bytearray()
+        self._request_events: Dict[int, Http3Response] = {}
+        self._request_waiter: Dict[int, asyncio.Future[Http3Response]] = {}
+        self._http: H3Connection = H3Connection(
+            self._quic,
+            max_table_capacity=qpack_max_table_capacity,
+            blocked_streams=qpack_blocked_streams,
+        )
+        self.session_resumed = False
+        self.early_data_accepted = False
+        # receives messages the server sends back over this connection
+        self.message_handler: Optional[Callable[[bytes, Tuple], None]] = None
+
+    @property
+    def pending_requests(self) -> int:
+        return len(self._request_waiter)
 
     def http_event_received(self, event: H3Event) -> None:
+        """Collect a response or hand over a message from the server."""
         if isinstance(event, (HeadersReceived, DataReceived)):
             stream_id = event.stream_id
             if stream_id in self._request_events:
-                self._request_events[event.stream_id].append(event)
+                self._request_events[stream_id].http_event_received(event)
                 if event.stream_ended:
                     request_waiter = self._request_waiter.pop(stream_id)
-                    request_waiter.set_result(self._request_events.pop(stream_id))
-
-        if isinstance(event, DataReceived):
-            self.http_response_data.extend(event.data)
-
-        if isinstance(event, HeadersReceived):
-            for k, v in event.headers:
-                self.http_response_headers[k.decode()] = v.decode()
+                    response = self._request_events.pop(stream_id)
+                    if not request_waiter.done():
+                        request_waiter.set_result(response)
+                    self._http.discard_finished_streams()
+        elif isinstance(event, MessageReceived):
+            if self.message_handler is not None:
+                self.message_handler(event.data, self._quic._network_paths[0].addr)
 
     def quic_event_received(self, event: QuicEvent) -> None:
+        """Handle a QUIC event and pass it on to the HTTP layer."""
+        if isinstance(event, HandshakeCompleted):
+            self.session_resumed = event.session_resumed
+            self.early_data_accepted = event.early_data_accepted
+            logger.debug(
+                "Handshake completed (resumed: %s, early data accepted: %s)",
+                event.session_resumed,
+                event.early_data_accepted,
+            )
+        elif isinstance(event, StreamReset):
+            self._abort_request(
+                event.stream_id, RequestReset(event.stream_id, event.error_code)
+            )
+        elif isinstance(event, ConnectionTerminated):
+            self.abort_requests(
+                ConnectionError(event.reason_phrase or "Connection closed")
+            )
+
         #  pass event to the HTTP layer
         if self._http is not None:
             for http_event in self._http.handle_event(event):
                 self.http_event_received(http_event)
 
-    async def send_http_request(self, url: str, method: str = "GET", data: Optional[str] = None, headers: Optional[Dict] = None):
+    def abort_requests(self, exc: Exception) -> None:
+        """Fail all pending requests with `exc`."""
+        for stream_id in list(self._request_waiter):
+            self._abort_request(stream_id, self.request_error(stream_id, exc))
+        super().abort_requests(exc)
+
+    def _abort_request(self, stream_id: int, exc: Exception) -> None:
+        self._request_events.pop(stream_id, None)
+        request_waiter = self._request_waiter.pop(stream_id, None)
+        if request_waiter is not None and not request_waiter.done():
+            request_waiter.set_exception(exc)
+
+    async def send_http_request(
+        self,
+        url: str,
+        method: str = "GET",
+        data: Optional[bytes] = None,
+        headers: Optional[Dict] = None,
+    ) -> Tuple[bytearray, Dict[str, str]]:
+        """Send an HTTP request and return the response body and headers."""
         if headers is None:
             headers = {}
+        if isinstance(data, str):
+            data = data.encode()
 
         parsed = urlparse(url)
         authority = parsed.netloc
@@ -76,14 +163,18 @@ class Http3Client(QuicConnectionProtocol):
         )
         if data:
             self._http.send_data(
-                stream_id=stream_id, data=data, end_stream=True  # TODO: encode data if type is str
+                stream_id=stream_id, data=data, end_stream=True
+            )
+        if PRIORITY_HEADER in headers:
+            self.set_stream_priority(
+                stream_id, Priority.parse(headers[PRIORITY_HEADER])
             )
 
         waiter = self._loop.create_future()
-        self._request_events[stream_id] = deque()
+        self._request_events[stream_id] = Http3Response(stream_id)
         self._request_waiter[stream_id] = waiter
-        self.transmit()
+        self.queue_transmit(len(data) if data else 0)
 
-        await asyncio.shield(waiter)
+        response = await asyncio.shield(waiter)
 
-        return self.http_response_data, self.http_response_headers
+        return response.data, response.headers
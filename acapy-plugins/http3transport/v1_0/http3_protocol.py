@@ -1,21 +1,127 @@
 import asyncio
+import logging
+import sys
 import time
 from email.utils import formatdate
-from typing import Callable, Dict, cast, Optional
+from typing import Awaitable, Callable, Dict, List, cast, Optional, Tuple, Union
 
 import aioquic
 from aioquic.asyncio import QuicConnectionProtocol
-from aioquic.h3.connection import H3_ALPN, H3Connection
+from aioquic.h3.connection import H3_ALPN, ErrorCode
 from aioquic.h3.events import (
     DataReceived,
     H3Event,
     HeadersReceived, WebTransportStreamDataReceived, DatagramReceived,
 )
 from aioquic.h3.exceptions import NoAvailablePushIDError
-from aioquic.quic.events import ProtocolNegotiated, DatagramFrameReceived, QuicEvent
+from aioquic.quic.events import (
+    ConnectionTerminated,
+    DatagramFrameReceived,
+    ProtocolNegotiated,
+    QuicEvent,
+    StopSendingReceived,
+    StreamReset,
+)
+
+from .admission import AdmissionQueue
+from .h3connection import (
+    DEFAULT_QPACK_BLOCKED_STREAMS,
+    DEFAULT_QPACK_MAX_TABLE_CAPACITY,
+    ENDPOINT_HEADER,
+    H3Connection,
+)
+from .priority import PRIORITY_HEADER, Priority, StreamScheduler
+from .udp import BatchedTransmitMixin
+
+LOGGER = logging.getLogger(__name__)
 
 SERVER_NAME = "aioquic/" + aioquic.__version__
 
+# (status, headers, body)
+DirectResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+class MessageTooLarge(Exception):
+    """A request body exceeds the maximum message size."""
+
+
+class BodyStats:
+    """Memory held by the bodies of requests that are still being handled."""
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.rejected_messages = 0
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+        self.peak_message_bytes = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+
+class MessageBody:
+    """Collects a request body of at most `max_size` bytes in a single buffer.
+
+    If the request announced its content length, the buffer is allocated once,
+    up to `preallocate` bytes, and filled in place. Otherwise it grows as data
+    arrives. A `max_size` of 0 does not limit the body.
+    """
+
+    def __init__(
+        self,
+        content_length: Optional[int],
+        max_size: int = 0,
+        preallocate: int = 0,
+        stats: Optional[BodyStats] = None,
+    ) -> None:
+        if max_size and content_length is not None and content_length > max_size:
+            raise MessageTooLarge(f"Content length {content_length} exceeds limit")
+        self.content_length = content_length
+        self.max_size = max_size
+        self.length = 0
+        self._buffer = bytearray(min(content_length or 0, preallocate))
+        self._stats = stats
+        self._allocated = 0
+        self._account()
+
+    def feed(self, data: bytes) -> None:
+        end = self.length + len(data)
+        if self.max_size and end > self.max_size:
+            raise MessageTooLarge(f"Body exceeds limit of {self.max_size} bytes")
+        # grows the buffer once the data no longer fits into the preallocated part
+        self._buffer[self.length : end] = data
+        self.length = end
+        self._account()
+
+    def getvalue(self) -> bytearray:
+        """Return the complete body, without copying it."""
+        return self._buffer
+
+    def release(self) -> None:
+        """Stop accounting for the body, once it has been handled."""
+        if self._stats is not None:
+            self._stats.buffered_bytes -= self._allocated
+        self._allocated = 0
+
+    def _account(self) -> None:
+        if self._stats is None:
+            return
+        allocated = sys.getsizeof(self._buffer)
+        stats = self._stats
+        stats.buffered_bytes += allocated - self._allocated
+        stats.peak_buffered_bytes = max(stats.peak_buffered_bytes, stats.buffered_bytes)
+        stats.peak_message_bytes = max(stats.peak_message_bytes, allocated)
+        self._allocated = allocated
+
+
+def content_length(headers: List[Tuple[bytes, bytes]]) -> Optional[int]:
+    """Return the content-length of a request, if given."""
+    # the H3 layer has checked it is valid and matches the data received
+    for header, value in headers:
+        if header == b"content-length":
+            return int(value)
+    return None
+
 
 class HttpRequestHandler:
     def __init__(
@@ -29,6 +135,7 @@ class HttpRequestHandler:
             stream_id: int,
             transmit: Callable[[], None],
     ) -> None:
+        """Initialize an `HttpRequestHandler` instance."""
         self.authority = authority
         self.connection = connection
         self.protocol = protocol
@@ -36,31 +143,72 @@ class HttpRequestHandler:
         self.scope = scope
         self.stream_id = stream_id
         self.transmit = transmit
+        self.received = 0
+        self.disconnected = False
+        self.request_ended = stream_ended
+        self.response_ended = False
+        self.task: Optional[asyncio.Future] = None
 
         if stream_ended:
             self.queue.put_nowait({"type": "http.request"})
 
     def http_event_received(self, event: H3Event) -> None:
-        if isinstance(event, DataReceived):
-            self.queue.put_nowait(
-                {
-                    "type": "http.request",
-                    "body": event.data,
-                    "more_body": not event.stream_ended,
-                }
-            )
+        if self.disconnected:
+            pass
+        elif isinstance(event, DataReceived):
+            self.received += len(event.data)
+            max_size = cast(Http3ServerProtocol, self.protocol).max_message_size
+            if max_size and self.received > max_size:
+                self.reject(413)
+            else:
+                self.queue.put_nowait(
+                    {
+                        "type": "http.request",
+                        "body": event.data,
+                        "more_body": not event.stream_ended,
+                    }
+                )
         elif isinstance(event, HeadersReceived) and event.stream_ended:
             self.queue.put_nowait(
                 {"type": "http.request", "body": b"", "more_body": False}
             )
+        if isinstance(event, (DataReceived, HeadersReceived)) and event.stream_ended:
+            self.request_ended = True
+            cast(Http3ServerProtocol, self.protocol).release_handler(self)
+
+    def disconnect(self) -> None:
+        self.disconnected = True
+        self.queue.put_nowait({"type": "http.disconnect"})
+
+    def reject(self, status: int) -> None:
+        """Answer with `status` on behalf of the application, and disconnect it."""
+        self.disconnect()
+        cast(Http3ServerProtocol, self.protocol).reject_request(self, status)
 
     async def run_asgi(self, app: Callable) -> None:
-        await app(self.scope, self.receive, self.send)
+        admission = cast(Http3ServerProtocol, self.protocol).admission
+        try:
+            if admission is not None:
+                async with admission.slot():
+                    await app(self.scope, self.receive, self.send)
+            else:
+                await app(self.scope, self.receive, self.send)
+        except Exception:
+            # the application gave up on the disconnected request
+            if not self.disconnected:
+                raise
+        finally:
+            if not self.response_ended:
+                # left unfinished by the application
+                self.response_ended = True
+                cast(Http3ServerProtocol, self.protocol).release_handler(self)
 
     async def receive(self) -> Dict:
         return await self.queue.get()
 
     async def send(self, message: Dict) -> None:
+        if self.response_ended:
+            return
         if message["type"] == "http.response.start":
             self.connection.send_headers(
                 stream_id=self.stream_id,
@@ -77,6 +225,9 @@ class HttpRequestHandler:
                 data=message.get("body", b""),
                 end_stream=not message.get("more_body", False),
             )
+            if not message.get("more_body", False):
+                self.response_ended = True
+                cast(Http3ServerProtocol, self.protocol).release_handler(self)
         elif message["type"] == "http.response.push" and isinstance(
                 self.connection, H3Connection
         ):
@@ -104,14 +255,173 @@ class HttpRequestHandler:
         self.transmit()
 
 
-class Http3ServerProtocol(QuicConnectionProtocol):
-    def __init__(self, *args, **kwargs) -> None:
+class MessageRequestHandler:
+    """Collects the body of a DIDComm message POSTed to the message handler.
+
+    Takes the place of HttpRequestHandler for `POST /`, without going through
+    an ASGI application.
+    """
+
+    def __init__(
+            self,
+            *,
+            protocol: "Http3ServerProtocol",
+            scope: Dict,
+            stream_ended: bool,
+            stream_id: int,
+    ) -> None:
+        """Initialize a `MessageRequestHandler` instance."""
+        self.protocol = protocol
+        self.scope = scope
+        self.stream_id = stream_id
+        self.body: Optional[MessageBody] = None
+        self.request_ended = stream_ended
+        self.response_ended = False
+        self.task: Optional[asyncio.Future] = None
+
+        try:
+            self.body = MessageBody(
+                content_length(scope["headers"]),
+                max_size=protocol.max_message_size,
+                preallocate=protocol.max_preallocated_size,
+                stats=protocol.body_stats,
+            )
+        except MessageTooLarge:
+            self.protocol.reject_request(self, 413)
+            return
+        if stream_ended:
+            self.protocol.handle_message_request(self)
+
+    def http_event_received(self, event: H3Event) -> None:
+        """Collect the body of the request."""
+        if not isinstance(event, (DataReceived, HeadersReceived)):
+            return
+        if self.body is None:
+            # rejected, the rest of the request is of no use
+            pass
+        elif isinstance(event, DataReceived):
+            try:
+                self.body.feed(event.data)
+            except MessageTooLarge:
+                self.reject(413)
+        if event.stream_ended:
+            self.request_ended = True
+            if self.body is not None:
+                self.protocol.handle_message_request(self)
+            else:
+                self.protocol.release_handler(self)
+
+    def disconnect(self) -> None:
+        """Release the body of the request."""
+        if self.body is not None:
+            self.body.release()
+            self.body = None
+
+    def reject(self, status: int) -> None:
+        """Release the body and answer the request with `status`."""
+        self.disconnect()
+        self.protocol.reject_request(self, status)
+
+
+RequestHandler = Union[HttpRequestHandler, MessageRequestHandler]
+
+
+class Http3ServerProtocol(BatchedTransmitMixin, QuicConnectionProtocol):
+    stream_scheduler: Optional[StreamScheduler] = None
+    # request bodies above this size are refused, 0 for no limit
+    max_message_size = 0
+    max_preallocated_size = 16777216
+    body_stats: Optional[BodyStats] = None
+    # runs the requests of all connections, if set
+    admission: Optional[AdmissionQueue] = None
+
+    def __init__(
+        self,
+        *args,
+        qpack_max_table_capacity: int = DEFAULT_QPACK_MAX_TABLE_CAPACITY,
+        qpack_blocked_streams: int = DEFAULT_QPACK_BLOCKED_STREAMS,
+        **kwargs,
+    ) -> None:
+        """Initialize an `Http3ServerProtocol` instance."""
         super().__init__(*args, **kwargs)
-        self._handlers: Dict[int, HttpRequestHandler] = {}
+        self.qpack_max_table_capacity = qpack_max_table_capacity
+        self.qpack_blocked_streams = qpack_blocked_streams
+        # requests by stream, until both the request and the response are done
+        self._handlers: Dict[int, RequestHandler] = {}
         self._http: Optional[H3Connection] = None
         self.app: Optional[Callable] = None
+        # handles `POST /` in place of the application, if set
+        self.message_handler: Optional[
+            Callable[[bytes, Dict], Awaitable[DirectResponse]]
+        ] = None
+        self.datagram_handler: Optional[Callable[[bytes, Tuple], None]] = None
+        self.endpoint_handler: Optional[
+            Callable[[str, "Http3ServerProtocol"], None]
+        ] = None
+        # the DIDComm endpoint the client announced, if any
+        self.peer_endpoint: Optional[str] = None
+        # messages sent to the client, by stream, until the client acknowledged them
+        self._message_waiters: Dict[int, asyncio.Future] = {}
+
+    @property
+    def path_mtu(self) -> int:
+        """The maximum size of the datagrams sent on this connection."""
+        return self._quic._max_datagram_size
+
+    @property
+    def is_closing(self) -> bool:
+        """Whether the connection is closing or closed."""
+        return self._quic._close_event is not None or self._closed.is_set()
+
+    @property
+    def active_handlers(self) -> int:
+        """The number of requests currently held by this connection."""
+        return len(self._handlers)
+
+    def send_message(
+        self, data: bytes, priority: Optional[Priority] = None
+    ) -> asyncio.Future:
+        """Send a DIDComm message to the client, outside of any request.
+
+        The returned future completes once the client has acknowledged the whole
+        message, and fails if the stream or the connection is closed before.
+        """
+        if self.is_closing:
+            raise ConnectionError("Connection closed")
+        stream_id = self._http.send_message(data)
+        self.set_stream_priority(stream_id, priority or Priority())
+        waiter = self._loop.create_future()
+        self._message_waiters[stream_id] = waiter
+        self.transmit()
+        return waiter
+
+    def transmit(self) -> None:
+        """Send pending datagrams and complete the messages the client has acked."""
+        super().transmit()
+        for stream_id in [s for s in self._message_waiters if self._delivered(s)]:
+            waiter = self._message_waiters.pop(stream_id)
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _delivered(self, stream_id: int) -> bool:
+        # the sender finishes once the data and the FIN are acked, or the reset is
+        stream = self._quic._streams.get(stream_id)
+        return stream is None or (
+            stream.sender.is_finished and stream.sender._reset_error_code is None
+        )
+
+    def _fail_message(self, stream_id: int, exc: Exception) -> None:
+        waiter = self._message_waiters.pop(stream_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(exc)
+
+    def set_stream_priority(self, stream_id: int, priority: Priority) -> None:
+        """Set the priority with which `stream_id` is sent."""
+        if self.stream_scheduler is not None:
+            self.stream_scheduler.set_priority(stream_id, priority)
 
     def http_event_received(self, event: H3Event) -> None:
+        """Start handling new requests and pass events to their handlers."""
         if isinstance(event, HeadersReceived) and event.stream_id not in self._handlers:
             authority = None
             headers = []
@@ -128,6 +438,15 @@ class Http3ServerProtocol(QuicConnectionProtocol):
                     raw_path = value
                 elif header and not header.startswith(b":"):
                     headers.append((header, value))
+                    if header == PRIORITY_HEADER.encode():
+                        # applies to the response
+                        self.set_stream_priority(
+                            event.stream_id, Priority.parse(value.decode())
+                        )
+                    elif header == ENDPOINT_HEADER and self.peer_endpoint is None:
+                        self.peer_endpoint = value.decode()
+                        if self.endpoint_handler is not None:
+                            self.endpoint_handler(self.peer_endpoint, self)
 
             if b"?" in raw_path:
                 path_bytes, query_string = raw_path.split(b"?", maxsplit=1)
@@ -140,12 +459,34 @@ class Http3ServerProtocol(QuicConnectionProtocol):
             client_addr = self._http._quic._network_paths[0].addr
             client = (client_addr[0], client_addr[1])
 
+            if (
+                self.message_handler is not None
+                and method == "POST"
+                and raw_path == b"/"
+            ):
+                handler = MessageRequestHandler(
+                    protocol=self,
+                    scope={
+                        "authority": authority.decode() if authority else "",
+                        "client": client,
+                        "early_data": not self._quic._handshake_complete,
+                        "headers": headers,
+                    },
+                    stream_ended=event.stream_ended,
+                    stream_id=event.stream_id,
+                )
+                self._handlers[event.stream_id] = handler
+                # unless it was rejected right away
+                self.release_handler(handler)
+                return
+
             scope: Dict
             extensions: Dict[str, Dict] = {}
             if isinstance(self._http, H3Connection):
                 extensions["http.response.push"] = {}
             scope = {
                 "client": client,
+                "early_data": not self._quic._handshake_complete,
                 "extensions": extensions,
                 "headers": headers,
                 "http_version": http_version,
@@ -167,7 +508,12 @@ class Http3ServerProtocol(QuicConnectionProtocol):
                 transmit=self.transmit,
             )
             self._handlers[event.stream_id] = handler
-            asyncio.ensure_future(handler.run_asgi(self.app))
+            if self.max_message_size and (
+                content_length(headers) or 0
+            ) > self.max_message_size:
+                handler.reject(413)
+                return
+            handler.task = asyncio.ensure_future(handler.run_asgi(self.app))
         elif (
                 isinstance(event, (DataReceived, HeadersReceived))
                 and event.stream_id in self._handlers
@@ -182,17 +528,167 @@ class Http3ServerProtocol(QuicConnectionProtocol):
             handler.http_event_received(event)
 
     def quic_event_received(self, event: QuicEvent) -> None:
+        """Handle a QUIC event and pass it on to the HTTP layer."""
         if isinstance(event, ProtocolNegotiated):
             if event.alpn_protocol in H3_ALPN:
-                self._http = H3Connection(self._quic)
+                self._http = H3Connection(
+                    self._quic,
+                    max_table_capacity=self.qpack_max_table_capacity,
+                    blocked_streams=self.qpack_blocked_streams,
+                )
         elif isinstance(event, DatagramFrameReceived):
-            if event.data == b"quack":
-                self._quic.send_datagram_frame(b"quack-ack")
+            # DATAGRAM frames carry whole messages rather than HTTP datagrams,
+            # keep them away from the HTTP layer
+            if self.datagram_handler is not None:
+                client_addr = self._quic._network_paths[0].addr
+                self.datagram_handler(event.data, (client_addr[0], client_addr[1]))
+            return
+        elif isinstance(event, StreamReset):
+            self._request_reset(event.stream_id)
+        elif isinstance(event, StopSendingReceived):
+            self._fail_message(
+                event.stream_id,
+                ConnectionError(f"Message stream stopped with {event.error_code}"),
+            )
+            # aioquic has reset the stream, the response is no longer wanted
+            handler = self._handlers.get(event.stream_id)
+            if handler is not None:
+                handler.response_ended = True
+                self.release_handler(handler)
+        elif isinstance(event, ConnectionTerminated):
+            LOGGER.debug(
+                "Connection from %s ended with path MTU %d",
+                self._quic._network_paths[0].addr[0],
+                self.path_mtu,
+            )
+            self._close_handlers()
+            for stream_id in list(self._message_waiters):
+                self._fail_message(
+                    stream_id, ConnectionError(event.reason_phrase or "Connection closed")
+                )
 
         #  pass event to the HTTP layer
         if self._http is not None:
             for http_event in self._http.handle_event(event):
                 self.http_event_received(http_event)
 
+    def handle_message_request(self, handler: MessageRequestHandler) -> None:
+        """Handle a message request in a task of its own."""
+        handler.task = asyncio.ensure_future(self._run_message_handler(handler))
+
+    def release_handler(self, handler: RequestHandler) -> None:
+        """Forget `handler` once its request and its response are both done."""
+        if handler.request_ended and handler.response_ended:
+            if self._handlers.get(handler.stream_id) is handler:
+                del self._handlers[handler.stream_id]
+            self._http.discard_finished_streams()
+
+    def _request_reset(self, stream_id: int) -> None:
+        handler = self._handlers.get(stream_id)
+        if handler is None or handler.request_ended:
+            return
+        # the client abandoned the request, there is nobody to answer
+        handler.disconnect()
+        handler.request_ended = True
+        if not handler.response_ended:
+            handler.response_ended = True
+            self._quic.reset_stream(stream_id, ErrorCode.H3_REQUEST_CANCELLED)
+            self.transmit()
+        self.release_handler(handler)
+
+    def _close_handlers(self) -> None:
+        if self._handlers:
+            LOGGER.debug("Connection closed with %d open requests", len(self._handlers))
+        for handler in self._handlers.values():
+            handler.disconnect()
+            if handler.task is not None:
+                handler.task.cancel()
+        self._handlers.clear()
+
+    async def _run_message_handler(self, handler: MessageRequestHandler) -> None:
+        message = handler.body.getvalue()
+        if self.body_stats is not None:
+            self.body_stats.messages += 1
+        try:
+            if self.admission is not None:
+                async with self.admission.slot():
+                    status, headers, body = await self.message_handler(
+                        message, handler.scope
+                    )
+            else:
+                status, headers, body = await self.message_handler(
+                    message, handler.scope
+                )
+        except Exception:
+            LOGGER.exception("Error handling message on stream %d", handler.stream_id)
+            status, headers, body = 500, [], b""
+        finally:
+            handler.disconnect()
+        if handler.response_ended:
+            return
+        self._http.send_headers(
+            stream_id=handler.stream_id,
+            headers=[
+                (b":status", str(status).encode()),
+                (b"server", SERVER_NAME.encode()),
+                (b"date", formatdate(time.time(), usegmt=True).encode()),
+                (b"content-length", str(len(body)).encode()),
+            ]
+            + headers,
+            end_stream=not body,
+        )
+        if body:
+            self._http.send_data(
+                stream_id=handler.stream_id, data=body, end_stream=True
+            )
+        handler.response_ended = True
+        self.release_handler(handler)
+        self.transmit()
+
+    def reject_request(self, handler: RequestHandler, status: int) -> None:
+        """Answer the request of `handler` with `status`, and stop receiving it.
+
+        The client resets its side of the stream in turn, so a body that is too
+        large is not transferred any further.
+        """
+        stream_id = handler.stream_id
+        if self.body_stats is not None:
+            self.body_stats.rejected_messages += 1
+        LOGGER.debug("Rejecting request on stream %d with %d", stream_id, status)
+        if not handler.response_ended:
+            self._http.send_headers(
+                stream_id=stream_id,
+                headers=[
+                    (b":status", str(status).encode()),
+                    (b"server", SERVER_NAME.encode()),
+                    (b"date", formatdate(time.time(), usegmt=True).encode()),
+                    (b"content-length", b"0"),
+                ],
+                end_stream=True,
+            )
+            handler.response_ended = True
+        stream = self._quic._streams.get(stream_id)
+        if stream is not None and not stream.receiver.is_finished:
+            self._quic.stop_stream(stream_id, ErrorCode.H3_NO_ERROR)
+        self.release_handler(handler)
+        self.transmit()
+
     def set_app(self, app):
+        """Set the ASGI application serving requests."""
         self.app = app
+
+    def set_message_handler(
+        self, handler: Callable[[bytes, Dict], Awaitable[DirectResponse]]
+    ):
+        """Set the handler of `POST /` requests."""
+        self.message_handler = handler
+
+    def set_datagram_handler(self, handler: Callable[[bytes, Tuple], None]):
+        """Set the handler of DATAGRAM frames."""
+        self.datagram_handler = handler
+
+    def set_endpoint_handler(
+        self, handler: Callable[[str, "Http3ServerProtocol"], None]
+    ):
+        """Set the handler of endpoints announced by the client."""
+        self.endpoint_handler = handler
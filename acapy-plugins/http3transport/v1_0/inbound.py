@@ -1,16 +1,18 @@
 """Http3 Transport classes and functions."""
 
+import asyncio
+import ipaddress
 import logging
-from typing import Coroutine, Any, Optional
+from urllib.parse import urlparse
+from typing import Coroutine, Any, Dict, Optional, Tuple, Union
 
 from aiohttp import web
 from aioquic.asyncio import serve
 from aioquic.asyncio.server import QuicServer
 from aioquic.h3.connection import H3_ALPN
-from aioquic.quic.configuration import QuicConfiguration
 from aioquic.quic.logger import QuicFileLogger
 from starlette.applications import Starlette
-from starlette.requests import Request
+from starlette.requests import ClientDisconnect, Request
 from starlette.responses import Response
 from starlette.routing import Route
 
@@ -18,14 +20,44 @@ from aries_cloudagent.messaging.error import MessageParseError
 from aries_cloudagent.transport.error import WireFormatParseError
 from aries_cloudagent.transport.wire_format import DIDCOMM_V0_MIME_TYPE, DIDCOMM_V1_MIME_TYPE
 from aries_cloudagent.transport.inbound.base import BaseInboundTransport, InboundTransportSetupError
-from .http3_protocol import Http3ServerProtocol
+from . import congestion  # noqa: F401 registers the "bbr" algorithm
+from . import udp
+from .config import (
+    autotune_receive_windows,
+    create_admission_queue,
+    create_quic_configuration,
+    discover_path_mtu,
+    get_config,
+    limit_stream_credit,
+    prioritize_streams,
+    reduce_ack_frequency,
+    validate_migrated_paths,
+)
+from .duplex import get_duplex_connections
+from .http3_protocol import (
+    BodyStats,
+    DirectResponse,
+    Http3ServerProtocol,
+    MessageBody,
+    MessageTooLarge,
+    content_length,
+)
+from .resolver import CachingResolver
+from .sharding import WorkerPool
+from .tickets import EarlyDataReplayCache, SessionTicketStore
 
 LOGGER = logging.getLogger(__name__)
 
+CERTFILE = "certs/ssl.crt"
+KEYFILE = "certs/ssl.key"
+
 
 class Http3Transport(BaseInboundTransport):
     """Http3 Transport class."""
 
+    transport_scheme = "http3"
+    alpn_protocols = H3_ALPN
+
     def __init__(self, host: str, port: int, create_session, **kwargs) -> None:
         """Initialize an inbound HTTP/3 transport instance.
 
@@ -35,11 +67,49 @@ class Http3Transport(BaseInboundTransport):
             create_session: Method to create a new inbound session
 
         """
-        super().__init__("http3", create_session, **kwargs)
+        super().__init__(self.transport_scheme, create_session, **kwargs)
         self.host = host
         self.port = port
         self.coroutine: Optional[Coroutine[Any, Any, QuicServer]] = None
 
+        self.config = config = get_config(self.root_profile.context.settings)
+        self.udp_offload = config.udp_offload
+        self.session_tickets = SessionTicketStore(
+            max_entries=config.session_ticket_store_size,
+            path=config.session_ticket_file,
+        )
+        self.replay_cache = EarlyDataReplayCache(
+            window=config.early_data_replay_window,
+            max_entries=config.early_data_replay_cache_size,
+        )
+        self.body_stats = BodyStats()
+        self.admission = create_admission_queue(config)
+        self.workers = self.create_worker_pool()
+        self.duplex_connections = None
+        if config.duplex:
+            self.duplex_connections = get_duplex_connections(self.root_profile.context)
+            self.duplex_connections.set_message_handler(self.duplex_message_received)
+            self.resolver = CachingResolver(
+                ttl=config.dns_ttl, negative_ttl=config.dns_negative_ttl
+            )
+
+    def create_worker_pool(self) -> Optional[WorkerPool]:
+        """Create the worker processes serving this transport, if configured."""
+        if not self.config.inbound_workers:
+            return None
+        if self.config.duplex:
+            LOGGER.warning(
+                "Inbound workers do not register duplex connections, messages to "
+                "their clients are sent over new connections"
+            )
+        return WorkerPool(
+            self.config.inbound_workers,
+            message_handler=self.direct_message_handler,
+            app=self.make_application(),
+            datagram_handler=self.datagram_received,
+            session_tickets=self.session_tickets,
+        )
+
     def make_application(self) -> Starlette:
         """Construct the starlette application."""
         return Starlette(
@@ -51,7 +121,34 @@ class Http3Transport(BaseInboundTransport):
 
     def create_protocol(self, *args, **kwargs):
         app = self.make_application()
-        protocol = Http3ServerProtocol(*args, **kwargs)
+        protocol = Http3ServerProtocol(
+            *args,
+            qpack_max_table_capacity=self.config.qpack_max_table_capacity,
+            qpack_blocked_streams=self.config.qpack_blocked_streams,
+            **kwargs,
+        )
+        if self.config.max_datagram_frame_size:
+            protocol.set_datagram_handler(self.datagram_received)
+        if self.duplex_connections is not None:
+            protocol.set_endpoint_handler(self.endpoint_announced)
+        autotune_receive_windows(self.config, protocol._quic)
+        discover_path_mtu(self.config, protocol._quic)
+        reduce_ack_frequency(self.config, protocol._quic)
+        validate_migrated_paths(self.config, protocol._quic)
+        protocol.stream_scheduler = prioritize_streams(self.config, protocol._quic)
+        protocol.max_message_size = self.max_message_size
+        protocol.max_preallocated_size = self.config.max_preallocated_size
+        protocol.body_stats = self.body_stats
+        protocol.admission = self.admission
+        limit_stream_credit(
+            self.config,
+            protocol._quic,
+            self.admission,
+            in_progress=lambda: protocol.active_handlers,
+            wake=protocol.transmit,
+        )
+        if self.config.direct_message_path:
+            protocol.set_message_handler(self.direct_message_handler)
         protocol.set_app(app)
         return protocol
 
@@ -62,31 +159,72 @@ class Http3Transport(BaseInboundTransport):
             InboundTransportSetupError: If there was an error starting the webserver
 
         """
-        configuration = QuicConfiguration(
-            alpn_protocols=H3_ALPN,
-            max_datagram_frame_size=65536,
+        self.session_tickets.load()
+        if self.workers is not None:
+            try:
+                await self.workers.start(
+                    self.host,
+                    self.port,
+                    self.config,
+                    alpn_protocols=self.alpn_protocols,
+                    max_message_size=self.max_message_size,
+                    certfile=CERTFILE,
+                    keyfile=KEYFILE,
+                )
+            except OSError as exc:
+                raise InboundTransportSetupError(
+                    "Unable to start webserver with host "
+                    + f"'{self.host}' and port '{self.port}': {exc}\n"
+                )
+            return
+
+        configuration = create_quic_configuration(
+            self.config,
+            alpn_protocols=self.alpn_protocols,
             is_client=False,
             # quic_logger=QuicFileLogger("logs")
         )
 
-        configuration.load_cert_chain("certs/ssl.crt", "certs/ssl.key")
+        configuration.load_cert_chain(CERTFILE, KEYFILE)
 
         try:
-            self.coroutine = await serve(
+            self.coroutine = await (udp.serve if self.udp_offload else serve)(
                 self.host,
                 self.port,
                 configuration=configuration,
                 create_protocol=self.create_protocol,
+                session_ticket_fetcher=self.session_tickets.pop,
+                session_ticket_handler=self.session_tickets.add,
             )
         except OSError:
             raise InboundTransportSetupError(
                 "Unable to start webserver with host "
                 + f"'{self.host}' and port '{self.port}'\n"
             )
+        if self.config.path_mtu_discovery:
+            udp.set_dont_fragment(self.coroutine._transport.get_extra_info("socket"))
 
     async def stop(self) -> None:
         """Stop this transport."""
-        self.coroutine.close()
+        if self.workers is not None:
+            await self.workers.stop()
+        else:
+            LOGGER.debug("Request body stats: %s", self.body_stats.as_dict())
+            LOGGER.debug("Open requests per connection: %s", self.active_handlers())
+            if self.admission is not None:
+                LOGGER.debug("Admission stats: %s", self.admission.stats.as_dict())
+            self.coroutine.close()
+        await self.session_tickets.flush()
+        self.session_tickets.save()
+
+    def active_handlers(self) -> Dict[Tuple, int]:
+        """Return the number of open requests of each connection, by client."""
+        protocols = set(self.coroutine._protocols.values()) if self.coroutine else ()
+        return {
+            protocol._quic._network_paths[0].addr: protocol.active_handlers
+            for protocol in protocols
+            if isinstance(protocol, Http3ServerProtocol)
+        }
 
     async def inbound_message_handler(self, request: Request):
         """Message handler for inbound messages.
@@ -98,19 +236,98 @@ class Http3Transport(BaseInboundTransport):
             The web response
 
         """
-        body = await request.body()
-
+        try:
+            body = MessageBody(
+                content_length(request.scope["headers"]),
+                max_size=self.max_message_size,
+                preallocate=self.config.max_preallocated_size,
+                stats=self.body_stats,
+            )
+        except MessageTooLarge:
+            return Response(status_code=413)
         client_info = {"host": request.url.netloc, "remote": request.client.host}
 
+        try:
+            try:
+                async for chunk in request.stream():
+                    body.feed(chunk)
+            except (MessageTooLarge, ClientDisconnect):
+                # the transport has already answered
+                return Response(status_code=413)
+            message = body.getvalue()
+            self.body_stats.messages += 1
+
+            try:
+                status, content, content_type = await self.receive_message(
+                    message, request.scope.get("early_data"), client_info
+                )
+            except (MessageParseError, WireFormatParseError):
+                raise web.HTTPBadRequest()
+        finally:
+            body.release()
+
+        return Response(
+            content=content,
+            status_code=status,
+            headers={"content-type": content_type} if content_type else None,
+        )
+
+    async def direct_message_handler(self, body: bytes, scope: Dict) -> DirectResponse:
+        """Message handler for inbound messages, without the ASGI application.
+
+        Args:
+            body: the request body
+            scope: connection details of the request stream
+
+        Returns:
+            The response status, headers and body
+
+        """
+        client_info = {"host": scope["authority"], "remote": scope["client"][0]}
+
+        try:
+            status, content, content_type = await self.receive_message(
+                body, scope["early_data"], client_info
+            )
+        except (MessageParseError, WireFormatParseError):
+            return 400, [], b""
+
+        headers = []
+        if content_type:
+            headers.append((b"content-type", content_type.encode()))
+        if isinstance(content, str):
+            content = content.encode()
+        return status, headers, content or b""
+
+    async def receive_message(
+        self, body: bytes, early_data: bool, client_info: Dict
+    ) -> Tuple[int, Optional[Union[bytes, str]], Optional[str]]:
+        """Hand an inbound message to a new session.
+
+        Args:
+            body: the message
+            early_data: whether the message arrived in 0-RTT data
+            client_info: host and remote address for the session
+
+        Returns:
+            The response status, the direct response if any and its content type
+
+        Raises:
+            MessageParseError: if the message cannot be parsed
+            WireFormatParseError: if the message cannot be unpacked
+
+        """
+        if early_data and not self.replay_cache.check(body):
+            # possibly replayed 0-RTT request, have the client retry after the
+            # handshake (RFC 8470)
+            return 425, None, None
+
         session = await self.create_session(
             accept_undelivered=True, can_respond=True, client_info=client_info
         )
 
         async with session:
-            try:
-                inbound = await session.receive(body)
-            except (MessageParseError, WireFormatParseError):
-                raise web.HTTPBadRequest()
+            inbound = await session.receive(body)
 
             if inbound.receipt.direct_response_requested:
                 # Wait for the message to be processed. Only send a response if a response
@@ -126,26 +343,86 @@ class Http3Transport(BaseInboundTransport):
 
                 if response:
                     if isinstance(response, bytes):
-                        return Response(
-                            content=response,
-                            status_code=200,
-                            headers={
-                                "content-type": (
-                                    DIDCOMM_V1_MIME_TYPE
-                                    if session.profile.settings.get(
-                                        "emit_new_didcomm_mime_type"
-                                    )
-                                    else DIDCOMM_V0_MIME_TYPE
-                                )
-                            },
+                        content_type = (
+                            DIDCOMM_V1_MIME_TYPE
+                            if session.profile.settings.get(
+                                "emit_new_didcomm_mime_type"
+                            )
+                            else DIDCOMM_V0_MIME_TYPE
                         )
                     else:
-                        return Response(
-                            content=response,
-                            status_code=200,
-                            headers={"content-type": "application/json"},
-                        )
-        return Response(status_code=200)
+                        content_type = "application/json"
+                    return 200, response, content_type
+        return 200, None, None
+
+    def datagram_received(self, data: bytes, client: Tuple) -> None:
+        """Handle a message received in a DATAGRAM frame."""
+        asyncio.ensure_future(self.inbound_oneway_handler(data, client, "datagram"))
+
+    def duplex_message_received(self, data: bytes, peer: Tuple) -> None:
+        """Handle a message sent back over an outbound connection."""
+        asyncio.ensure_future(self.inbound_oneway_handler(data, peer, "message"))
+
+    async def inbound_oneway_handler(self, data: bytes, client: Tuple, kind: str):
+        """Message handler for messages that cannot be answered directly.
+
+        These are messages received in QUIC DATAGRAM frames, and messages a
+        peer sent back over a connection this agent opened. There is no
+        response channel, and undecodable messages are dropped.
+
+        Args:
+            data: the message payload
+            client: address of the sender
+            kind: what carried the message, for logging
+
+        """
+        client_info = {"host": f"{self.host}:{self.port}", "remote": client[0]}
+
+        session = await self.create_session(
+            accept_undelivered=False, can_respond=False, client_info=client_info
+        )
+
+        async with session:
+            try:
+                await session.receive(data)
+            except (MessageParseError, WireFormatParseError):
+                LOGGER.warning("Dropping undecodable %s from %s", kind, client[0])
+
+    def endpoint_announced(self, endpoint: str, protocol: Http3ServerProtocol):
+        """Register the connection of a client that announced its endpoint."""
+        asyncio.ensure_future(self.register_duplex_connection(endpoint, protocol))
+
+    async def register_duplex_connection(
+        self, endpoint: str, protocol: Http3ServerProtocol
+    ):
+        """Make the connection available to send messages to `endpoint`.
+
+        Unless disabled, the endpoint must resolve to the address the
+        connection comes from, so that a client cannot receive the messages
+        meant for another agent. Only the IP address is checked: another agent
+        behind the same address, e.g. the same NAT or host, can still claim the
+        endpoint. The messages stay encrypted for their recipient's keys, so it
+        can delay or drop them but not read them.
+        """
+        if self.config.duplex_verify_address:
+            parsed = urlparse(endpoint)
+            peer = ipaddress.ip_address(protocol._quic._network_paths[0].addr[0])
+            if isinstance(peer, ipaddress.IPv6Address) and peer.ipv4_mapped:
+                peer = peer.ipv4_mapped
+            addresses = []
+            try:
+                if parsed.hostname:
+                    addresses = await self.resolver.resolve(
+                        parsed.hostname, parsed.port or 443
+                    )
+            except (OSError, ValueError):
+                pass
+            if not any(ipaddress.ip_address(addr[0]) == peer for _, addr in addresses):
+                LOGGER.debug(
+                    "Not reusing connection from %s for endpoint %s", peer, endpoint
+                )
+                return
+        self.duplex_connections.register(endpoint, protocol)
 
     async def invite_message_handler(self, request: Request):
         """Message handler for invites.
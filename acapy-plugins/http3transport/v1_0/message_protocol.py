@@ -0,0 +1,278 @@
+"""DIDComm messages over plain QUIC streams.
+
+Every message is sent on a bidirectional stream of its own, as a single frame
+consisting of the payload length as a QUIC variable-length integer followed by
+the payload, and the stream is finished. The receiver answers on the same
+stream with a frame holding the direct response, with an empty frame if there
+is none, or resets the stream with one of the `ErrorCode`s.
+"""
+
+import asyncio
+import logging
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from aioquic.asyncio import QuicConnectionProtocol
+from aioquic.buffer import Buffer, BufferReadError, UINT_VAR_MAX_SIZE
+from aioquic.quic.connection import stream_is_unidirectional
+from aioquic.quic.events import (
+    ConnectionTerminated,
+    DatagramFrameReceived,
+    QuicEvent,
+    StreamDataReceived,
+    StreamReset,
+)
+
+from .admission import AdmissionQueue
+from .quic_client import QuicClient
+from .udp import BatchedTransmitMixin
+
+LOGGER = logging.getLogger(__name__)
+
+MESSAGE_ALPN = ["didcomm"]
+
+
+class ErrorCode(IntEnum):
+    """Application error codes of the message protocol."""
+    NO_ERROR = 0x0
+    FRAME_ERROR = 0x1
+    MESSAGE_ERROR = 0x2
+    EARLY_DATA_REJECTED = 0x3
+    INTERNAL_ERROR = 0x4
+
+
+class MessageRejected(Exception):
+    """The receiver reset the stream of a message."""
+
+    def __init__(self, error_code: int) -> None:
+        """Initialize a `MessageRejected` instance."""
+        super().__init__(f"Message rejected with error code {error_code}")
+        self.error_code = error_code
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prefix `payload` with its length."""
+    buf = Buffer(capacity=UINT_VAR_MAX_SIZE)
+    buf.push_uint_var(len(payload))
+    return buf.data + payload
+
+
+class FrameDecoder:
+    """Collects the single frame sent on a stream.
+
+    Frames longer than `max_size` are refused as soon as their length is known,
+    0 for no limit.
+    """
+
+    def __init__(self, max_size: int = 0) -> None:
+        """Initialize a `FrameDecoder` instance."""
+        self.max_size = max_size
+        self._buffer = bytearray()
+        self._length: Optional[int] = None
+
+    def feed(self, data: bytes) -> None:
+        """Add received stream data."""
+        self._buffer += data
+        if self._length is None and self._buffer:
+            buf = Buffer(data=bytes(self._buffer[:UINT_VAR_MAX_SIZE]))
+            try:
+                self._length = buf.pull_uint_var()
+            except BufferReadError:
+                return
+            del self._buffer[: buf.tell()]
+            if self.max_size and self._length > self.max_size:
+                raise ValueError("Frame too large")
+        if self._length is not None and len(self._buffer) > self._length:
+            raise ValueError("Trailing data after frame")
+
+    @property
+    def frame(self) -> Optional[bytes]:
+        """The payload once the frame is complete, otherwise None."""
+        if self._length is None or len(self._buffer) < self._length:
+            return None
+        return bytes(self._buffer)
+
+
+class MessageClient(QuicClient):
+    """Client connection sending DIDComm messages on QUIC streams."""
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize a `MessageClient` instance."""
+        super().__init__(*args, **kwargs)
+        self._responses: Dict[int, FrameDecoder] = {}
+        self._response_waiter: Dict[int, asyncio.Future[bytes]] = {}
+
+    @property
+    def pending_requests(self) -> int:
+        """The number of messages waiting for a response."""
+        return len(self._response_waiter)
+
+    async def send_message(self, payload: bytes) -> bytes:
+        """Send `payload` and return the response, empty if there is none."""
+        stream_id = self._quic.get_next_available_stream_id()
+        self._quic.send_stream_data(stream_id, encode_frame(payload), end_stream=True)
+
+        waiter = self._loop.create_future()
+        self._responses[stream_id] = FrameDecoder()
+        self._response_waiter[stream_id] = waiter
+        self.queue_transmit(len(payload))
+
+        return await asyncio.shield(waiter)
+
+    def quic_event_received(self, event: QuicEvent) -> None:
+        """Collect responses and complete the messages they answer."""
+        if isinstance(event, StreamDataReceived):
+            decoder = self._responses.get(event.stream_id)
+            if decoder is None:
+                return
+            try:
+                decoder.feed(event.data)
+            except ValueError:
+                self._abort_request(
+                    event.stream_id, MessageRejected(ErrorCode.FRAME_ERROR)
+                )
+                return
+            if event.end_stream:
+                frame = decoder.frame
+                if frame is None:
+                    self._abort_request(
+                        event.stream_id, MessageRejected(ErrorCode.FRAME_ERROR)
+                    )
+                    return
+                del self._responses[event.stream_id]
+                waiter = self._response_waiter.pop(event.stream_id)
+                if not waiter.done():
+                    waiter.set_result(frame)
+        elif isinstance(event, StreamReset):
+            self._abort_request(event.stream_id, MessageRejected(event.error_code))
+        elif isinstance(event, ConnectionTerminated):
+            self.abort_requests(
+                ConnectionError(event.reason_phrase or "Connection closed")
+            )
+
+    def abort_requests(self, exc: Exception) -> None:
+        """Fail all pending messages with `exc`."""
+        for stream_id in list(self._response_waiter):
+            self._abort_request(stream_id, self.request_error(stream_id, exc))
+        super().abort_requests(exc)
+
+    def _abort_request(self, stream_id: int, exc: Exception) -> None:
+        self._responses.pop(stream_id, None)
+        waiter = self._response_waiter.pop(stream_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(exc)
+
+
+class MessageServerProtocol(BatchedTransmitMixin, QuicConnectionProtocol):
+    """Server connection receiving DIDComm messages on QUIC streams."""
+    # messages above this size are refused, 0 for no limit
+    max_message_size = 0
+    # runs the messages of all connections, if set
+    admission: Optional[AdmissionQueue] = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize a `MessageServerProtocol` instance."""
+        super().__init__(*args, **kwargs)
+        # streams that were rejected before they ended map to None
+        self._requests: Dict[int, Optional[FrameDecoder]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.message_handler: Optional[
+            Callable[[bytes, Dict], Awaitable[Optional[bytes]]]
+        ] = None
+        self.datagram_handler: Optional[Callable[[bytes, Tuple], None]] = None
+
+    @property
+    def path_mtu(self) -> int:
+        """The maximum size of the datagrams sent on this connection."""
+        return self._quic._max_datagram_size
+
+    @property
+    def client(self) -> Tuple:
+        """The address of the client."""
+        client_addr = self._quic._network_paths[0].addr
+        return (client_addr[0], client_addr[1])
+
+    @property
+    def active_handlers(self) -> int:
+        """The number of messages currently held by this connection."""
+        return len(self._requests) + len(self._tasks)
+
+    def quic_event_received(self, event: QuicEvent) -> None:
+        """Collect messages and handle them once complete."""
+        if isinstance(event, StreamDataReceived):
+            if stream_is_unidirectional(event.stream_id):
+                return
+            if event.stream_id not in self._requests:
+                self._requests[event.stream_id] = FrameDecoder(self.max_message_size)
+            decoder = self._requests[event.stream_id]
+            if decoder is not None:
+                try:
+                    decoder.feed(event.data)
+                except ValueError:
+                    self._reject(event.stream_id, ErrorCode.FRAME_ERROR)
+                    decoder = None
+            if event.end_stream:
+                del self._requests[event.stream_id]
+                if decoder is None:
+                    return
+                frame = decoder.frame
+                if frame is None:
+                    self._reject(event.stream_id, ErrorCode.FRAME_ERROR)
+                    return
+                scope = {
+                    "client": self.client,
+                    "early_data": not self._quic._handshake_complete,
+                }
+                self._tasks[event.stream_id] = asyncio.ensure_future(
+                    self._handle(event.stream_id, frame, scope)
+                )
+        elif isinstance(event, StreamReset):
+            self._requests.pop(event.stream_id, None)
+        elif isinstance(event, DatagramFrameReceived):
+            if self.datagram_handler is not None:
+                self.datagram_handler(event.data, self.client)
+        elif isinstance(event, ConnectionTerminated):
+            LOGGER.debug(
+                "Connection from %s ended with path MTU %d", self.client[0], self.path_mtu
+            )
+            self._requests.clear()
+            for task in self._tasks.values():
+                task.cancel()
+
+    def set_message_handler(
+        self, handler: Callable[[bytes, Dict], Awaitable[Optional[bytes]]]
+    ):
+        """Set the handler of received messages."""
+        self.message_handler = handler
+
+    def set_datagram_handler(self, handler: Callable[[bytes, Tuple], None]):
+        """Set the handler of DATAGRAM frames."""
+        self.datagram_handler = handler
+
+    async def _handle(self, stream_id: int, message: bytes, scope: Dict) -> None:
+        try:
+            if self.admission is not None:
+                async with self.admission.slot():
+                    response = await self.message_handler(message, scope)
+            else:
+                response = await self.message_handler(message, scope)
+        except MessageRejected as exc:
+            self._reject(stream_id, exc.error_code)
+            return
+        except Exception:
+            LOGGER.exception("Error handling message on stream %d", stream_id)
+            self._reject(stream_id, ErrorCode.INTERNAL_ERROR)
+            return
+        finally:
+            self._tasks.pop(stream_id, None)
+        self._quic.send_stream_data(
+            stream_id, encode_frame(response or b""), end_stream=True
+        )
+        self.transmit()
+
+    def _reject(self, stream_id: int, error_code: int) -> None:
+        if stream_id in self._requests:
+            # the rest of the message is of no use
+            self._requests[stream_id] = None
+            self._quic.stop_stream(stream_id, error_code)
+        self._quic.reset_stream(stream_id, error_code)
+        self.transmit()
@@ -0,0 +1,83 @@
+"""Path validation for migrated QUIC connections.
+
+When a client shows up from a new address, aioquic moves the connection to the
+new path and sends a single PATH_CHALLENGE. Until the matching PATH_RESPONSE
+arrives, no more than three times the bytes received on the path may be sent on
+it. Neither frame is retransmitted, so if one of them is lost, which is likely
+while a transfer is in flight, the connection stays limited for good. Here the
+challenge is repeated with exponential backoff, starting at the probe timeout,
+until the path is validated.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aioquic.quic.connection import NetworkAddress, QuicConnection
+
+LOGGER = logging.getLogger(__name__)
+
+# challenges sent on a path before giving up on validating it
+MAX_PATH_CHALLENGES = 8
+
+
+class PathValidation:
+    """Retransmits PATH_CHALLENGE frames of `quic` until paths are validated."""
+
+    def __init__(self, quic: QuicConnection) -> None:
+        """Initialize a `PathValidation` instance."""
+        self._quic = quic
+        # challenged path -> (challenges sent, time of the last one)
+        self._challenges: Dict[NetworkAddress, Tuple[int, float]] = {}
+
+        self._datagrams_to_send = quic.datagrams_to_send
+        self._get_timer = quic.get_timer
+        quic.datagrams_to_send = self.datagrams_to_send
+        quic.get_timer = self.get_timer
+
+    def datagrams_to_send(self, now: float) -> List[Tuple[bytes, NetworkAddress]]:
+        """Return the datagrams to send, repeating unanswered path challenges."""
+        quic = self._quic
+        if not quic._network_paths:
+            return self._datagrams_to_send(now=now)
+        network_path = quic._network_paths[0]
+        if network_path.is_validated:
+            self._challenges.clear()
+            return self._datagrams_to_send(now=now)
+
+        count, _ = self._challenges.get(network_path.addr, (0, None))
+        retry_at = self._retry_at()
+        if retry_at is not None and now >= retry_at:
+            # have aioquic send a fresh challenge
+            LOGGER.debug(
+                "Repeating path challenge for %s on %s",
+                network_path.addr,
+                self._quic.host_cid.hex(),
+            )
+            network_path.local_challenge_sent = False
+        elif count:
+            return self._datagrams_to_send(now=now)
+
+        datagrams = self._datagrams_to_send(now=now)
+        if network_path.local_challenge_sent:
+            self._challenges[network_path.addr] = (count + 1, now)
+        return datagrams
+
+    def get_timer(self) -> Optional[float]:
+        """Return the next timer, including the next path challenge."""
+        timer_at = self._get_timer()
+        retry_at = self._retry_at()
+        if retry_at is not None and (timer_at is None or retry_at < timer_at):
+            timer_at = retry_at
+        return timer_at
+
+    def _retry_at(self) -> Optional[float]:
+        quic = self._quic
+        if not quic._network_paths:
+            return None
+        network_path = quic._network_paths[0]
+        if network_path.is_validated:
+            return None
+        count, sent_at = self._challenges.get(network_path.addr, (0, None))
+        if count == 0 or count >= MAX_PATH_CHALLENGES:
+            return None
+        return sent_at + quic._loss.get_probe_timeout() * 2 ** (count - 1)
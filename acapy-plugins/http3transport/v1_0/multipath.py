@@ -0,0 +1,277 @@
+"""Multipath connections spread over several local addresses.
+
+aioquic implements neither per-path packet number spaces nor the other parts of
+the multipath QUIC draft, so a multipath connection is made up of one QUIC
+connection, a subflow, per local address instead, much like the subflows of
+multipath TCP. Requests are scheduled on the subflow with the lowest expected
+completion time. Subflows are probed with PINGs; when one stops answering, its
+outstanding requests that were not sent in full yet are sent again on the
+remaining subflows, and the local address is dialled again periodically until
+it works once more. Requests the peer may have received already fail with
+RequestMaybeDelivered instead, so that a message is never delivered twice.
+"""
+
+import asyncio
+import logging
+from functools import partial
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from .http3_client import Http3Client
+from .quic_client import RequestMaybeDelivered
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Subflow:
+    """A single-path connection that is part of a `MultipathClient`."""
+
+    def __init__(self, local_host: str, client: Http3Client) -> None:
+        """Initialize a `Subflow` instance."""
+        self.local_host = local_host
+        self.client = client
+        self.requests = 0
+
+    @property
+    def is_usable(self) -> bool:
+        """Whether the subflow can take requests."""
+        return not self.client.is_closing
+
+    @property
+    def expected_delay(self) -> float:
+        """Time a new request is expected to take on this subflow."""
+        quic = self.client._quic
+        loss = quic._loss
+        if loss._rtt_initialized:
+            rtt = loss._rtt_smoothed
+        else:
+            rtt = quic.configuration.initial_rtt
+        return rtt * (self.requests + 1)
+
+
+class MultipathClient:
+    """A connection to one peer over several local addresses.
+
+    Provides the parts of the `Http3Client` interface used by the connection
+    pool. `connect` is called with a local address and returns a connected
+    client bound to it.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[str], Awaitable[Http3Client]],
+        local_hosts: Sequence[str],
+        *,
+        probe_interval: float = 1.0,
+        probe_timeout: float = 3.0,
+        reconnect_interval: float = 5.0,
+    ) -> None:
+        """Initialize a `MultipathClient` instance."""
+        self._connect = connect
+        self.local_hosts = list(local_hosts)
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.reconnect_interval = reconnect_interval
+
+        self.subflows: List[Subflow] = []
+        self._dialing: Dict[str, asyncio.Task] = {}
+        self._last_dial: Dict[str, float] = {}
+        self._monitor: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+        self.failovers = 0
+
+    async def connect(self) -> "MultipathClient":
+        """Open a subflow on every local address, succeeding if any does."""
+        results = await asyncio.gather(
+            *(self._dial(local_host) for local_host in self.local_hosts),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if not self.subflows:
+            raise errors[0]
+        for local_host, result in zip(self.local_hosts, results):
+            if isinstance(result, BaseException):
+                LOGGER.debug("Unable to connect from %s: %s", local_host, result)
+        self._monitor = asyncio.ensure_future(self._probe())
+        return self
+
+    @property
+    def is_closing(self) -> bool:
+        """Whether the client is closing or closed."""
+        return self._closed.is_set()
+
+    @property
+    def pending_requests(self) -> int:
+        """The number of requests in progress on all subflows."""
+        return sum(subflow.requests for subflow in self.subflows)
+
+    @property
+    def path_mtu(self) -> int:
+        """The smallest path MTU of the subflows."""
+        return min(subflow.client.path_mtu for subflow in self.subflows)
+
+    async def send_http_request(
+        self,
+        url: str,
+        method: str = "GET",
+        data: Optional[bytes] = None,
+        headers: Optional[Dict] = None,
+    ) -> Tuple[bytearray, Dict[str, str]]:
+        """Send an HTTP request on the best subflow."""
+        return await self._request(
+            lambda client: client.send_http_request(url, method, data, headers)
+        )
+
+    async def send_message(self, payload: bytes) -> bytes:
+        """Send a message on the best subflow and return the response."""
+        return await self._request(lambda client: client.send_message(payload))
+
+    async def _request(self, send: Callable[[Http3Client], Awaitable[T]]) -> T:
+        while True:
+            subflow = self._select()
+            if subflow is None:
+                raise ConnectionError("No usable path")
+
+            subflow.requests += 1
+            try:
+                return await send(subflow.client)
+            except ConnectionError as exc:
+                if not subflow.client.is_closing:
+                    raise
+                self._fail(subflow)
+                if isinstance(exc, RequestMaybeDelivered):
+                    raise
+            finally:
+                subflow.requests -= 1
+            # the path went away underneath the request, send it again
+            self.failovers += 1
+            LOGGER.debug(
+                "Resending request after losing path from %s", subflow.local_host
+            )
+
+    def send_datagram(self, data: bytes) -> bool:
+        """Send `data` in a DATAGRAM frame on the best subflow."""
+        subflow = self._select()
+        return subflow is not None and subflow.client.send_datagram(data)
+
+    async def ping(self) -> None:
+        """Wait until the peer answers on any of the subflows."""
+        pings = [
+            asyncio.ensure_future(subflow.client.ping())
+            for subflow in self.subflows
+            if subflow.is_usable
+        ]
+        try:
+            for ping in asyncio.as_completed(pings):
+                try:
+                    await ping
+                    return
+                except ConnectionError:
+                    pass
+        finally:
+            for ping in pings:
+                ping.cancel()
+        raise ConnectionError("No usable path")
+
+    def close(self) -> None:
+        """Close all subflows."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for task in self._dialing.values():
+            task.cancel()
+        for subflow in self.subflows:
+            subflow.client.close()
+        self._closed.set()
+
+    async def wait_closed(self) -> None:
+        """Wait until all subflows are closed."""
+        await self._closed.wait()
+        await asyncio.gather(
+            *(subflow.client.wait_closed() for subflow in self.subflows)
+        )
+
+    def close_transport(self) -> None:
+        """Close the transports of all subflows."""
+        for subflow in self.subflows:
+            subflow.client.close_transport()
+
+    def _select(self) -> Optional[Subflow]:
+        return min(
+            (subflow for subflow in self.subflows if subflow.is_usable),
+            key=lambda subflow: subflow.expected_delay,
+            default=None,
+        )
+
+    async def _dial(self, local_host: str) -> Subflow:
+        self._last_dial[local_host] = asyncio.get_event_loop().time()
+        client = await self._connect(local_host)
+        subflow = Subflow(local_host, client)
+        if self.is_closing:
+            client.close()
+            client.close_transport()
+        else:
+            LOGGER.debug("Subflow from %s established", local_host)
+            self.subflows.append(subflow)
+        return subflow
+
+    def _fail(self, subflow: Subflow) -> None:
+        if subflow not in self.subflows:
+            return
+        LOGGER.info("Lost path from %s", subflow.local_host)
+        self.subflows.remove(subflow)
+        client = subflow.client
+        # outstanding requests are resent on the other subflows right away,
+        # rather than once the connection has timed out
+        client.abort_requests(ConnectionError(f"Lost path from {subflow.local_host}"))
+        client.close()
+        client.close_transport()
+        if not self.subflows and not self._dialing:
+            self.close()
+
+    async def _probe(self) -> None:
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            await asyncio.gather(
+                *(self._probe_subflow(subflow) for subflow in list(self.subflows))
+            )
+            self._redial()
+
+    async def _probe_subflow(self, subflow: Subflow) -> None:
+        try:
+            await asyncio.wait_for(subflow.client.ping(), self.probe_timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            self._fail(subflow)
+
+    def _redial(self) -> None:
+        now = asyncio.get_event_loop().time()
+        connected = {subflow.local_host for subflow in self.subflows}
+        for local_host in self.local_hosts:
+            if (
+                local_host in connected
+                or local_host in self._dialing
+                or now - self._last_dial[local_host] < self.reconnect_interval
+            ):
+                continue
+            task = asyncio.ensure_future(self._dial(local_host))
+            task.add_done_callback(partial(self._dialed, local_host))
+            self._dialing[local_host] = task
+
+    def _dialed(self, local_host: str, task: asyncio.Task) -> None:
+        del self._dialing[local_host]
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.debug(
+                "Unable to reconnect from %s: %s", local_host, task.exception()
+            )
+            if not self.subflows and not self._dialing:
+                self.close()
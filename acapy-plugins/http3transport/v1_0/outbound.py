@@ -1,13 +1,14 @@
 """Http3 outbound transport."""
 import asyncio
+import ipaddress
 import logging
 import socket
 import ssl
-import time
-from typing import Union, cast, Tuple, Dict
+from functools import partial
+from typing import Awaitable, Callable, Optional, TypeVar, Union, cast
 from urllib.parse import urlparse
 
-from aioquic.asyncio import QuicConnectionProtocol, connect
+from aioquic.asyncio import connect
 from aioquic.h3.connection import H3_ALPN
 from aioquic.quic.configuration import QuicConfiguration
 from aioquic.quic.connection import QuicConnection
@@ -16,30 +17,116 @@ from aries_cloudagent.transport.outbound.base import BaseOutboundTransport, Outb
 from aries_cloudagent.transport.wire_format import DIDCOMM_V0_MIME_TYPE, DIDCOMM_V1_MIME_TYPE
 
 from .http3_client import Http3Client
-from .config import get_config
+from . import congestion  # noqa: F401 registers the "bbr" algorithm
+from . import udp
+from .config import (
+    autotune_receive_windows,
+    create_quic_configuration,
+    discover_path_mtu,
+    get_config,
+    prioritize_streams,
+    reduce_ack_frequency,
+)
+from .duplex import get_duplex_connections
+from .endpoint import SharedEndpoints
+from .h3connection import ENDPOINT_HEADER
+from .multipath import MultipathClient
+from .pool import Http3ConnectionPool
+from .priority import PRIORITY_HEADER, Priority
+from .quic_client import QuicClient, RequestMaybeDelivered, RequestReset
+from .resolver import CachingResolver, happy_eyeballs, source_address
+from .tickets import SessionTicketCache
+
+T = TypeVar("T")
+
+# metadata key with which a sender marks a message as loss tolerant, so that it
+# may be sent as a QUIC DATAGRAM frame
+DATAGRAM_METADATA = "x-didcomm-datagram"
 
 
 class Http3Transport(BaseOutboundTransport):
     """Http3 outbound transport class."""
 
     schemes = ("http3",)
+    alpn_protocols = H3_ALPN
     is_external = False
 
     def __init__(self, **kwargs) -> None:
         """Initialize an `Http3Transport` instance."""
         super().__init__(**kwargs)
         self.logger = logging.getLogger(__name__)
-        self.open_connections: Dict[str, Tuple[Http3Client, float]] = {}
-        self.force_close = get_config(self.root_profile.context.settings).force_close
-        self.keepalive_timeout = get_config(self.root_profile.context.settings).keepalive_timeout
+        self.config = config = get_config(self.root_profile.context.settings)
+        self.force_close = config.force_close
+        self.keepalive_timeout = config.keepalive_timeout
+        self.early_data = config.early_data
+        self.happy_eyeballs_delay = config.happy_eyeballs_delay
+        self.udp_offload = config.udp_offload
+        self.connection_migration = config.connection_migration
+        self.migration_check_interval = config.migration_check_interval
+        self.multipath = config.multipath and bool(config.multipath_addresses)
+        self.datagram_delivery = config.datagram_delivery
+        self.datagram_max_message_size = config.datagram_max_message_size
+        self.duplex_connections = (
+            get_duplex_connections(self.root_profile.context)
+            if config.duplex
+            else None
+        )
+        self.shared_endpoints = (
+            SharedEndpoints(
+                config.shared_sockets,
+                udp_offload=config.udp_offload,
+                dont_fragment=config.path_mtu_discovery,
+            )
+            if config.shared_sockets
+            else None
+        )
+        self.resolver = CachingResolver(
+            ttl=config.dns_ttl, negative_ttl=config.dns_negative_ttl
+        )
+        self.session_tickets = SessionTicketCache(
+            ttl=config.session_ticket_ttl,
+            max_entries=config.session_ticket_cache_size,
+        )
+        self.pool = Http3ConnectionPool(
+            (
+                self.create_multipath_connection
+                if self.multipath
+                else self.create_connection
+            ),
+            limit=config.limit,
+            limit_per_host=config.limit_per_host,
+            max_streams_per_connection=config.max_streams_per_connection,
+            keepalive_timeout=config.keepalive_timeout,
+            ping_interval=config.ping_interval,
+        )
+        self.address_watcher: Optional[asyncio.Task] = None
 
     async def start(self):
         """Start the transport."""
+        if not self.force_close:
+            self.pool.start()
+            # shared sockets are bound to the wildcard address, the kernel
+            # picks their source address per datagram, and multipath subflows
+            # stay on the address they were opened from
+            if (
+                self.connection_migration
+                and not self.shared_endpoints
+                and not self.multipath
+            ):
+                self.address_watcher = asyncio.ensure_future(
+                    self.watch_local_addresses()
+                )
         return self
 
     async def stop(self):
         """Stop the transport."""
-        pass
+        self.logger.debug("Connection pool stats: %s", self.pool.stats.as_dict())
+        if self.address_watcher is not None:
+            self.address_watcher.cancel()
+            self.address_watcher = None
+        await self.pool.close()
+        if self.shared_endpoints:
+            self.shared_endpoints.close()
 
     async def handle_message(
         self,
@@ -60,6 +147,7 @@ class Http3Transport(BaseOutboundTransport):
         if not endpoint:
             raise OutboundTransportError("No endpoint provided")
         headers = metadata or {}
+        datagram = self.datagram_requested(payload, headers)
         if api_key is not None:
             headers["x-api-key"] = api_key
         if isinstance(payload, bytes):
@@ -69,6 +157,35 @@ class Http3Transport(BaseOutboundTransport):
                 headers["content-type"] = DIDCOMM_V0_MIME_TYPE
         else:
             headers["content-type"] = "application/json"
+        priority = self.message_priority(payload, headers)
+        if priority is not None:
+            headers[PRIORITY_HEADER] = str(priority)
+        if self.duplex_connections is not None:
+            # lets the peer send its messages back over our connection
+            own_endpoint = profile.settings.get("default_endpoint")
+            if own_endpoint and self.duplex_connections.accepts_messages:
+                headers[ENDPOINT_HEADER.decode()] = own_endpoint
+
+            protocol = self.duplex_connections.get(endpoint)
+            if protocol is not None:
+                self.logger.debug(
+                    "Sending to %s over its connection; Data: %s", endpoint, payload
+                )
+                try:
+                    delivered = protocol.send_message(
+                        payload.encode() if isinstance(payload, str) else payload,
+                        priority,
+                    )
+                    # the peer may be gone without us noticing until the idle timeout
+                    await asyncio.wait_for(delivered, self.config.idle_timeout)
+                except (ConnectionError, asyncio.TimeoutError) as exc:
+                    # the queue retries, on a new connection if this one is gone
+                    raise OutboundTransportError(
+                        f"Message over the connection of {endpoint} not acknowledged: "
+                        f"{exc!r}"
+                    )
+                self.pool.stats.duplex_messages += 1
+                return None
         self.logger.debug(
             "Posting to %s; Data: %s; Headers: %s", endpoint, payload, headers
         )
@@ -77,75 +194,327 @@ class Http3Transport(BaseOutboundTransport):
         host = parsed.hostname
         port = parsed.port
         
-        configuration = QuicConfiguration(
-            is_client=True,
-            alpn_protocols=H3_ALPN,
-            verify_mode=ssl.CERT_NONE,
-            server_name=host
-        )
-        
         if self.force_close:
             async with (connect(
                     host,
                     port,
-                    configuration=configuration,
-                    create_protocol=Http3Client,
+                    configuration=self.create_configuration(host),
+                    create_protocol=self.create_protocol,
+                    session_ticket_handler=self.session_tickets.add,
             ) as client):
                 client = cast(Http3Client, client)
 
                 headers["content-length"] = str(len(payload))
-                return await client.send_http_request(endpoint, "POST", payload, headers)
+                rsp = await client.send_http_request(endpoint, "POST", payload, headers)
+                self.check_response(rsp)
+                return rsp
         
-        client = await self.get_connection(endpoint, host, port, configuration)
+        if datagram and await self.send_datagram(host, port, payload):
+            return None
+
         headers["content-length"] = str(len(payload))
-        rsp = await client.send_http_request(endpoint, "POST", payload, headers)
-        
-        self.open_connections[endpoint] = (client, time.monotonic())
+        rsp = await self.send_with_retry(
+            lambda: self.send_pooled(host, port, endpoint, payload, headers)
+        )
+
+        self.check_response(rsp)
         return rsp
-    
-    async def get_connection(self, endpoint, host, port, configuration) -> Http3Client:
-        if endpoint in self.open_connections:
-            conn_tuple = self.open_connections[endpoint]
-            now = time.monotonic()
-            if now - conn_tuple[1] < self.keepalive_timeout:
-                return cast(Http3Client, conn_tuple[0])
-            else:
-                conn_tuple[0].close()
-                del self.open_connections[endpoint]
 
-        return cast(Http3Client, await self.create_connection(host, port, configuration))
+    async def send_with_retry(self, send: Callable[[], Awaitable[T]]) -> T:
+        """Run `send`, and once more if the pooled connection was lost.
 
-    async def create_connection(self, host, port, configuration):
-        loop = asyncio.get_event_loop()
-        local_host = "::"
+        A message that may have reached the peer is not sent again, so that it
+        is not delivered twice.
+        """
+        for attempt in range(2):
+            try:
+                return await send()
+            except RequestMaybeDelivered as exc:
+                raise OutboundTransportError(f"Connection lost after sending: {exc}")
+            except ConnectionError:
+                if attempt:
+                    raise
+                # the pooled connection died underneath us, retry once on a new one
+                self.pool.stats.retries += 1
+
+    async def send_pooled(self, host, port, endpoint, payload, headers):
+        async with self.pool.connection(host, port) as conn:
+            try:
+                rsp = await conn.client.send_http_request(
+                    endpoint, "POST", payload, headers
+                )
+                if rsp[1].get(":status") == "425":
+                    # early data refused, the handshake is complete by now
+                    rsp = await conn.client.send_http_request(
+                        endpoint, "POST", payload, headers
+                    )
+            except RequestReset as exc:
+                # only this request failed, the connection stays in the pool
+                raise OutboundTransportError(str(exc))
+            except ConnectionError:
+                if conn.client.is_closing:
+                    self.pool.discard(conn)
+                raise
+        return rsp
+
+    async def send_datagram(self, host, port, payload) -> bool:
+        """Send `payload` as a QUIC datagram, without delivery guarantee.
+
+        Returns False if the message does not fit into a datagram on the
+        pooled connection, and has to be sent on a stream instead.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode()
+        async with self.pool.connection(host, port) as conn:
+            sent = conn.client.send_datagram(payload)
+        if sent:
+            self.pool.stats.datagrams += 1
+        return sent
+
+    def datagram_requested(self, payload, headers) -> bool:
+        """Return whether to send `payload` as a DATAGRAM frame.
+
+        DATAGRAM frames are not retransmitted, so only messages their sender
+        marked with `DATAGRAM_METADATA` are sent this way, and only if they are
+        small enough. The marker is removed from `headers`.
+        """
+        requested = headers.pop(DATAGRAM_METADATA, False)
+        return (
+            self.datagram_delivery
+            and bool(requested)
+            and len(payload) <= self.datagram_max_message_size
+        )
+
+    def message_priority(self, payload, headers) -> Optional[Priority]:
+        """Return the priority to send `payload` with, None for the default.
+
+        The payload is encrypted, so apart from a priority passed in the
+        metadata, its size is all there is to tell a large file chunk from a
+        control message.
+        """
+        if PRIORITY_HEADER in headers:
+            return Priority.parse(headers[PRIORITY_HEADER])
+        if (
+            self.config.stream_priorities
+            and len(payload) >= self.config.bulk_message_size
+        ):
+            return Priority(self.config.bulk_message_urgency, incremental=True)
+        return None
+
+    def check_response(self, rsp):
+        _, rsp_headers = rsp
+        status = int(rsp_headers.get(":status", 0))
+        if status < 200 or status > 299:
+            raise OutboundTransportError(
+                f"Unexpected response status {status}"
+            )
+
+    def create_configuration(self, host, resume=True) -> QuicConfiguration:
+        """Create the QUIC configuration of a connection to `host`."""
+        return create_quic_configuration(
+            self.config,
+            is_client=True,
+            alpn_protocols=self.alpn_protocols,
+            verify_mode=ssl.CERT_NONE,
+            server_name=host,
+            session_ticket=self.session_tickets.take(host) if resume else None,
+        )
+
+    def create_protocol(self, *args, **kwargs) -> Http3Client:
+        """Create a client connection with the configured extensions."""
+        client = Http3Client(
+            *args,
+            qpack_max_table_capacity=self.config.qpack_max_table_capacity,
+            qpack_blocked_streams=self.config.qpack_blocked_streams,
+            **kwargs,
+        )
+        if self.duplex_connections is not None:
+            client.message_handler = self.duplex_connections.message_received
+        autotune_receive_windows(self.config, client._quic)
+        discover_path_mtu(self.config, client._quic)
+        reduce_ack_frequency(self.config, client._quic)
+        client.stream_scheduler = prioritize_streams(self.config, client._quic)
+        self.coalesce_transmits(client)
+        return client
 
-        # lookup remote address
-        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
-        addr = infos[0][4]
-        if len(addr) == 2:
-            addr = ("::ffff:" + addr[0], addr[1], 0, 0)
+    def coalesce_transmits(self, client: QuicClient) -> None:
+        """Have `client` send messages queued back to back together."""
+        client.coalescing = self.config.transmit_coalescing
+        client.coalescing_window = self.config.coalescing_window
+        client.coalescing_max_bytes = self.config.coalescing_max_bytes
+        client.stats = self.pool.stats
+
+    async def create_connection(self, host, port) -> Http3Client:
+        """Connect to `host`, racing its addresses."""
+        addresses = await self.resolver.resolve(host, port)
+
+        # prepare QUIC connection, resuming a previous session if possible
+        configuration = self.create_configuration(host)
+
+        # with a ticket allowing early data, requests go out as 0-RTT right away
+        ticket = configuration.session_ticket
+        if self.early_data and ticket is not None and ticket.max_early_data_size:
+            return await self.connect_address(
+                addresses[0], configuration, wait_connected=False
+            )
+
+        # every attempt has a configuration of its own, and only the first one
+        # resumes the session, so that the ticket is sent at most once
+        configurations = [configuration] + [
+            self.create_configuration(host, resume=False) for _ in addresses[1:]
+        ]
+        return await happy_eyeballs(
+            [
+                partial(self.connect_address, address, attempt_configuration)
+                for address, attempt_configuration in zip(addresses, configurations)
+            ],
+            delay=self.happy_eyeballs_delay,
+            close=self.close_connection,
+        )
+
+    async def create_multipath_connection(self, host, port) -> MultipathClient:
+        """Connect to `host` with a subflow from each local address."""
+        async def connect_subflow(local_host):
+            family = (
+                socket.AF_INET6
+                if ipaddress.ip_address(local_host).version == 6
+                else socket.AF_INET
+            )
+            addresses = [
+                address
+                for address in await self.resolver.resolve(host, port)
+                if address[0] == family
+            ]
+            if not addresses:
+                raise ConnectionError(
+                    f"No address of {host} reachable from {local_host}"
+                )
+            return await self.connect_address(
+                addresses[0], self.create_configuration(host), local_host=local_host
+            )
+
+        return await MultipathClient(
+            connect_subflow,
+            self.config.multipath_addresses,
+            probe_interval=self.config.multipath_probe_interval,
+            probe_timeout=self.config.multipath_probe_timeout,
+            reconnect_interval=self.config.multipath_reconnect_interval,
+        ).connect()
+
+    async def connect_address(
+        self, address, configuration, wait_connected=True, local_host=None
+    ) -> Http3Client:
+        """Connect to a single address of a host."""
+        family, addr = address
+        bind_local = local_host is not None
+        if not bind_local:
+            local_host = "::" if family == socket.AF_INET6 else "0.0.0.0"
+            if self.connection_migration:
+                # bind to the current source address, so that a change of
+                # network attachment shows up as a different local address
+                local_host = source_address(family, addr) or local_host
 
-        # prepare QUIC connection
         connection = QuicConnection(
             configuration=configuration,
+            session_ticket_handler=self.session_tickets.add,
         )
 
-        # explicitly enable IPv4/IPv6 dual stack
-        sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        if self.shared_endpoints and not bind_local:
+            transport, protocol = await self.shared_endpoints.create_endpoint(
+                partial(self.create_protocol, connection), family
+            )
+        else:
+            transport, protocol = await self.create_endpoint(
+                partial(self.create_protocol, connection), family, local_host
+            )
+
+        # connect
+        protocol = cast(Http3Client, protocol)
+        protocol.connect(addr)
+        if not wait_connected:
+            return protocol
+
+        try:
+            await protocol.wait_connected()
+        except BaseException:
+            # failed or lost the race against another address, let the server
+            # know rather than leaving it to time out the handshake
+            self.close_connection(protocol)
+            raise
+        return protocol
+
+    async def create_endpoint(self, protocol_factory, family, local_host):
+        """Create the UDP endpoint of a new connection."""
+        loop = asyncio.get_event_loop()
+        sock = socket.socket(family, socket.SOCK_DGRAM)
         completed = False
         try:
-            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-            sock.bind((local_host, 0, 0, 0))
+            sock.bind((local_host, 0))
+            if self.config.path_mtu_discovery:
+                udp.set_dont_fragment(sock)
             completed = True
         finally:
             if not completed:
                 sock.close()
-        # connect
-        transport, protocol = await loop.create_datagram_endpoint(
-            lambda: Http3Client(connection),
-            sock=sock,
+        create_datagram_endpoint = (
+            udp.create_datagram_endpoint
+            if self.udp_offload
+            else loop.create_datagram_endpoint
         )
-        protocol = cast(QuicConnectionProtocol, protocol)
-        protocol.connect(addr)
-        await protocol.wait_connected()
-        return protocol
+        return await create_datagram_endpoint(protocol_factory, sock=sock)
+
+    def close_connection(self, client: Http3Client):
+        """Close `client` and its transport."""
+        client.close()
+        client.close_transport()
+
+    async def watch_local_addresses(self):
+        """Migrate pooled connections whose source address has changed."""
+        while True:
+            await asyncio.sleep(self.migration_check_interval)
+            for conn in list(self.pool):
+                client = conn.client
+                if client.is_closing or not client._quic._handshake_complete:
+                    continue
+                sockname = client._transport.get_extra_info("sockname")
+                family = client._transport.get_extra_info("socket").family
+                local_host = source_address(
+                    family, client._quic._network_paths[0].addr
+                )
+                if local_host is not None and local_host != sockname[0]:
+                    self.logger.info(
+                        "Local address for %s:%d changed from %s to %s",
+                        *conn.authority,
+                        sockname[0],
+                        local_host,
+                    )
+                    if not await self.migrate_connection(client, local_host):
+                        self.pool.stats.migration_failures += 1
+                        self.pool.discard(conn)
+                        continue
+                    self.pool.stats.migrations += 1
+
+    async def migrate_connection(self, client: Http3Client, local_host: str) -> bool:
+        """Move `client` to a new socket bound to `local_host`.
+
+        The connection switches to a fresh connection ID so that the new path
+        cannot be linked to the old one, and a PING confirms that the server is
+        reachable from the new address. Streams in flight are carried over.
+        """
+        old_transport = client._transport
+        family = old_transport.get_extra_info("socket").family
+        try:
+            # the new transport replaces the old one in connection_made
+            await self.create_endpoint(lambda: client, family, local_host)
+        except OSError as exc:
+            self.logger.warning("Unable to bind to %s: %s", local_host, exc)
+            return False
+        old_transport.close()
+
+        client.change_connection_id()
+        try:
+            await asyncio.wait_for(client.ping(), self.pool.ping_timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            self.logger.warning("Migration to %s failed", local_host)
+            return False
+        return True
@@ -0,0 +1,239 @@
+"""Datagram packetization layer path MTU discovery (RFC 8899) for QUIC.
+
+Connections start at the configured datagram size, the 1200 bytes every QUIC
+path must support. Once the handshake is complete, probe packets consisting of a
+PING and padding are sent at larger sizes, and the datagram size is raised to
+the largest acknowledged probe. Probes are sent in a packetization pass of their
+own, so that loss of a probe never costs application data. If full-sized
+packets stop being acknowledged, the connection falls back to the base size and
+searches again.
+"""
+
+import itertools
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from aioquic.quic.connection import NetworkAddress, QuicConnection
+from aioquic.quic.packet_builder import QuicDeliveryState, QuicPacketBuilder
+
+LOGGER = logging.getLogger(__name__)
+
+# aioquic cannot protect packets larger than this
+MAX_DATAGRAM_SIZE = 1500
+# attempts per probe size before the size is considered too large
+MAX_PROBES = 3
+# the search stops once the remaining range is smaller than this
+SEARCH_GRANULARITY = 16
+# interval after which a completed search is repeated to detect a larger MTU
+PMTU_RAISE_INTERVAL = 600.0
+# delay before searching again after a black hole was detected
+BLACK_HOLE_BACKOFF = 5.0
+# consecutive probe timeouts taken as a sign of a black hole
+BLACK_HOLE_PTO_COUNT = 2
+
+# probe PINGs use IDs that do not collide with application PINGs
+_probe_ids = itertools.count(1 << 62)
+
+
+class PathMtuDiscovery:
+    """Searches the path MTU of `quic`, up to `max_datagram_size`.
+
+    The discovered size is available as `path_mtu`.
+    """
+
+    def __init__(self, quic: QuicConnection, max_datagram_size: int) -> None:
+        """Initialize a `PathMtuDiscovery` instance."""
+        self._quic = quic
+        self.base_size = quic._max_datagram_size
+        self.max_datagram_size = max(
+            min(max_datagram_size, MAX_DATAGRAM_SIZE), self.base_size
+        )
+        self.path_mtu = self.base_size
+
+        # search range: path_mtu is confirmed, sizes above high have failed
+        self._high = self.max_datagram_size
+        self._probe_at: Optional[float] = None
+        self._probe_size: Optional[int] = None
+        self._probe_id: Optional[int] = None
+        self._probe_count = 0
+        self._searching = self._high > self.path_mtu
+        self._peer_address: Optional[NetworkAddress] = None
+        self._now = 0.0
+
+        self._datagrams_to_send = quic.datagrams_to_send
+        self._get_timer = quic.get_timer
+        self._write_ping_frame = quic._write_ping_frame
+        self._on_ping_delivery = quic._on_ping_delivery
+        quic.datagrams_to_send = self.datagrams_to_send
+        quic.get_timer = self.get_timer
+        quic._write_ping_frame = self.write_ping_frame
+        quic._on_ping_delivery = self.on_ping_delivery
+
+    @property
+    def search_complete(self) -> bool:
+        """Whether the search for the largest datagram size has ended."""
+        return not self._searching
+
+    def datagrams_to_send(self, now: float) -> List[Tuple[bytes, NetworkAddress]]:
+        """Return the datagrams to send, including a probe when one is due."""
+        datagrams = self._datagrams_to_send(now=now)
+        self._now = now
+
+        quic = self._quic
+        if not quic._handshake_complete:
+            return datagrams
+        self._check_path(now)
+        self._check_black_hole(now)
+        if self._probe_at is None:
+            self._probe_at = now
+        if self._probe_id is not None or now < self._probe_at:
+            return datagrams
+        if not self._searching:
+            # look for a larger MTU from time to time
+            self._high = self.max_datagram_size
+            self._searching = self._high > self.path_mtu
+            if not self._searching:
+                self._probe_at = now + PMTU_RAISE_INTERVAL
+                return datagrams
+
+        # send the probe in a packet of its own, at the probe size
+        size = self._next_probe_size()
+        probe_id = next(_probe_ids)
+        quic._ping_pending.append(probe_id)
+        quic._max_datagram_size = size
+        try:
+            probe = self._datagrams_to_send(now=now)
+        finally:
+            quic._max_datagram_size = self.path_mtu
+        if probe_id in quic._ping_pending:
+            # congestion or pacing limited, try again later
+            quic._ping_pending.remove(probe_id)
+            self._probe_at = now + quic._loss.get_probe_timeout()
+        else:
+            self._probe_id = probe_id
+            self._probe_size = size
+        return datagrams + probe
+
+    def get_timer(self) -> Optional[float]:
+        """Return the next timer, including the next probe."""
+        timer_at = self._get_timer()
+        if (
+            self._quic._handshake_complete
+            and self._probe_id is None
+            and self._probe_at is not None
+            and (timer_at is None or self._probe_at < timer_at)
+        ):
+            timer_at = self._probe_at
+        return timer_at
+
+    def write_ping_frame(
+        self, builder: QuicPacketBuilder, uids: List[int] = [], comment=""
+    ) -> None:
+        """Write a PING frame, padding the packets of probes."""
+        self._write_ping_frame(builder, uids, comment)
+        if any(uid >= 1 << 62 for uid in uids):
+            # PADDING frames are zero bytes
+            builder._buffer.push_bytes(bytes(builder.remaining_flight_space))
+
+    def on_ping_delivery(
+        self, delivery: QuicDeliveryState, uids: Sequence[int]
+    ) -> None:
+        """Raise the path MTU when a probe is acked, count it lost otherwise."""
+        probe_ids = [uid for uid in uids if uid >= 1 << 62]
+        if not probe_ids:
+            self._on_ping_delivery(delivery, uids)
+            return
+        if len(probe_ids) < len(uids):
+            self._on_ping_delivery(
+                delivery, [uid for uid in uids if uid not in probe_ids]
+            )
+        if self._probe_id in probe_ids:
+            # lost probes are not retransmitted
+            if delivery == QuicDeliveryState.ACKED:
+                self._probe_acked()
+            else:
+                self._probe_lost()
+
+    def _next_probe_size(self) -> int:
+        if self._probe_size is not None:
+            # retry the size that was lost
+            return self._probe_size
+        if self._high == self.max_datagram_size:
+            # try the largest size straight away, it usually works on the
+            # paths we are deployed on
+            return self._high
+        return (self.path_mtu + self._high + 1) // 2
+
+    def _probe_acked(self) -> None:
+        size = self._probe_size
+        self._probe_id = None
+        self._probe_size = None
+        self._probe_count = 0
+        if size > self.path_mtu:
+            self._set_path_mtu(size)
+        self._update_search()
+
+    def _probe_lost(self) -> None:
+        self._probe_id = None
+        self._probe_count += 1
+        if self._probe_count >= MAX_PROBES:
+            self._high = self._probe_size - 1
+            self._probe_size = None
+            self._probe_count = 0
+        self._update_search()
+
+    def _update_search(self) -> None:
+        if self._high - self.path_mtu < SEARCH_GRANULARITY:
+            self._searching = False
+            self._probe_at = self._now + PMTU_RAISE_INTERVAL
+            LOGGER.debug(
+                "Path MTU search complete for %s: %d",
+                self._quic.host_cid.hex(),
+                self.path_mtu,
+            )
+        else:
+            self._probe_at = self._now
+
+    def _check_black_hole(self, now: float) -> None:
+        if (
+            self.path_mtu > self.base_size
+            and self._quic._loss._pto_count >= BLACK_HOLE_PTO_COUNT
+        ):
+            LOGGER.info(
+                "Suspected black hole for %d byte packets on %s, falling back to %d",
+                self.path_mtu,
+                self._quic.host_cid.hex(),
+                self.base_size,
+            )
+            self._high = self.path_mtu - 1
+            self._set_path_mtu(self.base_size)
+            self._restart(now + BLACK_HOLE_BACKOFF)
+
+    def _check_path(self, now: float) -> None:
+        # a new path may have a different MTU
+        addr = self._quic._network_paths[0].addr
+        if self._peer_address is not None and addr != self._peer_address:
+            self._high = self.max_datagram_size
+            self._set_path_mtu(self.base_size)
+            self._restart(now)
+        self._peer_address = addr
+
+    def _restart(self, probe_at: float) -> None:
+        self._probe_id = None
+        self._probe_size = None
+        self._probe_count = 0
+        self._searching = self._high > self.path_mtu
+        self._probe_at = probe_at
+
+    def _set_path_mtu(self, size: int) -> None:
+        LOGGER.debug(
+            "Path MTU for %s set to %d", self._quic.host_cid.hex(), size
+        )
+        self.path_mtu = size
+        quic = self._quic
+        quic._max_datagram_size = size
+        # congestion control and pacing count in datagrams
+        loss = quic._loss
+        loss._pacer._max_datagram_size = size
+        if hasattr(loss._cc, "_max_datagram_size"):
+            loss._cc._max_datagram_size = size
@@ -0,0 +1,342 @@
+"""Connection pool for outbound HTTP/3 connections."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .http3_client import Http3Client
+
+LOGGER = logging.getLogger(__name__)
+
+Authority = Tuple[str, int]
+
+
+class PoolStats:
+    """Counters describing how the pool served its callers."""
+
+    def __init__(self) -> None:
+        """Initialize a `PoolStats` instance."""
+        self.hits = 0
+        self.misses = 0
+        self.handshakes = 0
+        self.handshake_failures = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.closed_by_peer = 0
+        self.ping_failures = 0
+        self.retries = 0
+        self.migrations = 0
+        self.migration_failures = 0
+        self.datagrams = 0
+        self.duplex_messages = 0
+        self.coalesced_flushes = 0
+        self.coalesced_messages = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        """Return the counters as a dict."""
+        return dict(vars(self))
+
+
+class PooledConnection:
+    """A client connection together with its pool bookkeeping."""
+
+    def __init__(self, authority: Authority, client: Http3Client) -> None:
+        """Initialize a `PooledConnection` instance."""
+        self.authority = authority
+        self.client = client
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.last_ping = self.last_used
+        self.watcher: Optional[asyncio.Task] = None
+
+    @property
+    def is_idle(self) -> bool:
+        """Whether no request is in progress on the connection."""
+        return self.in_use == 0
+
+    @property
+    def is_closing(self) -> bool:
+        """Whether the connection is closing or closed."""
+        return self.client.is_closing
+
+
+class Http3ConnectionPool:
+    """Pool of QUIC connections keyed by (host, port).
+
+    Concurrent callers for an authority without a usable connection share a
+    single in-progress handshake. Additional connections to the same authority
+    are only opened once every existing one carries `max_streams_per_connection`
+    requests, bounded by `limit_per_host` and the global `limit`.
+
+    Once started, a background task closes connections idle for longer than
+    `keepalive_timeout` and pings the remaining idle ones every `ping_interval`
+    seconds so they do not run into the QUIC idle timeout. Connections closed by
+    the peer are dropped from the pool as soon as they terminate.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[str, int], Awaitable[Http3Client]],
+        *,
+        limit: int = 200,
+        limit_per_host: int = 50,
+        max_streams_per_connection: int = 100,
+        keepalive_timeout: float = 15.0,
+        ping_interval: Optional[float] = 10.0,
+        ping_timeout: float = 5.0,
+        reap_interval: float = 1.0,
+    ) -> None:
+        """Initialize an `Http3ConnectionPool` instance."""
+        self._connect = connect
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.max_streams_per_connection = max_streams_per_connection
+        self.keepalive_timeout = keepalive_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.reap_interval = reap_interval
+
+        self._connections: Dict[Authority, List[PooledConnection]] = {}
+        self._pending: Dict[Authority, asyncio.Future] = {}
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._reaper: Optional[asyncio.Task] = None
+        self.stats = PoolStats()
+
+    def __len__(self) -> int:
+        """Return the number of pooled connections."""
+        return sum(len(conns) for conns in self._connections.values())
+
+    def __iter__(self) -> Iterator[PooledConnection]:
+        """Iterate over the pooled connections."""
+        for conns in list(self._connections.values()):
+            yield from list(conns)
+
+    def start(self) -> None:
+        """Start expiring idle connections."""
+        if self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap())
+
+    @asynccontextmanager
+    async def connection(self, host: str, port: int) -> AsyncIterator[PooledConnection]:
+        """Acquire a connection for the duration of one request."""
+        conn = await self.acquire(host, port)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    async def acquire(self, host: str, port: int) -> PooledConnection:
+        """Return a connection to `host` for a request, connecting if needed."""
+        authority = (host, port)
+        missed = False
+
+        while True:
+            self._expire(authority)
+
+            conn = self._least_loaded(authority, self.max_streams_per_connection)
+            if conn is not None:
+                return self._checkout(conn, missed)
+
+            pending = self._pending.get(authority)
+            if pending is not None:
+                # join the handshake already in flight for this authority
+                missed = True
+                await asyncio.shield(pending)
+                continue
+
+            if not self._has_capacity(authority):
+                # reuse an overloaded connection rather than exceed the limits
+                conn = self._least_loaded(authority)
+                if conn is not None:
+                    return self._checkout(conn, missed)
+                missed = True
+                await self._wait_for_capacity()
+                continue
+
+            return self._checkout(await self._handshake(authority), True)
+
+    def release(self, conn: PooledConnection) -> None:
+        """Give back a connection after a request."""
+        conn.in_use -= 1
+        conn.last_used = time.monotonic()
+        self._wake_waiter()
+
+    def discard(self, conn: PooledConnection) -> None:
+        """Remove a connection from the pool and close it."""
+        self._remove(conn)
+        conn.client.close()
+
+    async def close(self) -> None:
+        """Close all connections and stop expiring them."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+        watchers = []
+        for conns in list(self._connections.values()):
+            for conn in list(conns):
+                watchers.append(conn.watcher)
+                self.discard(conn)
+        if watchers:
+            # give the connections a chance to send CONNECTION_CLOSE
+            _, pending = await asyncio.wait(watchers, timeout=self.ping_timeout)
+            for watcher in pending:
+                watcher.cancel()
+
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.cancel()
+        self._waiters.clear()
+
+    def _checkout(self, conn: PooledConnection, missed: bool) -> PooledConnection:
+        if missed:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        conn.in_use += 1
+        conn.last_used = time.monotonic()
+        return conn
+
+    async def _handshake(self, authority: Authority) -> PooledConnection:
+        pending = asyncio.get_event_loop().create_future()
+        self._pending[authority] = pending
+        try:
+            client = await self._connect(*authority)
+        except BaseException as exc:
+            self.stats.handshake_failures += 1
+            pending.set_exception(exc)
+            # mark the exception retrieved in case nobody joined the handshake
+            pending.exception()
+            raise
+        finally:
+            del self._pending[authority]
+            self._wake_waiter()
+
+        self.stats.handshakes += 1
+        conn = PooledConnection(authority, client)
+        conn.watcher = asyncio.ensure_future(self._watch(conn))
+        self._connections.setdefault(authority, []).append(conn)
+        pending.set_result(conn)
+        return conn
+
+    def _least_loaded(
+        self, authority: Authority, max_streams: Optional[int] = None
+    ) -> Optional[PooledConnection]:
+        candidates = [
+            conn
+            for conn in self._connections.get(authority, [])
+            if not conn.is_closing
+            and (max_streams is None or conn.in_use < max_streams)
+        ]
+        return min(candidates, key=lambda conn: conn.in_use, default=None)
+
+    def _has_capacity(self, authority: Authority) -> bool:
+        if len(self._connections.get(authority, [])) >= self.limit_per_host:
+            return False
+        if len(self) + len(self._pending) < self.limit:
+            return True
+        return self._evict_idle()
+
+    def _evict_idle(self) -> bool:
+        """Close the least recently used idle connection, if there is one."""
+        idle = [
+            conn
+            for conns in self._connections.values()
+            for conn in conns
+            if conn.is_idle
+        ]
+        if not idle:
+            return False
+        self.stats.evictions += 1
+        self.discard(min(idle, key=lambda conn: conn.last_used))
+        return True
+
+    def _expire(self, authority: Authority) -> None:
+        now = time.monotonic()
+        for conn in list(self._connections.get(authority, [])):
+            if conn.is_idle and now - conn.last_used >= self.keepalive_timeout:
+                LOGGER.debug("Closing expired connection to %s:%d", *authority)
+                self.stats.expirations += 1
+                self.discard(conn)
+
+    def _remove(self, conn: PooledConnection) -> None:
+        conns = self._connections.get(conn.authority, [])
+        if conn in conns:
+            conns.remove(conn)
+            if not conns:
+                del self._connections[conn.authority]
+            self._wake_waiter()
+
+    async def _watch(self, conn: PooledConnection) -> None:
+        """Drop the connection from the pool and release its socket once closed."""
+        try:
+            await conn.client.wait_closed()
+        finally:
+            conn.client.close_transport()
+        LOGGER.debug(
+            "Connection to %s:%d ended with path MTU %d",
+            *conn.authority,
+            conn.client.path_mtu,
+        )
+        if conn in self._connections.get(conn.authority, []):
+            LOGGER.debug("Connection to %s:%d closed by peer", *conn.authority)
+            self.stats.closed_by_peer += 1
+            self._remove(conn)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            for authority in list(self._connections):
+                self._expire(authority)
+            if self.ping_interval:
+                self._ping_idle()
+
+    def _ping_idle(self) -> None:
+        now = time.monotonic()
+        for conns in list(self._connections.values()):
+            for conn in conns:
+                if (
+                    conn.is_idle
+                    and now - max(conn.last_used, conn.last_ping) >= self.ping_interval
+                ):
+                    conn.last_ping = now
+                    asyncio.ensure_future(self._ping(conn))
+
+    async def _ping(self, conn: PooledConnection) -> None:
+        try:
+            await asyncio.wait_for(conn.client.ping(), self.ping_timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            LOGGER.debug("Ping to %s:%d failed", *conn.authority)
+            self.stats.ping_failures += 1
+            # a request in progress fails on its own if the connection is gone
+            if conn.is_idle:
+                self.discard(conn)
+
+    async def _wait_for_capacity(self) -> None:
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _wake_waiter(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
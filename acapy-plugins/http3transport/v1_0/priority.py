@@ -0,0 +1,148 @@
+"""Extensible priorities (RFC 9218) for QUIC streams.
+
+aioquic serves all streams with data to send round robin, so a control message
+queued behind a multi-megabyte file chunk on the same connection waits for a
+share of every packet. Here each stream can be given an urgency from 0 (most
+urgent) to 7, and a stream only sends when no stream of a lower urgency has data
+ready. Within an urgency, incremental streams are interleaved and the others
+are sent one after another.
+
+Priorities are signalled in the `priority` request header, which the client
+applies to its request stream and the server to its response.
+"""
+
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from aioquic.quic.connection import (
+    QuicConnection,
+    QuicNetworkPath,
+    stream_is_unidirectional,
+)
+from aioquic.quic.packet_builder import QuicPacketBuilder
+from aioquic.quic.recovery import QuicPacketSpace
+from aioquic.quic.stream import QuicStream
+
+LOGGER = logging.getLogger(__name__)
+
+PRIORITY_HEADER = "priority"
+
+DEFAULT_URGENCY = 3
+MAX_URGENCY = 7
+
+# HTTP/3 control and QPACK streams go before any request
+CONTROL_URGENCY = -1
+
+
+class Priority(NamedTuple):
+    """Extensible priority of a stream (RFC 9218)."""
+    urgency: int = DEFAULT_URGENCY
+    incremental: bool = False
+
+    @classmethod
+    def parse(cls, value: str) -> "Priority":
+        """Parse a priority field value, ignoring unknown or invalid members."""
+        urgency = DEFAULT_URGENCY
+        incremental = False
+        for member in value.split(","):
+            key, _, item = member.strip().partition("=")
+            item = item.partition(";")[0].strip()
+            if key == "u":
+                try:
+                    if 0 <= int(item) <= MAX_URGENCY:
+                        urgency = int(item)
+                except ValueError:
+                    pass
+            elif key == "i":
+                incremental = item in ("", "?1")
+        return cls(urgency, incremental)
+
+    def __str__(self) -> str:
+        """Return the priority in the format of the priority header."""
+        return f"u={self.urgency}, i" if self.incremental else f"u={self.urgency}"
+
+
+class StreamScheduler:
+    """Sends the stream data of `quic` in order of stream priority."""
+
+    def __init__(self, quic: QuicConnection) -> None:
+        """Initialize a `StreamScheduler` instance."""
+        self._quic = quic
+        self._priorities: Dict[int, Priority] = {}
+        # streams in service order with their urgency, as of the current flush
+        self._service_order: List[Tuple[int, QuicStream]] = []
+
+        self._write_application = quic._write_application
+        self._write_stream_frame = quic._write_stream_frame
+        quic._write_application = self.write_application
+        quic._write_stream_frame = self.write_stream_frame
+
+    def set_priority(self, stream_id: int, priority: Optional[Priority]) -> None:
+        """Set the priority of `stream_id`, or reset it to the default."""
+        if priority is None:
+            self._priorities.pop(stream_id, None)
+        else:
+            self._priorities[stream_id] = priority
+
+    def get_priority(self, stream_id: int) -> Priority:
+        """Return the priority of `stream_id`."""
+        return self._priorities.get(stream_id, Priority())
+
+    def write_application(
+        self, builder: QuicPacketBuilder, network_path: QuicNetworkPath, now: float
+    ) -> None:
+        """Write stream frames in order of urgency."""
+        quic = self._quic
+        if len(self._priorities) > len(quic._streams):
+            self._priorities = {
+                stream_id: priority
+                for stream_id, priority in self._priorities.items()
+                if stream_id in quic._streams
+            }
+        # the sort is stable, which keeps the round robin order of incremental
+        # streams
+        quic._streams_queue.sort(key=self._sort_key)
+        self._service_order = [
+            (self._urgency(stream), stream) for stream in quic._streams_queue
+        ]
+        try:
+            self._write_application(builder, network_path, now)
+        finally:
+            self._service_order = []
+
+    def write_stream_frame(
+        self,
+        builder: QuicPacketBuilder,
+        space: QuicPacketSpace,
+        stream: QuicStream,
+        max_offset: int,
+    ) -> int:
+        """Write a stream frame, unless a more urgent stream has data to send."""
+        urgency = self._urgency(stream)
+        for other_urgency, other in self._service_order:
+            if other_urgency >= urgency:
+                break
+            if (
+                not other.is_blocked
+                and not other.sender.buffer_is_empty
+                and other.sender.next_offset < other.max_stream_data_remote
+            ):
+                # leave the packet to the more urgent stream
+                return 0
+        return self._write_stream_frame(builder, space, stream, max_offset)
+
+    def _urgency(self, stream: QuicStream) -> int:
+        priority = self._priorities.get(stream.stream_id)
+        if priority is not None:
+            return priority.urgency
+        if stream_is_unidirectional(stream.stream_id):
+            return CONTROL_URGENCY
+        return DEFAULT_URGENCY
+
+    def _sort_key(self, stream: QuicStream) -> Tuple[int, bool, int]:
+        priority = self.get_priority(stream.stream_id)
+        return (
+            self._urgency(stream),
+            priority.incremental,
+            0 if priority.incremental else stream.stream_id,
+        )
@@ -0,0 +1,148 @@
+"""QUIC client connection shared by the outbound transports."""
+
+import asyncio
+from typing import Optional
+
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.quic.packet import CONNECTION_ID_MAX_SIZE, PACKET_NUMBER_MAX_SIZE
+
+from .priority import Priority, StreamScheduler
+from .udp import BatchedTransmitMixin
+
+# short header, packet number and AEAD tag, plus the DATAGRAM frame type and
+# length, assuming the largest connection ID
+DATAGRAM_OVERHEAD = 1 + CONNECTION_ID_MAX_SIZE + PACKET_NUMBER_MAX_SIZE + 16 + 3
+
+
+class RequestMaybeDelivered(ConnectionError):
+    """The connection was lost after the request was sent in full.
+
+    The peer may have handled the request, so sending it again could deliver
+    the message twice.
+    """
+
+
+class RequestReset(Exception):
+    """The peer reset the stream of a request, the connection is still usable."""
+
+    def __init__(self, stream_id: int, error_code: int) -> None:
+        """Initialize a `RequestReset` instance."""
+        super().__init__(f"Stream {stream_id} reset with error code {error_code}")
+        self.error_code = error_code
+
+
+class QuicClient(BatchedTransmitMixin, QuicConnectionProtocol):
+    """Connection handling shared by the HTTP/3 and the raw QUIC client."""
+
+    stream_scheduler: Optional[StreamScheduler] = None
+
+    # when enabled, messages queued within `coalescing_window` seconds, or until
+    # `coalescing_max_bytes` are pending, go out in a single transmit pass; a
+    # window of 0 waits for the end of the current event loop iteration
+    coalescing = False
+    coalescing_window = 0.0
+    coalescing_max_bytes = 16384
+    # receives the coalesced_flushes and coalesced_messages counts
+    stats = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Initialize a `QuicClient` instance."""
+        super().__init__(*args, **kwargs)
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._queued_messages = 0
+        self._queued_bytes = 0
+
+    @property
+    def path_mtu(self) -> int:
+        """The maximum size of the datagrams sent on this connection."""
+        return self._quic._max_datagram_size
+
+    @property
+    def is_closing(self) -> bool:
+        """Whether the connection is closing or closed."""
+        # set as soon as either side starts closing, before draining completes
+        return self._quic._close_event is not None or self._closed.is_set()
+
+    @property
+    def max_datagram_payload(self) -> int:
+        """Largest payload `send_datagram` can send, 0 if it cannot send any."""
+        quic = self._quic
+        remote_max = quic._remote_max_datagram_frame_size
+        if remote_max is None or not quic._handshake_complete:
+            return 0
+        return max(min(remote_max - 3, quic._max_datagram_size - DATAGRAM_OVERHEAD), 0)
+
+    def send_datagram(self, data: bytes) -> bool:
+        """Send `data` in a DATAGRAM frame, if it fits into a single packet.
+
+        Delivery is not guaranteed, lost datagrams are not retransmitted.
+        """
+        if len(data) > self.max_datagram_payload:
+            return False
+        self._quic.send_datagram_frame(data)
+        self.transmit()
+        return True
+
+    def queue_transmit(self, size: int) -> None:
+        """Transmit a message of `size` bytes queued on the connection."""
+        if not self.coalescing:
+            self.transmit()
+            return
+        self._queued_messages += 1
+        self._queued_bytes += size
+        if self._queued_bytes >= self.coalescing_max_bytes:
+            self.transmit()
+        elif self._flush_handle is None:
+            if self.coalescing_window > 0:
+                self._flush_handle = self._loop.call_later(
+                    self.coalescing_window, self.transmit
+                )
+            else:
+                self._flush_handle = self._loop.call_soon(self.transmit)
+
+    def transmit(self) -> None:
+        """Send all pending datagrams, including queued messages."""
+        # whatever triggers it, a transmit pass sends all queued messages
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._queued_messages:
+            if self.stats is not None:
+                self.stats.coalesced_flushes += 1
+                self.stats.coalesced_messages += self._queued_messages
+            self._queued_messages = 0
+            self._queued_bytes = 0
+        super().transmit()
+
+    def set_stream_priority(self, stream_id: int, priority: Priority) -> None:
+        """Set the priority with which `stream_id` is sent."""
+        if self.stream_scheduler is not None:
+            self.stream_scheduler.set_priority(stream_id, priority)
+
+    def close_transport(self) -> None:
+        """Close the UDP transport of the connection."""
+        if self._transport is not None:
+            self._transport.close()
+
+    def request_error(self, stream_id: int, exc: Exception) -> Exception:
+        """Return the error to fail the request on `stream_id` with.
+
+        That is `exc` if the request was not sent in full, otherwise
+        RequestMaybeDelivered as the peer may have handled it.
+        """
+        stream = self._quic._streams.get(stream_id)
+        if stream is not None:
+            sender = stream.sender
+            if sender._buffer_fin is None or sender.highest_offset < sender._buffer_fin:
+                # never sent in full, the peer cannot have handled it
+                return exc
+        return RequestMaybeDelivered(str(exc))
+
+    def abort_requests(self, exc: Exception) -> None:
+        """Fail all outstanding requests and PINGs with `exc`."""
+        for waiter in self._ping_waiters.values():
+            if not waiter.done():
+                waiter.set_exception(exc)
+                # the caller may have given up waiting already
+                waiter.exception()
+        self._ping_waiters.clear()
@@ -0,0 +1,112 @@
+"""Raw QUIC inbound transport."""
+
+import logging
+from typing import Dict, Optional
+
+from aries_cloudagent.messaging.error import MessageParseError
+from aries_cloudagent.transport.error import WireFormatParseError
+
+from . import inbound
+from .config import (
+    autotune_receive_windows,
+    discover_path_mtu,
+    limit_stream_credit,
+    reduce_ack_frequency,
+    validate_migrated_paths,
+)
+from .message_protocol import (
+    MESSAGE_ALPN,
+    ErrorCode,
+    MessageRejected,
+    MessageServerProtocol,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class QuicTransport(inbound.Http3Transport):
+    """Raw QUIC inbound transport class.
+
+    Receives every message on a stream of its own, without HTTP/3 framing, and
+    otherwise behaves like the HTTP/3 transport.
+    """
+
+    transport_scheme = "quic"
+    alpn_protocols = MESSAGE_ALPN
+
+    def create_worker_pool(self) -> None:
+        """Ignore inbound workers, which only serve HTTP/3."""
+        if self.config.inbound_workers:
+            LOGGER.warning("Inbound workers only serve HTTP/3, ignoring them")
+        return None
+
+    def create_protocol(self, *args, **kwargs):
+        """Create a server connection with the configured extensions."""
+        protocol = MessageServerProtocol(*args, **kwargs)
+        protocol.set_message_handler(self.quic_message_handler)
+        if self.config.max_datagram_frame_size:
+            protocol.set_datagram_handler(self.datagram_received)
+        autotune_receive_windows(self.config, protocol._quic)
+        discover_path_mtu(self.config, protocol._quic)
+        reduce_ack_frequency(self.config, protocol._quic)
+        validate_migrated_paths(self.config, protocol._quic)
+        protocol.max_message_size = self.max_message_size
+        protocol.admission = self.admission
+        limit_stream_credit(
+            self.config,
+            protocol._quic,
+            self.admission,
+            in_progress=lambda: protocol.active_handlers,
+            wake=protocol.transmit,
+        )
+        return protocol
+
+    async def quic_message_handler(
+        self, message: bytes, scope: Dict
+    ) -> Optional[bytes]:
+        """Message handler for messages received on QUIC streams.
+
+        Args:
+            message: the message payload
+            scope: connection details of the stream
+
+        Returns:
+            The direct response, if any
+
+        """
+        if scope["early_data"] and not self.replay_cache.check(message):
+            # possibly replayed 0-RTT message, have the client retry after the
+            # handshake
+            raise MessageRejected(ErrorCode.EARLY_DATA_REJECTED)
+
+        client_info = {
+            "host": f"{self.host}:{self.port}",
+            "remote": scope["client"][0],
+        }
+
+        session = await self.create_session(
+            accept_undelivered=True, can_respond=True, client_info=client_info
+        )
+
+        async with session:
+            try:
+                inbound_message = await session.receive(message)
+            except (MessageParseError, WireFormatParseError):
+                raise MessageRejected(ErrorCode.MESSAGE_ERROR)
+
+            if inbound_message.receipt.direct_response_requested:
+                # Wait for the message to be processed. Only send a response if a
+                # response buffer is present.
+                await inbound_message.wait_processing_complete()
+                response = (
+                    await session.wait_response() if session.response_buffer else None
+                )
+
+                # no more responses
+                session.can_respond = False
+                session.clear_response()
+
+                if isinstance(response, str):
+                    response = response.encode()
+                return response
+        return None
@@ -0,0 +1,102 @@
+"""Raw QUIC outbound transport."""
+
+from typing import Union
+from urllib.parse import urlparse
+
+from aioquic.asyncio import connect
+from aries_cloudagent.core.profile import Profile
+from aries_cloudagent.transport.outbound.base import OutboundTransportError
+
+from . import outbound
+from .config import (
+    autotune_receive_windows,
+    discover_path_mtu,
+    reduce_ack_frequency,
+)
+from .message_protocol import MESSAGE_ALPN, ErrorCode, MessageClient, MessageRejected
+
+
+class QuicTransport(outbound.Http3Transport):
+    """Raw QUIC outbound transport class.
+
+    Sends every message on a stream of its own, without HTTP/3 framing, and
+    otherwise behaves like the HTTP/3 transport.
+    """
+
+    schemes = ("quic",)
+    alpn_protocols = MESSAGE_ALPN
+
+    async def handle_message(
+        self,
+        profile: Profile,
+        payload: Union[str, bytes],
+        endpoint: str,
+        metadata: dict = None,
+        api_key: str = None,
+    ):
+        """Handle message from queue.
+
+        Args:
+            profile: the profile that produced the message
+            payload: message payload in string or byte format
+            endpoint: URI endpoint for delivery
+            metadata: Additional metadata associated with the payload
+            api_key: API key for the endpoint, unused
+        """
+        if not endpoint:
+            raise OutboundTransportError("No endpoint provided")
+        if isinstance(payload, str):
+            payload = payload.encode()
+        datagram = self.datagram_requested(payload, dict(metadata or {}))
+        self.logger.debug("Sending to %s; Data: %s", endpoint, payload)
+
+        parsed = urlparse(endpoint)
+        host = parsed.hostname
+        port = parsed.port
+
+        try:
+            if self.force_close:
+                async with connect(
+                    host,
+                    port,
+                    configuration=self.create_configuration(host),
+                    create_protocol=self.create_protocol,
+                    session_ticket_handler=self.session_tickets.add,
+                ) as client:
+                    return await client.send_message(payload)
+
+            if datagram and await self.send_datagram(host, port, payload):
+                return None
+
+            return await self.send_with_retry(
+                lambda: self.send_pooled(host, port, payload)
+            )
+        except MessageRejected as exc:
+            raise OutboundTransportError(
+                f"Message rejected with error code {exc.error_code}"
+            )
+
+    async def send_pooled(self, host, port, payload):
+        """Send `payload` on a pooled connection and return the response."""
+        async with self.pool.connection(host, port) as conn:
+            try:
+                try:
+                    return await conn.client.send_message(payload)
+                except MessageRejected as exc:
+                    if exc.error_code != ErrorCode.EARLY_DATA_REJECTED:
+                        raise
+                # early data refused, the handshake is complete by now
+                return await conn.client.send_message(payload)
+            except ConnectionError:
+                if conn.client.is_closing:
+                    self.pool.discard(conn)
+                raise
+
+    def create_protocol(self, *args, **kwargs) -> MessageClient:
+        """Create a client connection with the configured extensions."""
+        client = MessageClient(*args, **kwargs)
+        autotune_receive_windows(self.config, client._quic)
+        discover_path_mtu(self.config, client._quic)
+        reduce_ack_frequency(self.config, client._quic)
+        self.coalesce_transmits(client)
+        return client
@@ -0,0 +1,168 @@
+"""Name resolution and address racing for outbound QUIC connections."""
+
+import asyncio
+import logging
+import socket
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# (address family, socket address)
+AddressInfo = Tuple[int, Tuple[Any, ...]]
+
+
+class CachingResolver:
+    """Asynchronous getaddrinfo with a TTL cache.
+
+    Failed lookups are cached for `negative_ttl` seconds so unreachable names do
+    not cost a resolver round trip on every attempt. Concurrent lookups of the
+    same name share a single getaddrinfo call.
+    """
+
+    def __init__(
+        self, ttl: float = 300.0, negative_ttl: float = 10.0, max_entries: int = 1024
+    ) -> None:
+        """Initialize a `CachingResolver` instance."""
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._cache: OrderedDict[
+            Tuple[str, int], Tuple[Union[List[AddressInfo], OSError], float]
+        ] = OrderedDict()
+        self._pending: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int) -> List[AddressInfo]:
+        """Return the addresses of `host`, interleaving IPv6 and IPv4."""
+        key = (host, port)
+        entry = self._cache.get(key)
+        if entry is not None:
+            result, expires_at = entry
+            if time.monotonic() < expires_at:
+                self.hits += 1
+                if isinstance(result, OSError):
+                    raise result
+                return result
+            del self._cache[key]
+
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_event_loop().create_future()
+        self._pending[key] = pending
+        try:
+            result = await self._lookup(host, port)
+        except OSError as exc:
+            self._store(key, exc, self.negative_ttl)
+            pending.set_exception(exc)
+            pending.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+        self._store(key, result, self.ttl)
+        pending.set_result(result)
+        return result
+
+    def _store(self, key, result, ttl: float) -> None:
+        self._cache[key] = (result, time.monotonic() + ttl)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _lookup(self, host: str, port: int) -> List[AddressInfo]:
+        loop = asyncio.get_event_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+
+        # interleave address families, starting with the preferred one (RFC 8305)
+        by_family: OrderedDict[int, List[AddressInfo]] = OrderedDict()
+        for family, _, _, _, addr in infos:
+            addrs = by_family.setdefault(family, [])
+            if (family, addr) not in addrs:
+                addrs.append((family, addr))
+        result = []
+        while any(by_family.values()):
+            for addrs in by_family.values():
+                if addrs:
+                    result.append(addrs.pop(0))
+        if not result:
+            raise socket.gaierror(f"No addresses found for {host}")
+        return result
+
+
+def source_address(family: int, addr: Tuple[Any, ...]) -> Optional[str]:
+    """Return the local address the kernel would send from to reach `addr`."""
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        # connecting a UDP socket only performs the route lookup
+        sock.connect(addr)
+        return sock.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+async def happy_eyeballs(
+    attempts: Iterable[Callable[[], Awaitable[T]]],
+    delay: float,
+    close: Callable[[T], None],
+) -> T:
+    """Race connection attempts, starting the next one every `delay` seconds.
+
+    The next attempt also starts as soon as the previous one fails. The first
+    successful result is returned and every other attempt is cancelled, or
+    passed to `close` if it succeeded at the same time.
+    """
+    attempts = iter(attempts)
+    exhausted = False
+    pending: Set[asyncio.Future] = set()
+    errors: List[BaseException] = []
+    try:
+        while True:
+            if not exhausted:
+                attempt = next(attempts, None)
+                if attempt is None:
+                    exhausted = True
+                else:
+                    pending.add(asyncio.ensure_future(attempt()))
+            if not pending:
+                raise errors[-1] if errors else OSError("No addresses to connect to")
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=None if exhausted else delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            winners = []
+            for task in done:
+                if task.exception() is None:
+                    winners.append(task.result())
+                else:
+                    LOGGER.debug("Connection attempt failed: %s", task.exception())
+                    errors.append(task.exception())
+            if winners:
+                for extra in winners[1:]:
+                    close(extra)
+                return winners[0]
+    finally:
+        for task in pending:
+            task.cancel()
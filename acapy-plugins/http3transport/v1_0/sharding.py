@@ -0,0 +1,723 @@
+"""Inbound HTTP/3 server sharded across worker processes (experimental).
+
+In sharded mode the agent process starts `workers` processes, which each bind
+the transport's UDP port with SO_REUSEPORT and terminate QUIC and HTTP/3 for
+the connections the kernel hands them. The kernel spreads datagrams by their
+address 4-tuple, which keeps a connection on one worker until the client's
+address changes.
+
+Each worker writes its ID into the first byte of the connection IDs it issues
+(the plaintext scheme of QUIC-LB, without eBPF). A worker that receives a
+packet for a connection ID it does not know, but another worker issued, relays
+it over a Unix datagram socket to that worker, together with the client
+address. Initial and 0-RTT packets carry a connection ID the client chose and
+are served by the worker that receives them.
+
+Workers do not run ACA-Py. They pass every request body, DATAGRAM frame and
+session ticket to the agent process over a Unix stream socket, where inbound
+sessions are created as usual, and send back the response. Session tickets are
+shared between all workers so clients can resume at any of them, while early
+data is still checked against the agent process' single replay cache.
+
+Only packet processing, encryption and HTTP/3 framing move to the workers.
+Unpacking and handling messages stays on the agent process' single event loop,
+and every request costs an extra copy and round trip over the socket, so
+workers only help while the transport itself is the bottleneck, such as with
+many clients sending small messages. `evaluation/bench_workers.py` compares
+the two modes. Connections served by workers are not registered for duplex
+use.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aioquic.asyncio.server import QuicServer
+from aioquic.buffer import Buffer
+from aioquic.quic.connection import QuicConnection
+from aioquic.quic.packet import QuicPacketType, pull_quic_header
+from aioquic.tls import SessionTicket
+
+from . import congestion  # noqa: F401 registers the "bbr" algorithm
+from . import udp
+from .config import (
+    HttpxConfig,
+    autotune_receive_windows,
+    create_admission_queue,
+    create_quic_configuration,
+    discover_path_mtu,
+    limit_stream_credit,
+    prioritize_streams,
+    reduce_ack_frequency,
+    validate_migrated_paths,
+)
+from .http3_protocol import BodyStats, DirectResponse, Http3ServerProtocol
+from .tickets import SessionTicketStore, ticket_from_json, ticket_to_json
+
+LOGGER = logging.getLogger(__name__)
+
+# the worker ID takes one byte of the connection ID
+MAX_WORKERS = 256
+WORKER_START_TIMEOUT = 10.0
+WORKER_STOP_TIMEOUT = 5.0
+
+# request ID, metadata length, body length
+FRAME_HEADER = struct.Struct("!QII")
+# length of the client address preceding a relayed datagram
+ADDRESS_HEADER = struct.Struct("!H")
+
+MessageHandler = Callable[[bytes, Dict], Awaitable[DirectResponse]]
+
+
+def _main_path(ipc_dir: str) -> str:
+    return os.path.join(ipc_dir, "main.sock")
+
+
+def _relay_path(ipc_dir: str, worker_id: int) -> str:
+    return os.path.join(ipc_dir, f"worker-{worker_id}.sock")
+
+
+def write_frame(
+    writer: asyncio.StreamWriter, meta: Dict, body: bytes = b"", request_id: int = 0
+) -> None:
+    """Write a frame of the protocol between workers and the agent process."""
+    encoded = json.dumps(meta).encode()
+    writer.write(FRAME_HEADER.pack(request_id, len(encoded), len(body)) + encoded)
+    if body:
+        writer.write(body)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, Dict, bytes]:
+    """Read a frame written by `write_frame`."""
+    request_id, meta_length, body_length = FRAME_HEADER.unpack(
+        await reader.readexactly(FRAME_HEADER.size)
+    )
+    meta = json.loads(await reader.readexactly(meta_length))
+    body = await reader.readexactly(body_length) if body_length else b""
+    return request_id, meta, body
+
+
+def _encode_headers(headers: List[Tuple[bytes, bytes]]) -> List[List[str]]:
+    return [
+        [name.decode("latin-1"), value.decode("latin-1")] for name, value in headers
+    ]
+
+
+def _decode_headers(headers: List[List[str]]) -> List[Tuple[bytes, bytes]]:
+    return [
+        (name.encode("latin-1"), value.encode("latin-1")) for name, value in headers
+    ]
+
+
+def _encode_scope(scope: Dict) -> Dict:
+    return {
+        "client": scope["client"],
+        "early_data": scope["early_data"],
+        "headers": _encode_headers(scope["headers"]),
+        "http_version": scope["http_version"],
+        "method": scope["method"],
+        "path": scope["path"],
+        "query_string": scope["query_string"].decode("latin-1"),
+        "raw_path": scope["raw_path"].decode("latin-1"),
+        "root_path": scope["root_path"],
+        "scheme": scope["scheme"],
+        "type": scope["type"],
+    }
+
+
+def _decode_scope(scope: Dict) -> Dict:
+    return dict(
+        scope,
+        client=tuple(scope["client"]),
+        extensions={},
+        headers=_decode_headers(scope["headers"]),
+        query_string=scope["query_string"].encode("latin-1"),
+        raw_path=scope["raw_path"].encode("latin-1"),
+    )
+
+
+async def _call_app(app: Callable, scope: Dict, body: bytes) -> DirectResponse:
+    """Run the ASGI application `app` on a request received in full."""
+    request: Optional[Dict] = {"type": "http.request", "body": body}
+    response: Dict = {"status": 500, "headers": []}
+    chunks: List[bytes] = []
+    complete = asyncio.Event()
+
+    async def receive() -> Dict:
+        nonlocal request
+        if request is not None:
+            message, request = request, None
+            return message
+        await complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Dict) -> None:
+        if message["type"] == "http.response.start":
+            response.update(status=message["status"], headers=message["headers"])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                complete.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        complete.set()
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+class WorkerConnectionIds:
+    """Encodes `worker_id` in the first byte of the connection IDs `quic` issues.
+
+    Must be installed before the connection sends its first packet.
+    """
+
+    def __init__(self, quic: QuicConnection, worker_id: int) -> None:
+        """Initialize a `WorkerConnectionIds` instance."""
+        self._quic = quic
+        self.worker_id = worker_id
+
+        host_cid = quic._host_cids[0]
+        host_cid.cid = self.encode(host_cid.cid)
+        quic.host_cid = quic._local_initial_source_connection_id = host_cid.cid
+
+        self._replenish_connection_ids = quic._replenish_connection_ids
+        quic._replenish_connection_ids = self.replenish_connection_ids
+
+    def encode(self, cid: bytes) -> bytes:
+        """Write the worker ID into the first byte of `cid`."""
+        return bytes((self.worker_id,)) + cid[1:]
+
+    def replenish_connection_ids(self) -> None:
+        """Issue new connection IDs, tagged with the worker ID."""
+        issued = len(self._quic._host_cids)
+        self._replenish_connection_ids()
+        for connection_id in self._quic._host_cids[issued:]:
+            connection_id.cid = self.encode(connection_id.cid)
+
+
+class DatagramRelay(asyncio.DatagramProtocol):
+    """Passes QUIC packets between workers, along with the client address."""
+
+    def __init__(
+        self, ipc_dir: str, deliver: Callable[[bytes, Tuple], None]
+    ) -> None:
+        """Initialize a `DatagramRelay` instance."""
+        self._ipc_dir = ipc_dir
+        self._deliver = deliver
+        self._transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Keep the transport of the relay socket."""
+        self._transport = transport
+
+    def send(self, worker_id: int, data: bytes, addr: Tuple) -> None:
+        """Relay a datagram from `addr` to another worker."""
+        if self._transport is None:
+            return
+        address = json.dumps(addr).encode()
+        self._transport.sendto(
+            ADDRESS_HEADER.pack(len(address)) + address + data,
+            _relay_path(self._ipc_dir, worker_id),
+        )
+
+    def datagram_received(self, data: bytes, _) -> None:
+        """Deliver a datagram relayed by another worker."""
+        (length,) = ADDRESS_HEADER.unpack_from(data)
+        offset = ADDRESS_HEADER.size + length
+        addr = tuple(json.loads(data[ADDRESS_HEADER.size:offset]))
+        self._deliver(data[offset:], addr)
+
+    def error_received(self, exc: Exception) -> None:
+        """Drop datagrams that cannot be relayed."""
+        # the other worker is gone or backed up, like a lost UDP datagram
+        LOGGER.debug("Unable to relay datagram: %s", exc)
+
+
+class ShardedQuicServer(QuicServer):
+    """QUIC server that relays packets of other workers' connections to them."""
+
+    def __init__(self, *, worker_id: int, workers: int, **kwargs) -> None:
+        """Initialize a `ShardedQuicServer` instance."""
+        super().__init__(**kwargs)
+        self.worker_id = worker_id
+        self.workers = workers
+        self.relay: Optional[DatagramRelay] = None
+        self.forwarded = 0
+        self.relayed = 0
+
+    def datagram_received(self, data: bytes, addr: Tuple) -> None:
+        """Handle a datagram, or relay it to the worker owning its connection."""
+        worker_id = self._owner(data)
+        if worker_id is None or self.relay is None:
+            super().datagram_received(data, addr)
+        else:
+            self.forwarded += 1
+            self.relay.send(worker_id, data, addr)
+
+    def relayed_datagram_received(self, data: bytes, addr: Tuple) -> None:
+        """Handle a datagram relayed by another worker."""
+        # never relayed again, even if no worker knows the connection
+        self.relayed += 1
+        super().datagram_received(data, addr)
+
+    def _owner(self, data: bytes) -> Optional[int]:
+        """Return the worker to relay `data` to, or None to handle it here."""
+        cid_length = self._configuration.connection_id_length
+        if not data:
+            return None
+        if data[0] & 0x80:
+            try:
+                header = pull_quic_header(Buffer(data=data), cid_length)
+            except ValueError:
+                return None
+            if (
+                header.version not in self._configuration.supported_versions
+                or header.packet_type
+                in (QuicPacketType.INITIAL, QuicPacketType.ZERO_RTT)
+            ):
+                return None
+            cid = header.destination_cid
+        else:
+            cid = data[1:1 + cid_length]
+
+        if len(cid) != cid_length or cid in self._protocols:
+            return None
+        worker_id = cid[0]
+        if worker_id == self.worker_id or worker_id >= self.workers:
+            return None
+        return worker_id
+
+
+@dataclass
+class WorkerSettings:
+    """Settings passed to a worker process."""
+    worker_id: int
+    workers: int
+    host: str
+    port: int
+    ipc_dir: str
+    config: HttpxConfig
+    alpn_protocols: List[str]
+    max_message_size: int
+    certfile: str
+    keyfile: str
+    log_level: int
+
+
+class Worker:
+    """Serves HTTP/3 in a worker process, on behalf of the agent process."""
+
+    def __init__(self, settings: WorkerSettings) -> None:
+        """Initialize a `Worker` instance."""
+        self.settings = settings
+        self.config = config = settings.config
+        self.session_tickets = SessionTicketStore(
+            max_entries=config.session_ticket_store_size
+        )
+        self.body_stats = BodyStats()
+        self.admission = create_admission_queue(config)
+        self.server: Optional[ShardedQuicServer] = None
+        self._relay_transport: Optional[asyncio.BaseTransport] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._requests: Dict[int, asyncio.Future] = {}
+        self._next_request_id = 1
+
+    async def run(self) -> None:
+        """Connect to the agent process and serve until it goes away."""
+        settings = self.settings
+        reader, self._writer = await asyncio.open_unix_connection(
+            _main_path(settings.ipc_dir)
+        )
+        try:
+            await self.serve()
+        except OSError as exc:
+            self.notify(
+                {"kind": "error", "worker": settings.worker_id, "error": str(exc)}
+            )
+            await self._writer.drain()
+            return
+        self.notify({"kind": "ready", "worker": settings.worker_id})
+
+        try:
+            await self.receive(reader)
+        finally:
+            for future in self._requests.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Agent process is gone"))
+            self.server.close()
+            self._relay_transport.close()
+            LOGGER.debug(
+                "Worker %d: forwarded %d, relayed %d datagrams, body stats %s%s",
+                settings.worker_id,
+                self.server.forwarded,
+                self.server.relayed,
+                self.body_stats.as_dict(),
+                f", admission stats {self.admission.stats.as_dict()}"
+                if self.admission is not None
+                else "",
+            )
+
+    async def serve(self) -> None:
+        """Serve the transport's port with the other workers."""
+        settings = self.settings
+        configuration = create_quic_configuration(
+            self.config, alpn_protocols=settings.alpn_protocols, is_client=False
+        )
+        configuration.load_cert_chain(settings.certfile, settings.keyfile)
+
+        def create_server() -> ShardedQuicServer:
+            return ShardedQuicServer(
+                worker_id=settings.worker_id,
+                workers=settings.workers,
+                configuration=configuration,
+                create_protocol=self.create_protocol,
+                session_ticket_fetcher=self.fetch_ticket,
+                session_ticket_handler=self.add_ticket,
+            )
+
+        loop = asyncio.get_event_loop()
+        transport, self.server = await (
+            udp.create_datagram_endpoint
+            if self.config.udp_offload
+            else loop.create_datagram_endpoint
+        )(create_server, local_addr=(settings.host, settings.port), reuse_port=True)
+        if self.config.path_mtu_discovery:
+            udp.set_dont_fragment(transport.get_extra_info("socket"))
+
+        self._relay_transport, self.server.relay = await loop.create_datagram_endpoint(
+            lambda: DatagramRelay(
+                settings.ipc_dir, self.server.relayed_datagram_received
+            ),
+            local_addr=_relay_path(settings.ipc_dir, settings.worker_id),
+            family=socket.AF_UNIX,
+        )
+
+    def create_protocol(self, *args, **kwargs):
+        """Create a server connection with the configured extensions."""
+        config = self.config
+        protocol = Http3ServerProtocol(
+            *args,
+            qpack_max_table_capacity=config.qpack_max_table_capacity,
+            qpack_blocked_streams=config.qpack_blocked_streams,
+            **kwargs,
+        )
+        WorkerConnectionIds(protocol._quic, self.settings.worker_id)
+        if config.max_datagram_frame_size:
+            protocol.set_datagram_handler(self.datagram_received)
+        autotune_receive_windows(config, protocol._quic)
+        discover_path_mtu(config, protocol._quic)
+        reduce_ack_frequency(config, protocol._quic)
+        validate_migrated_paths(config, protocol._quic)
+        protocol.stream_scheduler = prioritize_streams(config, protocol._quic)
+        protocol.max_message_size = self.settings.max_message_size
+        protocol.max_preallocated_size = config.max_preallocated_size
+        protocol.body_stats = self.body_stats
+        protocol.admission = self.admission
+        limit_stream_credit(
+            config,
+            protocol._quic,
+            self.admission,
+            in_progress=lambda: protocol.active_handlers,
+            wake=protocol.transmit,
+        )
+        if config.direct_message_path:
+            protocol.set_message_handler(self.message_handler)
+        protocol.set_app(self.app)
+        return protocol
+
+    async def receive(self, reader: asyncio.StreamReader) -> None:
+        """Receive responses and tickets from the agent process."""
+        while True:
+            try:
+                request_id, meta, body = await read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            kind = meta["kind"]
+            if kind == "response":
+                future = self._requests.get(request_id)
+                if future is not None and not future.done():
+                    future.set_result((meta, body))
+            elif kind == "ticket":
+                self.session_tickets.add(ticket_from_json(meta["ticket"]))
+            elif kind == "ticket-used":
+                self.session_tickets.pop(bytes.fromhex(meta["label"]))
+
+    def notify(self, meta: Dict, body: bytes = b"") -> None:
+        """Send a notification to the agent process."""
+        if not self._writer.is_closing():
+            write_frame(self._writer, meta, body)
+
+    async def request(self, meta: Dict, body: bytes) -> Tuple[Dict, bytes]:
+        """Have the agent process handle a request and return its response."""
+        request_id = self._next_request_id
+        self._next_request_id += 1
+        future = asyncio.get_event_loop().create_future()
+        self._requests[request_id] = future
+        try:
+            write_frame(self._writer, meta, body, request_id)
+            await self._writer.drain()
+            return await future
+        finally:
+            del self._requests[request_id]
+
+    async def message_handler(self, body: bytes, scope: Dict) -> DirectResponse:
+        """Have the agent process handle a message."""
+        meta, content = await self.request(
+            {
+                "kind": "message",
+                "scope": {
+                    "authority": scope["authority"],
+                    "client": scope["client"],
+                    "early_data": scope["early_data"],
+                },
+            },
+            body,
+        )
+        return meta["status"], _decode_headers(meta["headers"]), content
+
+    async def app(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        """Forward a request to the agent process as ASGI application."""
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        meta, content = await self.request(
+            {"kind": "request", "scope": _encode_scope(scope)}, body
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": meta["status"],
+                "headers": _decode_headers(meta["headers"]),
+            }
+        )
+        await send({"type": "http.response.body", "body": content})
+
+    def datagram_received(self, data: bytes, client: Tuple) -> None:
+        """Forward a DATAGRAM frame message to the agent process."""
+        self.notify({"kind": "datagram", "client": client}, data)
+
+    def add_ticket(self, ticket: SessionTicket) -> None:
+        """Store a newly issued ticket and share it with the agent process."""
+        self.session_tickets.add(ticket)
+        self.notify({"kind": "ticket", "ticket": ticket_to_json(ticket)})
+
+    def fetch_ticket(self, label: bytes) -> Optional[SessionTicket]:
+        """Take a ticket out of the store, for the agent process as well."""
+        ticket = self.session_tickets.pop(label)
+        if ticket is not None:
+            self.notify({"kind": "ticket-used", "label": label.hex()})
+        return ticket
+
+
+def run_worker(settings: WorkerSettings) -> None:
+    """Entry point of a worker process."""
+    # the agent process stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=settings.log_level)
+    asyncio.run(Worker(settings).run())
+
+
+class WorkerPool:
+    """Runs the inbound HTTP/3 server in `workers` processes.
+
+    Requests the workers pass on are handled by `message_handler` (POST /) or
+    the ASGI application `app`, and DATAGRAM frames by `datagram_handler`.
+    `session_tickets` collects the tickets issued by all workers.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        message_handler: MessageHandler,
+        app: Callable,
+        datagram_handler: Callable[[bytes, Tuple], None],
+        session_tickets: SessionTicketStore,
+    ) -> None:
+        """Initialize a `WorkerPool` instance."""
+        if not 0 < workers <= MAX_WORKERS:
+            raise ValueError(f"Between 1 and {MAX_WORKERS} workers are supported")
+        self.workers = workers
+        self.message_handler = message_handler
+        self.app = app
+        self.datagram_handler = datagram_handler
+        self.session_tickets = session_tickets
+        self._ipc_dir: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._processes: List[multiprocessing.process.BaseProcess] = []
+        self._ready: Dict[int, asyncio.Future] = {}
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._stopping = False
+
+    async def start(
+        self,
+        host: str,
+        port: int,
+        config: HttpxConfig,
+        alpn_protocols: List[str],
+        max_message_size: int,
+        certfile: str,
+        keyfile: str,
+    ) -> None:
+        """Start the workers and wait until all of them are serving.
+
+        Raises:
+            OSError: if a worker cannot bind the port or does not start
+
+        """
+        loop = asyncio.get_event_loop()
+        self._ipc_dir = tempfile.mkdtemp(prefix="http3-workers-")
+        self._server = await asyncio.start_unix_server(
+            self._worker_connected, path=_main_path(self._ipc_dir)
+        )
+        self._ready = {
+            worker_id: loop.create_future() for worker_id in range(self.workers)
+        }
+
+        context = multiprocessing.get_context("spawn")
+        for worker_id in range(self.workers):
+            settings = WorkerSettings(
+                worker_id=worker_id,
+                workers=self.workers,
+                host=host,
+                port=port,
+                ipc_dir=self._ipc_dir,
+                config=config,
+                alpn_protocols=alpn_protocols,
+                max_message_size=max_message_size,
+                certfile=os.path.abspath(certfile),
+                keyfile=os.path.abspath(keyfile),
+                log_level=logging.getLogger().getEffectiveLevel(),
+            )
+            process = context.Process(
+                target=run_worker,
+                args=(settings,),
+                name=f"http3-worker-{worker_id}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*self._ready.values()), WORKER_START_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise OSError("HTTP/3 workers did not start in time")
+        except OSError:
+            await self.stop()
+            raise
+        LOGGER.debug("Started %d HTTP/3 workers on port %d", self.workers, port)
+
+    async def stop(self) -> None:
+        """Stop the worker processes."""
+        self._stopping = True
+        # the workers exit once their connection to this process is closed
+        for writer in self._writers.values():
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+
+        loop = asyncio.get_event_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        if self._ipc_dir is not None:
+            shutil.rmtree(self._ipc_dir, ignore_errors=True)
+
+    async def _worker_connected(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            _, meta, _ = await read_frame(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        worker_id = meta["worker"]
+        ready = self._ready[worker_id]
+        if meta["kind"] == "error":
+            ready.set_exception(OSError(f"HTTP/3 worker {worker_id}: {meta['error']}"))
+            writer.close()
+            return
+
+        self._writers[worker_id] = writer
+        for ticket in self.session_tickets:
+            write_frame(writer, {"kind": "ticket", "ticket": ticket_to_json(ticket)})
+        ready.set_result(None)
+
+        tasks = set()
+        try:
+            while True:
+                request_id, meta, body = await read_frame(reader)
+                kind = meta["kind"]
+                if kind in ("message", "request"):
+                    task = asyncio.ensure_future(
+                        self._respond(writer, request_id, meta, body)
+                    )
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif kind == "datagram":
+                    self.datagram_handler(body, tuple(meta["client"]))
+                elif kind == "ticket":
+                    self.session_tickets.add(ticket_from_json(meta["ticket"]))
+                    self._broadcast(worker_id, meta)
+                elif kind == "ticket-used":
+                    self.session_tickets.pop(bytes.fromhex(meta["label"]))
+                    self._broadcast(worker_id, meta)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if not self._stopping:
+                LOGGER.error("HTTP/3 worker %d exited", worker_id)
+        finally:
+            del self._writers[worker_id]
+            writer.close()
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, request_id: int, meta: Dict, body: bytes
+    ) -> None:
+        try:
+            if meta["kind"] == "message":
+                status, headers, content = await self.message_handler(
+                    body, meta["scope"]
+                )
+            else:
+                status, headers, content = await _call_app(
+                    self.app, _decode_scope(meta["scope"]), body
+                )
+        except Exception:
+            LOGGER.exception("Error handling request passed on by HTTP/3 worker")
+            status, headers, content = 500, [], b""
+
+        if writer.is_closing():
+            return
+        write_frame(
+            writer,
+            {"kind": "response", "status": status, "headers": _encode_headers(headers)},
+            content,
+            request_id,
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _broadcast(self, sender: int, meta: Dict) -> None:
+        for worker_id, writer in self._writers.items():
+            if worker_id != sender and not writer.is_closing():
+                write_frame(writer, meta)
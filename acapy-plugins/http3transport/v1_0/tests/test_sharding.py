@@ -0,0 +1,250 @@
+import asyncio
+import os
+import ssl
+
+import pytest
+from aioquic.buffer import Buffer
+from aioquic.h3.connection import H3_ALPN
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+from aioquic.quic.packet import QuicPacketType, encode_long_header_first_byte
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from ..config import HttpxConfig
+from ..http3_client import Http3Client
+from ..sharding import (
+    DatagramRelay,
+    ShardedQuicServer,
+    WorkerConnectionIds,
+    WorkerPool,
+    _call_app,
+    _decode_scope,
+    _encode_scope,
+    read_frame,
+    write_frame,
+)
+from ..tickets import SessionTicketStore
+
+CERTS = os.path.join(os.path.dirname(__file__), *[os.pardir] * 4, "certs")
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+def make_scope():
+    return {
+        "client": ("10.0.0.1", 4433),
+        "early_data": False,
+        "headers": [(b"content-type", b"application/json"), (b"x-a", b"\xe9")],
+        "http_version": "3",
+        "method": "POST",
+        "path": "/",
+        "query_string": b"c_i=abc",
+        "raw_path": b"/",
+        "root_path": "",
+        "scheme": "https",
+        "type": "http",
+    }
+
+
+async def feed(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def test_frame_round_trip():
+    writer = FakeWriter()
+    write_frame(writer, {"kind": "request"}, b"body", request_id=7)
+    write_frame(writer, {"kind": "ready", "worker": 1})
+    reader = await feed(writer.data)
+
+    assert await read_frame(reader) == (7, {"kind": "request"}, b"body")
+    assert await read_frame(reader) == (0, {"kind": "ready", "worker": 1}, b"")
+    with pytest.raises(asyncio.IncompleteReadError):
+        await read_frame(reader)
+
+
+async def test_truncated_frame():
+    writer = FakeWriter()
+    write_frame(writer, {"kind": "request"}, b"body", request_id=1)
+    reader = await feed(writer.data[:-1])
+
+    with pytest.raises(asyncio.IncompleteReadError):
+        await read_frame(reader)
+
+
+def test_scope_round_trip():
+    scope = make_scope()
+    decoded = _decode_scope(_encode_scope(scope))
+
+    assert decoded == dict(scope, extensions={})
+
+
+async def test_call_app():
+    async def echo(request):
+        body = await request.body()
+        return Response(body[::-1], status_code=201, headers={"x-b": "1"})
+
+    app = Starlette(routes=[Route("/", echo, methods=["POST"])])
+    status, headers, body = await _call_app(app, make_scope(), b"hello")
+
+    assert status == 201
+    assert (b"x-b", b"1") in headers
+    assert body == b"olleh"
+
+
+async def test_call_app_error():
+    async def fail(request):
+        raise RuntimeError()
+
+    app = Starlette(routes=[Route("/", fail, methods=["POST"])])
+    with pytest.raises(RuntimeError):
+        await _call_app(app, make_scope(), b"")
+
+
+def test_worker_connection_ids():
+    quic = QuicConnection(configuration=QuicConfiguration(is_client=True))
+    WorkerConnectionIds(quic, 5)
+    quic._remote_active_connection_id_limit = 4
+    quic._replenish_connection_ids()
+
+    assert len(quic._host_cids) == 4
+    assert all(cid.cid[0] == 5 for cid in quic._host_cids)
+    assert quic.host_cid[0] == 5
+
+
+def make_server(worker_id=0, workers=4):
+    configuration = QuicConfiguration(is_client=False)
+    return ShardedQuicServer(
+        worker_id=worker_id,
+        workers=workers,
+        configuration=configuration,
+        create_protocol=None,
+    )
+
+
+def long_header(packet_type, cid):
+    buf = Buffer(capacity=64)
+    buf.push_uint8(encode_long_header_first_byte(1, packet_type, 0))
+    buf.push_uint32(1)
+    buf.push_uint8(len(cid))
+    buf.push_bytes(cid)
+    buf.push_uint8(8)
+    buf.push_bytes(bytes(8))
+    if packet_type == QuicPacketType.INITIAL:
+        buf.push_uint_var(0)
+    buf.push_uint_var(1)
+    buf.push_bytes(bytes(1))
+    return buf.data
+
+
+async def test_owner_short_header():
+    server = make_server()
+
+    assert server._owner(b"\x40" + bytes([2]) + bytes(7) + b"payload") == 2
+    # issued by this worker, or by no worker at all
+    assert server._owner(b"\x40" + bytes([0]) + bytes(7)) is None
+    assert server._owner(b"\x40" + bytes([9]) + bytes(7)) is None
+    # too short to hold a connection ID
+    assert server._owner(b"\x40\x02") is None
+    assert server._owner(b"") is None
+
+
+async def test_owner_long_header():
+    server = make_server()
+    cid = bytes([3]) + bytes(7)
+
+    assert server._owner(long_header(QuicPacketType.HANDSHAKE, cid)) == 3
+    assert server._owner(long_header(QuicPacketType.INITIAL, cid)) is None
+    assert server._owner(long_header(QuicPacketType.ZERO_RTT, cid)) is None
+    assert server._owner(b"\xc0\x00") is None
+
+
+async def test_owner_known_connection():
+    server = make_server()
+    cid = bytes([3]) + bytes(7)
+    server._protocols[cid] = object()
+
+    assert server._owner(b"\x40" + cid) is None
+
+
+def test_relay_round_trip():
+    delivered = []
+    sender = DatagramRelay("/tmp/ipc", lambda data, addr: None)
+    receiver = DatagramRelay("/tmp/ipc", lambda data, addr: delivered.append((data, addr)))
+    transport = FakeTransport()
+    sender.connection_made(transport)
+
+    sender.send(2, b"\x40packet", ("10.0.0.1", 4433))
+    data, path = transport.sent[0]
+    receiver.datagram_received(data, None)
+
+    assert path == "/tmp/ipc/worker-2.sock"
+    assert delivered == [(b"\x40packet", ("10.0.0.1", 4433))]
+
+
+def test_pool_worker_count():
+    for workers in (0, 257):
+        with pytest.raises(ValueError):
+            WorkerPool(workers, None, None, None, SessionTicketStore())
+
+
+async def test_pool():
+    async def handler(message, scope):
+        return 200, [], message[::-1]
+
+    pool = WorkerPool(2, handler, None, None, SessionTicketStore())
+    config = HttpxConfig.default()
+    config.direct_message_path = True
+    await pool.start(
+        "127.0.0.1",
+        4999,
+        config,
+        alpn_protocols=H3_ALPN,
+        max_message_size=0,
+        certfile=os.path.join(CERTS, "ssl.crt"),
+        keyfile=os.path.join(CERTS, "ssl.key"),
+    )
+    try:
+        configuration = QuicConfiguration(
+            is_client=True, alpn_protocols=H3_ALPN, verify_mode=ssl.CERT_NONE
+        )
+        loop = asyncio.get_event_loop()
+        _, client = await loop.create_datagram_endpoint(
+            lambda: Http3Client(QuicConnection(configuration=configuration)),
+            local_addr=("127.0.0.1", 0),
+        )
+        client.connect(("127.0.0.1", 4999))
+        await asyncio.wait_for(client.wait_connected(), 5)
+        body, headers = await asyncio.wait_for(
+            client.send_http_request(
+                "https://127.0.0.1:4999/",
+                "POST",
+                b"hello",
+                {"content-type": "application/didcomm-envelope-enc"},
+            ),
+            5,
+        )
+        client.close()
+
+        assert headers[":status"] == "200"
+        assert bytes(body) == b"olleh"
+    finally:
+        await pool.stop()
@@ -0,0 +1,231 @@
+"""TLS session ticket storage for QUIC session resumption."""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+from aioquic.tls import CipherSuite, SessionTicket
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SessionTicketCache:
+    """Client-side cache of session tickets, keyed by server name.
+
+    A ticket is handed out at most once, so every resumed connection uses the
+    fresh ticket issued by the server on the previous connection. Entries expire
+    after `ttl` seconds or when the ticket itself expires, whichever comes first,
+    and the least recently stored entry is evicted beyond `max_entries`.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 256) -> None:
+        """Initialize a `SessionTicketCache` instance."""
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._tickets: OrderedDict[str, Tuple[SessionTicket, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of cached tickets."""
+        return len(self._tickets)
+
+    def add(self, ticket: SessionTicket) -> None:
+        """Store a ticket received from a server (session_ticket_handler)."""
+        if not ticket.server_name:
+            return
+        self._tickets.pop(ticket.server_name, None)
+        self._tickets[ticket.server_name] = (ticket, time.monotonic() + self.ttl)
+        while len(self._tickets) > self.max_entries:
+            self._tickets.popitem(last=False)
+
+    def take(self, server_name: str) -> Optional[SessionTicket]:
+        """Remove and return a usable ticket for `server_name`, if any."""
+        entry = self._tickets.pop(server_name, None)
+        if entry is None:
+            return None
+        ticket, expires_at = entry
+        if time.monotonic() >= expires_at or not ticket.is_valid:
+            LOGGER.debug("Discarding expired session ticket for %s", server_name)
+            return None
+        return ticket
+
+
+class SessionTicketStore:
+    """Server-side store of issued session tickets, keyed by ticket ID.
+
+    Tickets are single-use: fetching a ticket removes it, so a replayed
+    ClientHello cannot resume the session or have its early data accepted.
+    The store keeps at most `max_entries` tickets and can optionally be saved
+    to and loaded from `path` so clients can resume across restarts.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None) -> None:
+        """Initialize a `SessionTicketStore` instance."""
+        self.max_entries = max_entries
+        self.path = path
+        self._tickets: OrderedDict[bytes, SessionTicket] = OrderedDict()
+        # IDs of the tickets in the file at `path`
+        self._persisted: Set[bytes] = set()
+        # rewrite of the file in progress, and whether it must be rewritten again
+        self._flush: Optional[asyncio.Future] = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        """Return the number of stored tickets."""
+        return len(self._tickets)
+
+    def __iter__(self) -> Iterator[SessionTicket]:
+        """Iterate over the stored tickets."""
+        return iter(list(self._tickets.values()))
+
+    def add(self, ticket: SessionTicket) -> None:
+        """Store a newly issued ticket (session_ticket_handler)."""
+        self._tickets[ticket.ticket] = ticket
+        while len(self._tickets) > self.max_entries:
+            self._tickets.popitem(last=False)
+
+    def pop(self, label: bytes) -> Optional[SessionTicket]:
+        """Remove and return the ticket with ID `label` (session_ticket_fetcher)."""
+        ticket = self._tickets.pop(label, None)
+        if label in self._persisted:
+            # tickets are single-use: if we crash before the next save, this
+            # ticket must not be loaded again, rewrite the file in the background
+            self._persisted.discard(label)
+            self._dirty = True
+            if self._flush is None:
+                self._flush = asyncio.ensure_future(self._write_persisted())
+        if ticket is not None and not ticket.is_valid:
+            return None
+        return ticket
+
+    def load(self) -> None:
+        """Read the tickets stored in the ticket file."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as fp:
+                entries = json.load(fp)
+            for entry in entries:
+                ticket = ticket_from_json(entry)
+                if ticket.is_valid:
+                    self.add(ticket)
+        except (OSError, ValueError, KeyError, TypeError):
+            LOGGER.warning("Unable to load session tickets from %s", self.path)
+            return
+        self._persisted = set(self._tickets)
+        LOGGER.debug("Loaded %d session tickets from %s", len(self), self.path)
+
+    async def flush(self) -> None:
+        """Wait until tickets used so far are removed from the ticket file."""
+        if self._flush is not None:
+            await asyncio.shield(self._flush)
+
+    def save(self) -> None:
+        """Write all tickets to the ticket file."""
+        if self._write(self._tickets.values()):
+            self._persisted = set(self._tickets)
+
+    async def _write_persisted(self) -> None:
+        """Rewrite the ticket file without the used tickets, off the event loop."""
+        loop = asyncio.get_event_loop()
+        try:
+            # tickets used while a write is in progress are removed by one more
+            while self._dirty:
+                self._dirty = False
+                tickets = [
+                    ticket for key, ticket in self._tickets.items()
+                    if key in self._persisted
+                ]
+                await loop.run_in_executor(None, self._write, tickets)
+        finally:
+            self._flush = None
+
+    def _write(self, tickets: Iterable[SessionTicket]) -> bool:
+        """Replace the file at `path` with `tickets`, readable by us only."""
+        if not self.path:
+            return False
+        entries = [ticket_to_json(ticket) for ticket in tickets if ticket.is_valid]
+        # the file holds resumption secrets, and a crash while writing must not
+        # leave a truncated file behind
+        tmp_path = f"{self.path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as fp:
+                json.dump(entries, fp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            LOGGER.warning("Unable to save session tickets to %s", self.path)
+            return False
+        return True
+
+
+class EarlyDataReplayCache:
+    """Remembers 0-RTT requests so that each one is accepted at most once.
+
+    Requests are identified by a digest of their body, which for packed
+    DIDComm messages is unique per message. When the cache is full of
+    unexpired entries, further early data is refused rather than risking
+    forgetting a request that might still be replayed.
+    """
+
+    def __init__(self, window: float = 600.0, max_entries: int = 4096) -> None:
+        """Initialize an `EarlyDataReplayCache` instance."""
+        self.window = window
+        self.max_entries = max_entries
+        self._seen: OrderedDict[bytes, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of remembered early data messages."""
+        return len(self._seen)
+
+    def check(self, data: bytes) -> bool:
+        """Record `data` and return whether it has not been seen before."""
+        now = time.monotonic()
+        while self._seen and next(iter(self._seen.values())) <= now:
+            self._seen.popitem(last=False)
+
+        digest = hashlib.sha256(data).digest()
+        if digest in self._seen or len(self._seen) >= self.max_entries:
+            return False
+        self._seen[digest] = now + self.window
+        return True
+
+
+def ticket_to_json(ticket: SessionTicket) -> dict:
+    """Serialize `ticket` to a JSON compatible dict."""
+    return {
+        "age_add": ticket.age_add,
+        "cipher_suite": int(ticket.cipher_suite),
+        "not_valid_after": ticket.not_valid_after.isoformat(),
+        "not_valid_before": ticket.not_valid_before.isoformat(),
+        "resumption_secret": ticket.resumption_secret.hex(),
+        "server_name": ticket.server_name,
+        "ticket": ticket.ticket.hex(),
+        "max_early_data_size": ticket.max_early_data_size,
+        "other_extensions": [
+            [ext_type, ext_data.hex()] for ext_type, ext_data in ticket.other_extensions
+        ],
+    }
+
+
+def ticket_from_json(entry: dict) -> SessionTicket:
+    """Deserialize a ticket serialized by `ticket_to_json`."""
+    return SessionTicket(
+        age_add=entry["age_add"],
+        cipher_suite=CipherSuite(entry["cipher_suite"]),
+        not_valid_after=datetime.datetime.fromisoformat(entry["not_valid_after"]),
+        not_valid_before=datetime.datetime.fromisoformat(entry["not_valid_before"]),
+        resumption_secret=bytes.fromhex(entry["resumption_secret"]),
+        server_name=entry["server_name"],
+        ticket=bytes.fromhex(entry["ticket"]),
+        max_early_data_size=entry["max_early_data_size"],
+        other_extensions=[
+            (ext_type, bytes.fromhex(ext_data))
+            for ext_type, ext_data in entry["other_extensions"]
+        ],
+    )
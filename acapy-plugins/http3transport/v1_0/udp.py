@@ -0,0 +1,325 @@
+"""UDP datagram transport using Linux segmentation offload.
+
+asyncio's datagram transport performs one sendto/recvfrom system call per QUIC
+packet. On Linux, UDP generic segmentation offload (UDP_SEGMENT) lets a single
+sendmsg carry a train of equally sized packets to one peer, and generic receive
+offload (UDP_GRO) lets a single recvmsg return several coalesced packets. Python
+does not expose sendmmsg/recvmmsg, so batching is further achieved by draining
+the socket on each wakeup and by handing all packets of a transmit pass to the
+transport at once. Where the kernel does not support offload the transport falls
+back to plain sendto/recvfrom.
+"""
+
+import asyncio
+import errno
+import logging
+import socket
+import struct
+from collections import deque
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from aioquic.asyncio.server import QuicServer
+
+LOGGER = logging.getLogger(__name__)
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)
+
+# set DF and never fragment, regardless of the kernel's path MTU cache
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IPV6_MTU_DISCOVER = getattr(socket, "IPV6_MTU_DISCOVER", 23)
+IP_PMTUDISC_PROBE = 3
+
+# kernel limits for a single GSO send
+MAX_SEGMENTS = 64
+MAX_GSO_PAYLOAD = 65000
+
+MAX_DATAGRAM_SIZE = 65535
+# datagrams read per event loop wakeup
+MAX_READ_BATCH = 64
+
+
+def set_dont_fragment(sock: socket.socket) -> None:
+    """Send datagrams from `sock` unfragmented, as path MTU probes rely on."""
+    try:
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+        elif sock.family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, IPV6_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+    except OSError as exc:
+        LOGGER.debug("Unable to disable fragmentation: %s", exc)
+
+
+def probe_offload(sock: socket.socket) -> Tuple[bool, bool]:
+    """Enable GRO on `sock` and return which of GSO and GRO are available."""
+    if sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return False, False
+    try:
+        sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+        gso = True
+    except OSError:
+        gso = False
+    try:
+        sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+        gro = True
+    except OSError:
+        gro = False
+    return gso, gro
+
+
+class OffloadDatagramTransport(asyncio.DatagramTransport):
+    """Datagram transport with batched sends and offloaded segmentation."""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        sock: socket.socket,
+        protocol: asyncio.DatagramProtocol,
+        gso: bool,
+        gro: bool,
+    ) -> None:
+        """Initialize an `OffloadDatagramTransport` instance."""
+        super().__init__(extra={"socket": sock, "sockname": sock.getsockname()})
+        self._loop = loop
+        self._sock = sock
+        self._protocol = protocol
+        self._gso = gso
+        self._gro = gro
+        self._buffer: Deque[Tuple[bytes, Any, int]] = deque()
+        self._closing = False
+        self._cmsg_size = socket.CMSG_SPACE(struct.calcsize("i"))
+        self.sendmsg_calls = 0
+        self.datagrams_sent = 0
+
+        self._protocol.connection_made(self)
+        self._loop.add_reader(self._sock.fileno(), self._read_ready)
+
+    @property
+    def gso(self) -> bool:
+        """Whether segmentation offload is used for sending."""
+        return self._gso
+
+    @property
+    def gro(self) -> bool:
+        """Whether receive offload is used."""
+        return self._gro
+
+    def is_closing(self) -> bool:
+        """Whether the transport is closing or closed."""
+        return self._closing
+
+    def close(self) -> None:
+        """Close the transport once pending datagrams are sent."""
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._sock.fileno())
+        if not self._buffer:
+            self._loop.call_soon(self._call_connection_lost, None)
+
+    def abort(self) -> None:
+        """Close the transport, dropping pending datagrams."""
+        self._buffer.clear()
+        self._loop.remove_writer(self._sock.fileno())
+        self.close()
+
+    def get_write_buffer_size(self) -> int:
+        """Return the size of the datagrams waiting to be sent."""
+        return sum(len(data) for data, _, _ in self._buffer)
+
+    def sendto(self, data, addr=None) -> None:
+        """Send a single datagram."""
+        self._send(bytes(data), addr, 0)
+
+    def send_batch(self, datagrams: List[bytes], addr) -> None:
+        """Send several datagrams to one peer using as few system calls as possible."""
+        if not self._gso or len(datagrams) == 1:
+            for data in datagrams:
+                self._send(data, addr, 0)
+            return
+
+        # a GSO train consists of equally sized segments, only the last one
+        # may be shorter
+        train: List[bytes] = []
+        for data in datagrams:
+            if train and (
+                len(data) > len(train[0])
+                or len(train[-1]) < len(train[0])
+                or len(train) >= MAX_SEGMENTS
+                or (len(train) + 1) * len(train[0]) > MAX_GSO_PAYLOAD
+            ):
+                self._send_train(train, addr)
+                train = []
+            train.append(data)
+        if train:
+            self._send_train(train, addr)
+
+    def _send_train(self, train: List[bytes], addr) -> None:
+        if len(train) == 1:
+            self._send(train[0], addr, 0)
+        else:
+            self._send(b"".join(train), addr, len(train[0]))
+
+    def _send(self, data: bytes, addr, segment_size: int) -> None:
+        if self._closing:
+            return
+        if not self._buffer:
+            try:
+                self._sendmsg(data, addr, segment_size)
+                return
+            except (BlockingIOError, InterruptedError):
+                self._loop.add_writer(self._sock.fileno(), self._write_ready)
+            except OSError as exc:
+                self._handle_send_error(exc, data, addr, segment_size)
+                return
+        self._buffer.append((data, addr, segment_size))
+
+    def _sendmsg(self, data: bytes, addr, segment_size: int) -> None:
+        self.sendmsg_calls += 1
+        if segment_size:
+            self._sock.sendmsg(
+                [data], [(SOL_UDP, UDP_SEGMENT, struct.pack("H", segment_size))], 0, addr
+            )
+            self.datagrams_sent += -(-len(data) // segment_size)
+        else:
+            self._sock.sendto(data, addr)
+            self.datagrams_sent += 1
+
+    def _handle_send_error(self, exc: OSError, data: bytes, addr, segment_size) -> None:
+        if segment_size and exc.errno in (errno.EIO, errno.EINVAL, errno.ENOPROTOOPT):
+            # the route or device cannot segment, fall back for good
+            LOGGER.info("UDP segmentation offload unavailable (%s), disabling", exc)
+            self._gso = False
+            for offset in range(0, len(data), segment_size):
+                self._send(data[offset:offset + segment_size], addr, 0)
+        else:
+            self._protocol.error_received(exc)
+
+    def _write_ready(self) -> None:
+        while self._buffer:
+            data, addr, segment_size = self._buffer[0]
+            try:
+                self._sendmsg(data, addr, segment_size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                self._buffer.popleft()
+                self._handle_send_error(exc, data, addr, segment_size)
+                continue
+            self._buffer.popleft()
+
+        self._loop.remove_writer(self._sock.fileno())
+        if self._closing:
+            self._call_connection_lost(None)
+
+    def _read_ready(self) -> None:
+        for _ in range(MAX_READ_BATCH):
+            try:
+                if self._gro:
+                    data, ancdata, _, addr = self._sock.recvmsg(
+                        MAX_DATAGRAM_SIZE, self._cmsg_size
+                    )
+                else:
+                    data, addr = self._sock.recvfrom(MAX_DATAGRAM_SIZE)
+                    ancdata = []
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                self._protocol.error_received(exc)
+                return
+
+            segment_size = len(data)
+            for level, kind, value in ancdata:
+                if level == SOL_UDP and kind == UDP_GRO:
+                    (segment_size,) = struct.unpack(
+                        "i" if len(value) >= 4 else "H", value
+                    )
+
+            if segment_size >= len(data):
+                self._protocol.datagram_received(data, addr)
+            else:
+                view = memoryview(data)
+                for offset in range(0, len(data), segment_size):
+                    self._protocol.datagram_received(
+                        bytes(view[offset:offset + segment_size]), addr
+                    )
+            if self._closing:
+                return
+
+    def _call_connection_lost(self, exc: Optional[Exception]) -> None:
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._sock.close()
+
+
+async def create_datagram_endpoint(
+    protocol_factory: Callable[[], asyncio.DatagramProtocol],
+    *,
+    local_addr: Optional[Tuple] = None,
+    family: int = socket.AF_UNSPEC,
+    sock: Optional[socket.socket] = None,
+    reuse_port: bool = False,
+) -> Tuple[asyncio.DatagramTransport, asyncio.DatagramProtocol]:
+    """Like loop.create_datagram_endpoint, using offload where available."""
+    loop = asyncio.get_event_loop()
+    if sock is None:
+        if family == socket.AF_UNSPEC:
+            infos = await loop.getaddrinfo(*local_addr, type=socket.SOCK_DGRAM)
+            family, _, _, _, local_addr = infos[0]
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(local_addr)
+        except OSError:
+            sock.close()
+            raise
+    sock.setblocking(False)
+
+    gso, gro = probe_offload(sock)
+    LOGGER.debug("UDP offload for %s: gso=%s gro=%s", sock.getsockname(), gso, gro)
+    protocol = protocol_factory()
+    transport = OffloadDatagramTransport(loop, sock, protocol, gso, gro)
+    return transport, protocol
+
+
+class BatchedTransmitMixin:
+    """Hands all datagrams of a transmit pass to the transport at once.
+
+    Mixed into QuicConnectionProtocol subclasses, replacing its transmit().
+    """
+
+    def transmit(self) -> None:
+        """Send pending datagrams and arm the timer."""
+        self._transmit_task = None
+
+        # send datagrams, grouped per destination
+        send_batch = getattr(self._transport, "send_batch", None)
+        datagrams = self._quic.datagrams_to_send(now=self._loop.time())
+        if send_batch is not None:
+            for addr, group in groupby(datagrams, key=itemgetter(1)):
+                send_batch([data for data, _ in group], addr)
+        else:
+            for data, addr in datagrams:
+                self._transport.sendto(data, addr)
+
+        # re-arm timer
+        timer_at = self._quic.get_timer()
+        if self._timer is not None and self._timer_at != timer_at:
+            self._timer.cancel()
+            self._timer = None
+        if self._timer is None and timer_at is not None:
+            self._timer = self._loop.call_at(timer_at, self._handle_timer)
+        self._timer_at = timer_at
+
+
+async def serve(host: str, port: int, **kwargs) -> QuicServer:
+    """Like aioquic.asyncio.serve, using offload where available."""
+    _, protocol = await create_datagram_endpoint(
+        lambda: QuicServer(**kwargs), local_addr=(host, port)
+    )
+    return protocol
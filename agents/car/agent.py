@@ -15,15 +15,18 @@ class Agent(WebhookAgentBase):
             self,
             ident: str,
             ledger_url: str,
-            transport_type: str, # must be in ["http", "https", "http3"]
+            transport_type: str, # must be in ["http", "https", "http3", "quic"]
             external_host: str = "localhost",
             http_port: int = 8020,
             receive_invitations: bool = False,
             force_close: bool = False,
             keepalive_timeout=None,
-            ledger_keepalive=None
+            ledger_keepalive=None,
+            congestion_control=None,
+            ack_frequency=True,
+            transport_features=None
     ):
-        super().__init__(ident, http_port, transport_type, external_host=external_host, ledger_url=ledger_url, seed=ident.zfill(32), force_close=force_close, keepalive_timeout=keepalive_timeout, ledger_keepalive=ledger_keepalive)
+        super().__init__(ident, http_port, transport_type, external_host=external_host, ledger_url=ledger_url, seed=ident.zfill(32), force_close=force_close, keepalive_timeout=keepalive_timeout, ledger_keepalive=ledger_keepalive, congestion_control=congestion_control, ack_frequency=ack_frequency, transport_features=transport_features)
         self.receive_invitations = receive_invitations
 
     async def initialize(self):
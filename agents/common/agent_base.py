@@ -39,12 +39,17 @@ async def fetch_genesis_txns(genesis_url):
         LOGGER.exception("Error loading genesis transactions:")
     return genesis
 
+INBOUND_TRANSPORTS = {
+    "http3": "acapy-plugins.http3transport.v1_0.inbound",
+    "quic": "acapy-plugins.http3transport.v1_0.quic_inbound",
+}
+
 class AgentBase:
     def __init__(
             self,
             ident: str,
             http_port: int,
-            transport_type: str, # must be in ["http", "https", "http3"]
+            transport_type: str, # must be in ["http", "https", "http3", "quic"]
             internal_host: str = "127.0.0.1",
             external_host: str = "localhost",
             ledger_url: str = None,
@@ -53,7 +58,11 @@ class AgentBase:
             extra_args=None,
             force_close: bool = False,
             keepalive_timeout=None,
-            ledger_keepalive=None
+            ledger_keepalive=None,
+            congestion_control=None,
+            ack_frequency=True,
+            inbound_workers=None,
+            transport_features=None
     ):
         self.ident = ident
         self.http_port = http_port
@@ -77,6 +86,10 @@ class AgentBase:
         self.force_close = force_close
         self.keepalive_timeout = keepalive_timeout
         self.ledger_keepalive = ledger_keepalive
+        self.congestion_control = congestion_control
+        self.ack_frequency = ack_frequency
+        self.inbound_workers = inbound_workers
+        self.transport_features = transport_features or []
 
         self.admin_url = f"http://{self.internal_host}:{self.admin_port}"
         self.endpoint = f"{self.transport_type}://{self.external_host}:{self.http_port}"
@@ -327,11 +340,17 @@ class AgentBase:
             ("--endpoint", self.endpoint),
             ("--label", self.ident),
             "--auto-respond-messages",
-            ("--inbound-transport", "acapy-plugins.http3transport.v1_0.inbound" if self.transport_type == "http3" else "acapy-plugins.httpstransport.v1_0.inbound", "0.0.0.0", str(self.http_port)),
-            ("--outbound-transport", "acapy-plugins.http3transport.v1_0.outbound") if self.transport_type == "http3" else (),
+            ("--inbound-transport", INBOUND_TRANSPORTS.get(self.transport_type, "acapy-plugins.httpstransport.v1_0.inbound"), "0.0.0.0", str(self.http_port)),
+            ("--outbound-transport", "acapy-plugins.http3transport.v1_0.outbound") if self.transport_type in ("http3", "quic") else (),
+            ("--outbound-transport", "acapy-plugins.http3transport.v1_0.quic_outbound") if self.transport_type == "quic" else (),
             ("--outbound-transport", "acapy-plugins.httpstransport.v1_0.outbound"), # always required for webhooks
             ("--plugin-config-value", "httpxtransport.force_close=true") if self.force_close is True else (),
             ("--plugin-config-value", "httpxtransport.keepalive_timeout=" + str(self.keepalive_timeout)) if self.keepalive_timeout is not None else (),
+            ("--plugin-config-value", "httpxtransport.ping_interval=" + str(self.keepalive_timeout / 2)) if self.keepalive_timeout is not None else (),
+            ("--plugin-config-value", "httpxtransport.congestion_control=" + self.congestion_control) if self.congestion_control is not None else (),
+            ("--plugin-config-value", "httpxtransport.ack_frequency=" + ("true" if self.ack_frequency else "false")),
+            *(("--plugin-config-value", f"httpxtransport.{feature}=true") for feature in self.transport_features),
+            ("--plugin-config-value", "httpxtransport.inbound_workers=" + str(self.inbound_workers)) if self.inbound_workers is not None else (),
             ("--ledger-keepalive", str(self.ledger_keepalive)) if self.ledger_keepalive is not None else (),
             ("--admin", "0.0.0.0", str(self.admin_port)),
             "--admin-insecure-mode",
@@ -0,0 +1,31 @@
+"""Command line flags for the optional features of the HTTP/3 and QUIC transports.
+
+Every feature is off unless its flag is given, so that runs without flags
+measure the plain transports and features can be compared one at a time.
+"""
+
+# plugin configuration key and help text of each feature
+TRANSPORT_FEATURES = {
+    "receive_window_autotuning": "Grow QUIC receive windows with the measured bandwidth-delay product",
+    "path_mtu_discovery": "Discover the path MTU with probe packets",
+    "connection_migration": "Move outbound connections to a new local address when it changes",
+    "stream_priorities": "Schedule QUIC streams by message priority",
+    "transmit_coalescing": "Send messages queued back to back in shared packets",
+    "direct_message_path": "Hand inbound HTTP/3 messages to ACA-Py without the ASGI application",
+    "admission_control": "Limit the inbound requests handled and queued at a time",
+    "duplex": "Send messages back over connections the peer opened",
+    "udp_offload": "Send and receive UDP datagrams in batches with GSO and GRO",
+}
+
+
+def add_feature_arguments(parser):
+    for feature, help in TRANSPORT_FEATURES.items():
+        parser.add_argument(
+            "--" + feature.replace("_", "-"),
+            action="store_true",
+            help=help,
+        )
+
+
+def enabled_features(args):
+    return [feature for feature in TRANSPORT_FEATURES if getattr(args, feature)]
@@ -23,10 +23,15 @@ class WebhookAgentBase(AgentBase):
             extra_args=None,
             force_close: bool = False,
             keepalive_timeout=None,
-            ledger_keepalive=None
+            ledger_keepalive=None,
+            congestion_control=None,
+            ack_frequency=True,
+            inbound_workers=None,
+            transport_features=None
     ):
         super().__init__(ident, http_port, transport_type, internal_host, external_host, ledger_url, genesis_data, seed,
-                         extra_args, force_close, keepalive_timeout, ledger_keepalive)
+                         extra_args, force_close, keepalive_timeout, ledger_keepalive, congestion_control, ack_frequency,
+                         inbound_workers, transport_features)
 
         self.webhook_port = None
         self.webhook_url = None
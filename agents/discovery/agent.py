@@ -15,12 +15,16 @@ class Agent(WebhookAgentBase):
             self,
             ident: str,
             ledger_url: str,
-            transport_type: str, # must be in ["http", "https", "http3"]
+            transport_type: str, # must be in ["http", "https", "http3", "quic"]
             external_host: str = "localhost",
             http_port: int = 8020,
             broadcast_invitations: bool = False,
+            inbound_workers=None,
+            congestion_control=None,
+            ack_frequency=True,
+            transport_features=None,
     ):
-        super().__init__(ident, http_port, transport_type, external_host=external_host, ledger_url=ledger_url, seed=ident.zfill(32))
+        super().__init__(ident, http_port, transport_type, external_host=external_host, ledger_url=ledger_url, seed=ident.zfill(32), inbound_workers=inbound_workers, congestion_control=congestion_control, ack_frequency=ack_frequency, transport_features=transport_features)
 
         self.broadcast_invitations = broadcast_invitations
 
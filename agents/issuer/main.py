@@ -3,6 +3,7 @@ import asyncio
 import logging
 
 from agents.issuer.app import IssuerApp
+from agents.common.features import add_feature_arguments, enabled_features
 from .agent import Agent
 
 logging.basicConfig(level=logging.DEBUG)
@@ -36,11 +37,29 @@ parser.add_argument(
     "--quic",
     action="store_true"
 )
+parser.add_argument(
+    "--raw-quic",
+    action="store_true",
+    help="Use the raw QUIC transport instead of HTTP/3",
+)
+parser.add_argument(
+    "--congestion-control",
+    choices=["reno", "cubic", "bbr"],
+    help="Congestion control algorithm for HTTP/3 connections",
+)
+parser.add_argument(
+    "--no-ack-frequency",
+    action="store_true",
+    help="Do not negotiate the QUIC ACK frequency extension",
+)
+add_feature_arguments(parser)
 
 
 async def main(args):
-    transport_type = "http3" if args.quic else "https"
-    agent = Agent(args.ident, args.ledger, transport_type, http_port=args.port, external_host=args.ip)
+    transport_type = "quic" if args.raw_quic else "http3" if args.quic else "https"
+    agent = Agent(args.ident, args.ledger, transport_type, http_port=args.port, external_host=args.ip, congestion_control=args.congestion_control,
+                  ack_frequency=not args.no_ack_frequency,
+                  transport_features=enabled_features(args))
     app = IssuerApp(agent)
 
     try:
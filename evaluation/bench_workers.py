@@ -0,0 +1,157 @@
+"""Throughput of the inbound HTTP/3 transport with and without worker processes.
+
+Many clients, spread over several processes, send small messages to a server
+that answers each of them directly. The server is run in the agent process
+(0 workers) and with each of the given numbers of workers. `--work-ms` burns
+CPU time in the agent process for every message, standing in for unpacking and
+handling it, which stays in the agent process in every mode.
+
+Run from the repository root, with ACA-Py installed:
+
+    python evaluation/bench_workers.py --workers 0,1,2,4 --work-ms 0.2
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import ssl
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from aioquic.asyncio import serve
+from aioquic.h3.connection import H3_ALPN
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PLUGIN = "acapy-plugins.http3transport.v1_0"
+config = importlib.import_module(PLUGIN + ".config")
+http3_client = importlib.import_module(PLUGIN + ".http3_client")
+http3_protocol = importlib.import_module(PLUGIN + ".http3_protocol")
+sharding = importlib.import_module(PLUGIN + ".sharding")
+tickets = importlib.import_module(PLUGIN + ".tickets")
+
+CERTFILE = "certs/ssl.crt"
+KEYFILE = "certs/ssl.key"
+HOST = "127.0.0.1"
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=4433)
+parser.add_argument("--workers", default="0,1,2", help="Comma separated worker counts")
+parser.add_argument("--clients", type=int, default=64, help="Number of connections")
+parser.add_argument("--client-processes", type=int, default=2)
+parser.add_argument("--messages", type=int, default=100, help="Messages per client")
+parser.add_argument("--size", type=int, default=500, help="Message size in bytes")
+parser.add_argument("--work-ms", type=float, default=0.0,
+                    help="CPU time spent in the agent process per message")
+
+
+def make_handler(work_ms):
+    async def handler(message, scope):
+        end = time.process_time() + work_ms / 1000
+        while time.process_time() < end:
+            pass
+        return 200, [(b"content-type", b"application/json")], b""
+    return handler
+
+
+async def run_clients(port, clients, messages, size):
+    configuration = QuicConfiguration(
+        is_client=True, alpn_protocols=H3_ALPN, verify_mode=ssl.CERT_NONE,
+        server_name="localhost",
+    )
+    loop = asyncio.get_event_loop()
+    connections = []
+    for _ in range(clients):
+        _, client = await loop.create_datagram_endpoint(
+            lambda: http3_client.Http3Client(QuicConnection(configuration=configuration)),
+            local_addr=(HOST, 0),
+        )
+        client.connect((HOST, port))
+        await client.wait_connected()
+        connections.append(client)
+
+    async def send(client):
+        for _ in range(messages):
+            await client.send_http_request(
+                "https://{}:{}/".format(HOST, port), "POST", b"m" * size,
+                {"content-type": "application/didcomm-envelope-enc"},
+            )
+
+    start = time.time()
+    await asyncio.gather(*(send(client) for client in connections))
+    end = time.time()
+    for client in connections:
+        client.close()
+    return start, end
+
+
+def client_process(port, clients, messages, size):
+    return asyncio.run(run_clients(port, clients, messages, size))
+
+
+async def run_server(workers, args, httpx_config):
+    handler = make_handler(args.work_ms)
+    if workers:
+        pool = sharding.WorkerPool(
+            workers, message_handler=handler, app=None, datagram_handler=None,
+            session_tickets=tickets.SessionTicketStore(),
+        )
+        await pool.start(HOST, args.port, httpx_config, alpn_protocols=H3_ALPN,
+                         max_message_size=0, certfile=CERTFILE, keyfile=KEYFILE)
+        return pool.stop
+
+    configuration = config.create_quic_configuration(
+        httpx_config, alpn_protocols=H3_ALPN, is_client=False
+    )
+    configuration.load_cert_chain(CERTFILE, KEYFILE)
+
+    def create_protocol(*a, **kw):
+        protocol = http3_protocol.Http3ServerProtocol(*a, **kw)
+        protocol.set_message_handler(handler)
+        return protocol
+
+    server = await serve(HOST, args.port, configuration=configuration,
+                         create_protocol=create_protocol)
+
+    async def stop():
+        server.close()
+    return stop
+
+
+async def bench(workers, args):
+    httpx_config = config.HttpxConfig.default()
+    httpx_config.direct_message_path = True
+    stop = await run_server(workers, args, httpx_config)
+    loop = asyncio.get_event_loop()
+    per_process = args.clients // args.client_processes
+    cpu_start = time.process_time()
+    try:
+        with ProcessPoolExecutor(args.client_processes) as executor:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, client_process, args.port,
+                                     per_process, args.messages, args.size)
+                for _ in range(args.client_processes)
+            ))
+    finally:
+        await stop()
+    total = per_process * args.client_processes * args.messages
+    elapsed = max(end for _, end in results) - min(start for start, _ in results)
+    print("{} workers: {} messages in {:.2f}s, {:.0f} messages/s, "
+          "agent process CPU {:.2f}s".format(
+              workers, total, elapsed, total / elapsed,
+              time.process_time() - cpu_start))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    args = parser.parse_args()
+    print("{} CPUs, {} clients in {} processes, {} messages of {} bytes each, "
+          "{} ms of work per message".format(
+              os.cpu_count(), args.clients, args.client_processes, args.messages,
+              args.size, args.work_ms))
+    for workers in map(int, args.workers.split(",")):
+        asyncio.run(bench(workers, args))
@@ -9,7 +9,7 @@ import matplotlib.pyplot as plt
 SAMPLE_SIZE = 100
 
 
-def create_boxplot(path, files):
+def create_boxplot(path, files, action):
     data = {}
 
     for file in files:
@@ -22,7 +22,7 @@ def create_boxplot(path, files):
 
         for line in lines:
             line = line.rstrip()
-            if line.startswith("BM(file):"):
+            if line.startswith("BM({}):".format(action)):
                 if skip:
                     skip = False
                     continue
@@ -40,13 +40,20 @@ def create_boxplot(path, files):
 
 def process(path):
     title = os.path.basename(os.path.normpath(path))
-    plt.figure(title)
-    plt.title("Time to establish connection ({})".format(title))
     print("Processing {}".format(path))
     files = [f for f in listdir(path) if isfile(join(path, f)) and f.endswith(".txt")]
-    create_boxplot(path, files)
+
+    plt.figure(title)
+    plt.title("Time to establish connection ({})".format(title))
+    create_boxplot(path, files, "file")
     plt.savefig(join(path, title))
 
+    # CPU time of the receiving agent, logged next to each retrieval
+    plt.figure(title + "_cpu")
+    plt.title("CPU time per MB of retrieved file ({})".format(title))
+    create_boxplot(path, files, "filecpu")
+    plt.savefig(join(path, title + "_cpu"))
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 2: